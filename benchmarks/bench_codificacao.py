@@ -0,0 +1,71 @@
+"""
+Benchmark da codificação do payload do socket: JSON vs colunar (um bloco e em blocos).
+Mostra o tempo de codificação/descodificação e os bytes por registo.
+
+Uso: python benchmarks/bench_codificacao.py [num_registos ...]
+"""
+import io
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "xml-service"))
+
+from codificacao import (
+    CodificadorColunar, EscritorColunarBlocos, descodificar_mensagem,
+    CODIFICACAO_JSON, CODIFICACAO_COLUNAR, CODIFICACAO_COLUNAR_BLOCOS
+)
+from geradores import gerar_registos
+
+
+def medir(funcao):
+    inicio = time.perf_counter()
+    resultado = funcao()
+    return resultado, time.perf_counter() - inicio
+
+
+def codificar_json(envelope, dados):
+    return json.dumps({**envelope, "dados": dados}).encode("utf-8")
+
+
+def codificar_colunar(envelope, dados):
+    codificador = CodificadorColunar(envelope)
+    for dado in dados:
+        codificador.adicionar(dado)
+    destino = io.BytesIO()
+    codificador.escrever(destino)
+    return destino.getvalue()
+
+
+def codificar_colunar_blocos(envelope, dados):
+    destino = io.BytesIO()
+    escritor = EscritorColunarBlocos(envelope, destino)
+    for dado in dados:
+        escritor.adicionar(dado)
+    escritor.concluir()
+    return destino.getvalue()
+
+
+def main():
+    tamanhos = [int(arg) for arg in sys.argv[1:]] or [1_000, 10_000, 100_000]
+    envelope = {"id_requisicao": "bench", "mapper": {}, "mapper_version": "1.0", "webhook_url": None}
+
+    print(f"{'registos':>10} {'formato':>8} {'bytes/reg':>10} {'codificar (s)':>14} {'descodificar (s)':>17}")
+    for total in tamanhos:
+        dados = list(gerar_registos(total))
+
+        for nome, codificar, codificacao in (
+            ("json", codificar_json, CODIFICACAO_JSON),
+            ("colunar", codificar_colunar, CODIFICACAO_COLUNAR),
+            ("blocos", codificar_colunar_blocos, CODIFICACAO_COLUNAR_BLOCOS),
+        ):
+            payload, t_codificar = medir(lambda: codificar(envelope, dados))
+            mensagem, t_descodificar = medir(lambda: descodificar_mensagem(codificacao, payload))
+            assert mensagem["dados"] == dados
+
+            print(f"{total:>10} {nome:>8} {len(payload) / total:>10.1f} {t_codificar:>14.4f} {t_descodificar:>17.4f}")
+
+
+if __name__ == "__main__":
+    main()
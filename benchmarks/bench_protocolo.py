@@ -0,0 +1,111 @@
+"""
+Benchmark do enquadramento das mensagens por socket (loopback).
+Compara o módulo protocolo (recv_into para buffer pré-alocado, sendmsg)
+com a leitura ingénua (bytes += chunk) para payloads de 1 KB a 100 MB.
+
+Uso: python benchmarks/bench_protocolo.py [tamanho_bytes ...]
+"""
+import os
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "xml-service"))
+
+from protocolo import (
+    CABECALHO_V2, FRAME_PEDIDO, FRAME_RESPOSTA,
+    receber_frame, enviar_frame
+)
+
+TAMANHOS = [1024, 64 * 1024, 1024 * 1024, 10 * 1024 * 1024, 100 * 1024 * 1024]
+
+# Bytes transferidos (aprox.) por cada combinação de tamanho e implementação
+VOLUME_POR_MEDICAO = 256 * 1024 * 1024
+
+
+def receber_ingenuo(conn: socket.socket, tamanho: int) -> bytes:
+    dados = b''
+    while len(dados) < tamanho:
+        chunk = conn.recv(tamanho - len(dados))
+        if not chunk:
+            raise ConnectionError("Conexao fechada")
+        dados += chunk
+    return dados
+
+
+def servidor_protocolo(conn: socket.socket):
+    try:
+        while True:
+            _, _, id_pedido, payload = receber_frame(conn)
+            enviar_frame(conn, FRAME_RESPOSTA, id_pedido, len(payload).to_bytes(8, "big"))
+    except Exception:
+        conn.close()
+
+
+def servidor_ingenuo(conn: socket.socket):
+    try:
+        while True:
+            tamanho, _, _, id_pedido = CABECALHO_V2.unpack(receber_ingenuo(conn, CABECALHO_V2.size))
+            payload = receber_ingenuo(conn, tamanho)
+            resposta = len(payload).to_bytes(8, "big")
+            conn.sendall(CABECALHO_V2.pack(len(resposta), 0, FRAME_RESPOSTA, id_pedido) + resposta)
+    except Exception:
+        conn.close()
+
+
+def cliente_protocolo(sock: socket.socket, payload: bytes, id_pedido: int):
+    enviar_frame(sock, FRAME_PEDIDO, id_pedido, payload)
+    _, _, _, resposta = receber_frame(sock)
+    assert int.from_bytes(resposta, "big") == len(payload)
+
+
+def cliente_ingenuo(sock: socket.socket, payload: bytes, id_pedido: int):
+    sock.sendall(CABECALHO_V2.pack(len(payload), 0, FRAME_PEDIDO, id_pedido) + payload)
+    tamanho, _, _, _ = CABECALHO_V2.unpack(receber_ingenuo(sock, CABECALHO_V2.size))
+    assert int.from_bytes(receber_ingenuo(sock, tamanho), "big") == len(payload)
+
+
+def medir(servidor, cliente, tamanho: int) -> float:
+    """
+    Devolve o débito (MB/s) de pedidos com payload do tamanho indicado.
+    """
+    escuta = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    escuta.bind(("127.0.0.1", 0))
+    escuta.listen(1)
+
+    sock = socket.create_connection(escuta.getsockname())
+    conn, _ = escuta.accept()
+    escuta.close()
+    threading.Thread(target=servidor, args=(conn,), daemon=True).start()
+
+    payload = os.urandom(tamanho)
+    repeticoes = max(1, min(10_000, VOLUME_POR_MEDICAO // tamanho))
+
+    inicio = time.perf_counter()
+    for id_pedido in range(repeticoes):
+        cliente(sock, payload, id_pedido)
+    duracao = time.perf_counter() - inicio
+
+    sock.close()
+    return tamanho * repeticoes / duracao / (1024 * 1024)
+
+
+def formatar_tamanho(tamanho: int) -> str:
+    if tamanho >= 1024 * 1024:
+        return f"{tamanho // (1024 * 1024)} MB"
+    return f"{tamanho // 1024} KB"
+
+
+def main():
+    tamanhos = [int(arg) for arg in sys.argv[1:]] or TAMANHOS
+
+    print(f"{'payload':>10} {'protocolo (MB/s)':>17} {'ingenuo (MB/s)':>15}")
+    for tamanho in tamanhos:
+        protocolo = medir(servidor_protocolo, cliente_protocolo, tamanho)
+        ingenuo = medir(servidor_ingenuo, cliente_ingenuo, tamanho)
+        print(f"{formatar_tamanho(tamanho):>10} {protocolo:>17.1f} {ingenuo:>15.1f}")
+
+
+if __name__ == "__main__":
+    main()
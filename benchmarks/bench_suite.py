@@ -0,0 +1,171 @@
+"""
+Suite de benchmarks dos caminhos críticos de ingestão e de consulta:
+processamento do CSV (API externa simulada), serialização, ida e volta por
+socket (loopback), criação e validação do XML e métodos do servicer gRPC
+(base de dados simulada). Corre sem rede nem base de dados.
+
+Cada caso corre num processo próprio (o Processador e o XML Service têm
+módulos com o mesmo nome e o pico de memória fica isolado por caso).
+Mostra o débito, os percentis de latência por execução e o pico de memória.
+
+Uso:
+  python benchmarks/bench_suite.py [--registos N] [--repeticoes R] [--casos a,b]
+                                   [--guardar baseline.json]
+                                   [--comparar baseline.json] [--limite 0.2]
+
+Com --comparar, termina com código 1 se algum caso ficar pior do que a
+baseline em mais do que o limite (débito ou latência p95) ou se rebentar
+e a baseline tiver esse caso. Só os casos com dependências externas por
+instalar (ex.: grpc) são ignorados.
+"""
+import argparse
+import importlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from medicao import medir, guardar_baseline, carregar_baseline, comparar
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+RAIZ = os.path.join(BENCHMARKS, "..")
+
+# Serviço -> (pasta com o código, módulo com os casos)
+SERVICOS = {
+    "processador": (os.path.join(RAIZ, "processador"), "casos_processador"),
+    "xml-service": (os.path.join(RAIZ, "xml-service"), "casos_xml_service"),
+}
+
+# Casos disponíveis, pela ordem em que correm
+CASOS = [
+    ("csv_stream", "processador"),
+    ("csv_stream_api_lenta", "processador"),
+    ("serializar_json", "processador"),
+    ("serializar_colunar", "processador"),
+    ("socket_ida_volta", "processador"),
+    ("criar_xml", "xml-service"),
+    ("construir_e_validar_arvore", "xml-service"),
+    ("construir_e_validar_template", "xml-service"),
+    ("validar_xml", "xml-service"),
+    ("escrever_xml_template", "xml-service"),
+    ("escrever_xml_lxml", "xml-service"),
+    ("grpc_consultar_xpath", "xml-service"),
+    ("grpc_agregar_ativos", "xml-service"),
+    ("grpc_contar_por_tipo", "xml-service"),
+    ("grpc_media_precos", "xml-service"),
+]
+
+
+def modulo_do_repositorio(nome: str, pasta: str) -> bool:
+    """
+    Indica se o módulo é do serviço ou dos benchmarks (e não uma dependência externa).
+    """
+    ficheiro = nome.split(".")[0] + ".py"
+    return any(os.path.exists(os.path.join(origem, ficheiro)) for origem in (pasta, BENCHMARKS))
+
+
+def executar_caso(nome: str, registos: int, repeticoes: int) -> dict:
+    """
+    Corre um caso neste processo (chamado pelo subprocesso).
+    """
+    servico = dict(CASOS)[nome]
+    pasta, modulo = SERVICOS[servico]
+    sys.path.insert(0, pasta)
+
+    try:
+        casos = importlib.import_module(modulo)
+        funcao, unidades = getattr(casos, f"caso_{nome}")(registos)
+    except ModuleNotFoundError as e:
+        # Dependência do serviço que não está instalada (ex.: grpc, psycopg2);
+        # um módulo do próprio repositório em falta é um erro do caso
+        if e.name is None or modulo_do_repositorio(e.name, pasta):
+            raise
+        return {"ignorado": f"falta o modulo {e.name}"}
+
+    return medir(funcao, repeticoes, unidades)
+
+
+def correr_subprocesso(nome: str, registos: int, repeticoes: int, data_dir: str) -> dict:
+    """
+    Corre um caso num processo novo e devolve o resultado (JSON na última linha).
+    """
+    comando = [
+        sys.executable, os.path.abspath(__file__), "--executar", nome,
+        "--registos", str(registos), "--repeticoes", str(repeticoes)
+    ]
+    # Ficheiros SQLite e caches dos serviços ficam numa pasta temporária
+    env = {**os.environ, "DATA_DIR": data_dir}
+    processo = subprocess.run(comando, capture_output=True, text=True, env=env)
+
+    if processo.returncode != 0:
+        # O caso rebentou: fica registado como erro (e falha a comparação com a baseline)
+        erro = processo.stderr.strip().splitlines()
+        return {"erro": erro[-1] if erro else f"codigo de saida {processo.returncode}"}
+    return json.loads(processo.stdout.strip().splitlines()[-1])
+
+
+def imprimir(nome: str, resultado: dict):
+    if "ignorado" in resultado:
+        print(f"{nome:<28} ignorado ({resultado['ignorado']})")
+        return
+    if "erro" in resultado:
+        print(f"{nome:<28} ERRO ({resultado['erro']})")
+        return
+
+    latencia = resultado["latencia_ms"]
+    print(
+        f"{nome:<28} {resultado['unidades_por_segundo']:>12.1f} {latencia['p50']:>9.2f} "
+        f"{latencia['p95']:>9.2f} {latencia['p99']:>9.2f} "
+        f"{resultado['memoria_python_pico_mb']:>9.1f} {resultado['rss_pico_mb']:>8.1f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks dos caminhos criticos do TP3")
+    parser.add_argument("--registos", type=int, default=10_000, help="registos por execucao")
+    parser.add_argument("--repeticoes", type=int, default=5, help="execucoes cronometradas por caso")
+    parser.add_argument("--casos", help="casos a correr, separados por virgulas (todos por omissao)")
+    parser.add_argument("--guardar", help="guarda os resultados como baseline neste ficheiro JSON")
+    parser.add_argument("--comparar", help="compara com a baseline deste ficheiro JSON")
+    parser.add_argument("--limite", type=float, default=0.2, help="regressao tolerada (0.2 = 20%%)")
+    parser.add_argument("--executar", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.executar:
+        print(json.dumps(executar_caso(args.executar, args.registos, args.repeticoes)))
+        return
+
+    nomes = [nome for nome, _ in CASOS]
+    if args.casos:
+        nomes = [nome.strip() for nome in args.casos.split(",")]
+        desconhecidos = set(nomes) - set(dict(CASOS))
+        if desconhecidos:
+            parser.error(f"casos desconhecidos: {', '.join(sorted(desconhecidos))}")
+
+    print(f"{args.registos} registos, {args.repeticoes} repeticoes por caso")
+    print(f"{'caso':<28} {'unidades/s':>12} {'p50 (ms)':>9} {'p95 (ms)':>9} {'p99 (ms)':>9} "
+          f"{'mem (MB)':>9} {'rss (MB)':>8}")
+
+    resultados = {}
+    with tempfile.TemporaryDirectory(prefix="bench_tp3_") as data_dir:
+        for nome in nomes:
+            resultados[nome] = correr_subprocesso(nome, args.registos, args.repeticoes, data_dir)
+            imprimir(nome, resultados[nome])
+
+    if args.guardar:
+        guardar_baseline(args.guardar, resultados)
+        print(f"Baseline guardada em {args.guardar}")
+
+    if args.comparar:
+        regressoes = comparar(resultados, carregar_baseline(args.comparar), args.limite)
+        if regressoes:
+            print(f"Regressoes acima de {args.limite:.0%}:")
+            for regressao in regressoes:
+                print(f"  {regressao}")
+            sys.exit(1)
+        print(f"Sem regressoes acima de {args.limite:.0%} em relacao a {args.comparar}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""
+Benchmark da escrita do XML em streaming: serializador lxml vs template.
+Antes de medir, corre o teste diferencial de verificar_serializadores.py
+(os dois serializadores têm de dar os mesmos bytes que o ConstrutorXML).
+
+Uso: python benchmarks/bench_xml.py [num_registos ...]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "xml-service"))
+
+from xml_builder import escrever_xml
+from geradores import gerar_registos
+from verificar_serializadores import SERIALIZADORES, verificar_serializadores
+
+
+class Contador:
+    """
+    Destino que só conta os bytes escritos.
+    """
+
+    def __init__(self):
+        self.bytes = 0
+
+    def write(self, dados):
+        self.bytes += len(dados)
+
+
+def main():
+    tamanhos = [int(arg) for arg in sys.argv[1:]] or [1_000, 100_000, 1_000_000]
+
+    falhas = verificar_serializadores()
+    if falhas:
+        sys.exit(f"Serializadores diferentes do ConstrutorXML: {', '.join(falhas)}")
+
+    print(f"{'registos':>10} {'serializador':>12} {'tempo (s)':>10} {'registos/s':>12} {'bytes':>12}")
+    for total in tamanhos:
+        for serializador in SERIALIZADORES:
+            destino = Contador()
+            inicio = time.perf_counter()
+            escrever_xml(gerar_registos(total), destino, "1.0", "bench", serializador=serializador)
+            duracao = time.perf_counter() - inicio
+
+            print(f"{total:>10} {serializador:>12} {duracao:>10.3f} {total / duracao:>12.0f} {destino.bytes:>12}")
+
+
+if __name__ == "__main__":
+    main()
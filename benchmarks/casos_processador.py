@@ -0,0 +1,97 @@
+"""
+Casos de benchmark do Processador (importados com processador/ no sys.path).
+Cada caso recebe o número de registos e devolve (função a medir, unidades por execução).
+"""
+import json
+import socket
+import threading
+
+from geradores import gerar_csv, gerar_registos, api_externa_falsa
+
+
+def caso_csv_stream(registos: int):
+    """
+    processar_csv_stream com a API externa substituída por respostas imediatas.
+    """
+    import csv_processor
+    csv_processor.consultar_api_externa = api_externa_falsa()
+
+    conteudo = gerar_csv(registos)
+    return lambda: csv_processor.processar_csv_stream(conteudo), registos
+
+
+def caso_csv_stream_api_lenta(registos: int):
+    """
+    processar_csv_stream com 50 países distintos e 5 ms por pedido à API.
+    """
+    import csv_processor
+    csv_processor.consultar_api_externa = api_externa_falsa(latencia=0.005)
+
+    conteudo = gerar_csv(registos, paises_distintos=50)
+    return lambda: csv_processor.processar_csv_stream(conteudo), registos
+
+
+def _caso_serializar(registos: int, codificacao: int):
+    from socket_client import serializar_mensagem
+
+    dados = list(gerar_registos(registos))
+
+    def serializar():
+        mensagem, _ = serializar_mensagem("bench", {}, None, dados, codificacao)
+        mensagem.close()
+
+    return serializar, registos
+
+
+def caso_serializar_json(registos: int):
+    from codificacao import CODIFICACAO_JSON
+    return _caso_serializar(registos, CODIFICACAO_JSON)
+
+
+def caso_serializar_colunar(registos: int):
+    from codificacao import CODIFICACAO_COLUNAR_BLOCOS
+    return _caso_serializar(registos, CODIFICACAO_COLUNAR_BLOCOS)
+
+
+def caso_socket_ida_volta(registos: int):
+    """
+    Pedido completo por loopback: serialização, frame v2 a partir do spool,
+    receção e descodificação do outro lado e resposta JSON.
+    """
+    from codificacao import CODIFICACAO_JSON, descodificar_mensagem
+    from protocolo import (
+        FLAGS_CODIFICACAO, FRAME_PEDIDO, FRAME_RESPOSTA,
+        ErroFrame, receber_frame, enviar_frame, enviar_frame_ficheiro
+    )
+    from socket_client import serializar_mensagem
+
+    escuta = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    escuta.bind(("127.0.0.1", 0))
+    escuta.listen(1)
+    sock = socket.create_connection(escuta.getsockname())
+    conn, _ = escuta.accept()
+    escuta.close()
+
+    def servidor():
+        try:
+            while True:
+                flags, _, id_pedido, payload = receber_frame(conn)
+                mensagem = descodificar_mensagem(flags & FLAGS_CODIFICACAO, payload)
+                resposta = {"status": "OK", "registos": len(mensagem["dados"])}
+                enviar_frame(conn, FRAME_RESPOSTA, id_pedido, json.dumps(resposta).encode("utf-8"))
+        except (ErroFrame, OSError):
+            conn.close()
+
+    threading.Thread(target=servidor, daemon=True).start()
+    dados = list(gerar_registos(registos))
+
+    def ida_volta():
+        mensagem, _ = serializar_mensagem("bench", {}, None, dados, CODIFICACAO_JSON)
+        with mensagem:
+            tamanho = mensagem.seek(0, 2)
+            mensagem.seek(0)
+            enviar_frame_ficheiro(sock, FRAME_PEDIDO, 1, mensagem, tamanho, CODIFICACAO_JSON)
+        _, _, _, resposta = receber_frame(sock)
+        assert json.loads(resposta)["registos"] == registos
+
+    return ida_volta, registos
@@ -0,0 +1,180 @@
+"""
+Casos de benchmark do XML Service (importados com xml-service/ no sys.path).
+Cada caso recebe o número de registos e devolve (função a medir, unidades por execução).
+Os métodos gRPC são chamados diretamente no servicer, com uma base de dados
+falsa em memória (sem PostgreSQL nem rede).
+"""
+from geradores import PAISES, REGIOES, gerar_registos
+
+# Limite de linhas aplicado pelo AgregarAtivos
+MAX_LINHAS_AGREGAR = 5000
+
+
+class Nulo:
+    """
+    Destino que descarta o que é escrito.
+    """
+
+    def write(self, dados):
+        return len(dados)
+
+
+class CursorFalso:
+    """
+    Cursor que devolve linhas sintéticas conforme a função SQL chamada.
+    """
+
+    def __init__(self, linhas: int):
+        self.linhas = linhas
+        self._resultado = []
+
+    def execute(self, sql: str, parametros=None):
+        if "consultar_xpath" in sql:
+            self._resultado = [{"resultado": f"Pais {i}"} for i in range(self.linhas)]
+        elif "agregar_ativos" in sql:
+            self._resultado = [
+                {
+                    "ticker": f"CSV_{PAISES[i % len(PAISES)].upper()}_{i}",
+                    "tipo": REGIOES[i % len(REGIOES)],
+                    "preco_atual": 1.5 + i % 1400,
+                    "volume": i * 1000,
+                    "media_30d": 3287.26,
+                    "maximo_6m": 1417.49,
+                    "capital": "New Delhi",
+                    "subregiao": "Southern Asia",
+                    "moeda": "Indian rupee",
+                    "densidade": 431.2
+                }
+                for i in range(min(self.linhas, MAX_LINHAS_AGREGAR))
+            ]
+        elif "contar_ativos_por_tipo" in sql:
+            self._resultado = [{"tipo": regiao, "total": self.linhas} for regiao in sorted(set(REGIOES))]
+        elif "media_precos_por_tipo" in sql:
+            self._resultado = [{"tipo": regiao, "media_preco": 700.5} for regiao in sorted(set(REGIOES))]
+
+    def fetchall(self):
+        return self._resultado
+
+    def close(self):
+        pass
+
+
+class LigacaoFalsa:
+    def __init__(self, linhas: int):
+        self.linhas = linhas
+
+    def cursor(self, cursor_factory=None):
+        return CursorFalso(self.linhas)
+
+    def close(self):
+        pass
+
+
+def caso_criar_xml(registos: int):
+    from xml_builder import criar_xml
+
+    dados = list(gerar_registos(registos))
+    return lambda: criar_xml(dados, "1.0", "bench"), registos
+
+
+def _caso_construir_e_validar(registos: int, serializador: str):
+    from xml_builder import criar_construtor
+
+    dados = list(gerar_registos(registos))
+
+    def construir():
+        construtor = criar_construtor("1.0", "bench", True, serializador)
+        construtor.adicionar(dados)
+        valido, msg_validacao = construtor.validar()
+        assert valido, msg_validacao
+        return construtor.concluir(True)
+
+    return construir, registos
+
+
+def caso_construir_e_validar_arvore(registos: int):
+    """
+    Caminho do servidor de sockets com XML_SERIALIZADOR=lxml:
+    árvore lxml validada em memória e serializada.
+    """
+    return _caso_construir_e_validar(registos, "lxml")
+
+
+def caso_construir_e_validar_template(registos: int):
+    """
+    Caminho do servidor de sockets com XML_SERIALIZADOR=template:
+    texto gerado pelo template, lido pelo parser e validado.
+    """
+    return _caso_construir_e_validar(registos, "template")
+
+
+def caso_validar_xml(registos: int):
+    from xml_builder import criar_xml, validar_xml
+
+    xml_string = criar_xml(list(gerar_registos(registos)), "1.0", "bench")
+
+    def validar():
+        valido, msg_validacao = validar_xml(xml_string)
+        assert valido, msg_validacao
+
+    return validar, registos
+
+
+def _caso_escrever_xml(registos: int, serializador: str):
+    from xml_builder import escrever_xml
+
+    dados = list(gerar_registos(registos))
+    return lambda: escrever_xml(dados, Nulo(), "1.0", "bench", serializador=serializador), registos
+
+
+def caso_escrever_xml_template(registos: int):
+    return _caso_escrever_xml(registos, "template")
+
+
+def caso_escrever_xml_lxml(registos: int):
+    return _caso_escrever_xml(registos, "lxml")
+
+
+def _servicer(linhas: int):
+    import grpc_server
+    grpc_server.get_db_connection = lambda: LigacaoFalsa(linhas)
+    return grpc_server.XMLServiceServicer()
+
+
+def caso_grpc_consultar_xpath(registos: int):
+    import xml_service_pb2
+    servicer = _servicer(registos)
+    pedido = xml_service_pb2.XPathRequest(xpath="//Pais/@Nome")
+
+    def consultar():
+        resposta = servicer.ConsultarXPath(pedido, None)
+        assert resposta.sucesso, resposta.erro
+
+    return consultar, 1
+
+
+def caso_grpc_agregar_ativos(registos: int):
+    import xml_service_pb2
+    servicer = _servicer(registos)
+    pedido = xml_service_pb2.AgregarAtivosRequest()
+
+    def agregar():
+        resposta = servicer.AgregarAtivos(pedido, None)
+        assert resposta.sucesso, resposta.erro
+        return resposta.SerializeToString()
+
+    return agregar, 1
+
+
+def caso_grpc_contar_por_tipo(registos: int):
+    import xml_service_pb2
+    servicer = _servicer(registos)
+    pedido = xml_service_pb2.ContarAtivosPorTipoRequest()
+    return lambda: servicer.ContarAtivosPorTipo(pedido, None).SerializeToString(), 1
+
+
+def caso_grpc_media_precos(registos: int):
+    import xml_service_pb2
+    servicer = _servicer(registos)
+    pedido = xml_service_pb2.MediaPrecosPorTipoRequest()
+    return lambda: servicer.MediaPrecosPorTipo(pedido, None).SerializeToString(), 1
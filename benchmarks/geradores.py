@@ -0,0 +1,84 @@
+"""
+Dados sintéticos para os benchmarks: registos no formato enviado pelo
+Processador, CSV no formato lido pelo csv_processor e respostas da API
+externa (sem rede).
+"""
+import csv
+import io
+import time
+
+PAISES = ["India", "China", "United States", "Brazil", "Portugal", "Saint Lucia", "Japan", "Germany"]
+
+REGIOES = ["Asia", "Asia", "Americas", "Americas", "Europe", "Americas", "Asia", "Europe"]
+
+# Colunas do CSV (as chaves do MAPPER do Processador)
+COLUNAS_CSV = ["ID_Interno", "Nome_Pais", "Regiao", "Populacao_Milhoes", "Populacao_Total", "Data_Coleta", "Unidade"]
+
+
+def gerar_registos(total: int):
+    """
+    Gera registos sintéticos com o mesmo formato dos enviados pelo Processador.
+    """
+    for i in range(total):
+        pais = PAISES[i % len(PAISES)]
+        yield {
+            "IDInterno": f"CSV_{pais.upper().replace(' ', '_')}_{i}",
+            "Nome": pais,
+            "Continente": "Asia",
+            "PopulacaoMilhoes": f"{(i % 1400) + 0.5:.2f}",
+            "PopulacaoTotal": str((i % 1400) * 1_000_000 + 500_000),
+            "DataColeta": "2026-10-18",
+            "Unidade": "Milhoes",
+            "Media30d": round(3287.26 + i % 7, 2),
+            "Maximo6m": round(1417.49 + i % 3, 2),
+            "Capital": "New Delhi",
+            "Subregiao": "Southern Asia",
+            "Moeda": "Indian rupee",
+            "DensidadePopulacao": round(431.2 + i % 11, 2)
+        }
+
+
+def gerar_csv(total: int, paises_distintos: int = len(PAISES)) -> bytes:
+    """
+    Gera um CSV com as colunas esperadas pelo csv_processor.
+    Com paises_distintos acima da lista base, os nomes extra são inventados
+    (obrigam a consultar a API para mais países).
+    """
+    saida = io.StringIO()
+    escritor = csv.writer(saida)
+    escritor.writerow(COLUNAS_CSV)
+
+    for i in range(total):
+        indice = i % max(1, paises_distintos)
+        pais = PAISES[indice] if indice < len(PAISES) else f"Pais Sintetico {indice}"
+        escritor.writerow([
+            f"CSV_{pais.upper().replace(' ', '_')}_{i}",
+            pais,
+            REGIOES[indice % len(REGIOES)],
+            f"{(i % 1400) + 0.5:.2f}",
+            (i % 1400) * 1_000_000 + 500_000,
+            "2026-10-18",
+            "Milhoes"
+        ])
+
+    return saida.getvalue().encode("utf-8")
+
+
+def api_externa_falsa(latencia: float = 0.0):
+    """
+    Devolve um substituto de consultar_api_externa que responde sem rede,
+    com os mesmos campos que a API real (e uma latência opcional por pedido).
+    """
+    def consultar(pais: str) -> dict:
+        if latencia:
+            time.sleep(latencia)
+        return {
+            "media_30d": 3287.26,
+            "maximo_6m": 1417.49,
+            "capital": f"Capital de {pais}",
+            "subregion": "Southern Asia",
+            "currency": "Indian rupee",
+            "density": 431.2
+        }
+
+    return consultar
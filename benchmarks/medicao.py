@@ -0,0 +1,112 @@
+"""
+Medição dos benchmarks: débito, percentis de latência e pico de memória,
+e comparação com uma baseline guardada em JSON.
+"""
+import json
+import os
+import resource
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List
+
+# O percentil é o mesmo usado nas estatísticas de pedidos do Processador
+# (no fim do sys.path, para não esconder os módulos do serviço em teste)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "processador"))
+
+from percentis import percentil
+
+
+def rss_pico_mb() -> float:
+    """
+    Pico de memória residente do processo (MB).
+    """
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Em macOS vem em bytes, em Linux em KB
+    return pico / (1024 * 1024) if sys.platform == "darwin" else pico / 1024
+
+
+def medir(funcao: Callable[[], object], repeticoes: int, unidades: int = 1, aquecimento: int = 1) -> dict:
+    """
+    Executa a função várias vezes e devolve o débito (unidades por segundo),
+    os percentis da latência de cada execução e o pico de memória.
+    O pico de memória Python é medido numa execução à parte, com tracemalloc,
+    para não atrasar as execuções cronometradas.
+    """
+    for _ in range(aquecimento):
+        funcao()
+
+    latencias = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao()
+        latencias.append(time.perf_counter() - inicio)
+
+    tracemalloc.start()
+    try:
+        funcao()
+        _, pico_python = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    latencias.sort()
+    total = sum(latencias)
+    return {
+        "repeticoes": repeticoes,
+        "unidades": unidades,
+        "unidades_por_segundo": unidades * repeticoes / total if total else None,
+        "latencia_ms": {
+            "p50": percentil(latencias, 50) * 1000,
+            "p95": percentil(latencias, 95) * 1000,
+            "p99": percentil(latencias, 99) * 1000,
+            "max": latencias[-1] * 1000
+        },
+        "memoria_python_pico_mb": pico_python / (1024 * 1024),
+        "rss_pico_mb": rss_pico_mb()
+    }
+
+
+def guardar_baseline(caminho: str, resultados: Dict[str, dict]):
+    """
+    Guarda os resultados de uma execução para comparar com as seguintes.
+    """
+    with open(caminho, "w", encoding="utf-8") as ficheiro:
+        json.dump(resultados, ficheiro, indent=2, sort_keys=True)
+
+
+def carregar_baseline(caminho: str) -> Dict[str, dict]:
+    with open(caminho, encoding="utf-8") as ficheiro:
+        return json.load(ficheiro)
+
+
+def comparar(resultados: Dict[str, dict], baseline: Dict[str, dict], limite: float) -> List[str]:
+    """
+    Devolve as regressões em relação à baseline: débito abaixo ou p95
+    acima da baseline em mais do que `limite` (ex.: 0.2 = 20%).
+    Um caso que falhou é uma regressão se a baseline tiver esse caso.
+    Casos sem baseline (ou ignorados) não são comparados.
+    """
+    regressoes = []
+    for nome, atual in resultados.items():
+        base = baseline.get(nome)
+        if base and "erro" in atual:
+            regressoes.append(f"{nome}: falhou ({atual['erro']})")
+            continue
+        if not base or "ignorado" in base or "erro" in base or "ignorado" in atual:
+            continue
+
+        debito, debito_base = atual["unidades_por_segundo"], base["unidades_por_segundo"]
+        if debito_base and debito < debito_base * (1 - limite):
+            regressoes.append(
+                f"{nome}: debito {debito:.1f}/s abaixo da baseline {debito_base:.1f}/s "
+                f"({(debito / debito_base - 1) * 100:+.1f}%)"
+            )
+
+        p95, p95_base = atual["latencia_ms"]["p95"], base["latencia_ms"]["p95"]
+        if p95_base and p95 > p95_base * (1 + limite):
+            regressoes.append(
+                f"{nome}: p95 {p95:.2f} ms acima da baseline {p95_base:.2f} ms "
+                f"({(p95 / p95_base - 1) * 100:+.1f}%)"
+            )
+
+    return regressoes
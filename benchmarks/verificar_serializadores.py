@@ -0,0 +1,158 @@
+"""
+Teste diferencial dos serializadores de XML do XML Service.
+Confirma que o escritor em streaming (lxml e template), o ConstrutorXMLTemplate
+e os fragmentos do pool dão exatamente os mesmos bytes que o ConstrutorXML
+(incluindo valores com caracteres especiais), que os valores inválidos falham
+da mesma forma e que os documentos gerados são válidos contra o XSD.
+
+Uso: python benchmarks/verificar_serializadores.py
+Termina com código 1 se alguma verificação falhar.
+"""
+import io
+import os
+import sys
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "xml-service"))
+
+from xml_builder import (
+    ConstrutorXML, ConstrutorXMLTemplate, construir_fragmento, escrever_xml, juntar_fragmentos, validar_xml
+)
+from geradores import gerar_registos
+
+SERIALIZADORES = ["lxml", "template"]
+
+# Registos com os casos difíceis: escapes, unicode, campos em falta, None, números
+REGISTOS_ESPECIAIS = [
+    {"IDInterno": "A&B", "Nome": "Côte d'Ivoire", "Continente": "África <Oeste>", "PopulacaoMilhoes": 1.5},
+    {"IDInterno": 'x"y\'z', "Nome": "tab\there\nnova\rlinha", "Continente": "a\r\nb\tc", "Capital": "São Tomé"},
+    {"IDInterno": "", "Nome": "", "Continente": "", "Subregiao": "", "Capital": None, "Moeda": "N/A"},
+    {"IDInterno": "sem-continente", "Nome": "Regiao", "Regiao": "Europa", "DensidadePopulacao": 0.0},
+    {"IDInterno": "continente-none", "Nome": "N", "Continente": None, "Media30d": None, "Maximo6m": 7},
+    {"IDInterno": "bytes", "Nome": b"ascii", "Continente": b"Asia", "Moeda": b"euro", "Subregiao": 12},
+    {"IDInterno": "emoji \U0001F600", "Nome": "]]> & &amp;", "Continente": "1 < 2 > 0", "PopulacaoTotal": 10 ** 12},
+    {},
+]
+
+# Registos que o lxml rejeita: o template tem de falhar da mesma forma
+REGISTOS_INVALIDOS = [
+    {"IDInterno": "ctrl\x01", "Nome": "x"},
+    {"IDInterno": "x", "Nome": 5},
+    {"IDInterno": "x", "Nome": "x", "Continente": "nul\x00"},
+    {"IDInterno": "x", "Nome": "x", "Continente": 3},
+    {"IDInterno": "x", "Nome": "x", "Moeda": "\ufffe"},
+    {"IDInterno": "x", "Nome": "x", "Capital": "\ud800"},
+]
+
+# Registos que o XSD rejeita: os dois construtores têm de os recusar
+REGISTOS_NAO_VALIDOS = [
+    {"IDInterno": "x", "Nome": "x", "PopulacaoTotal": "muitos"},
+]
+
+
+def escrever(registos, serializador: str, pretty_print: bool = True) -> bytes:
+    destino = io.BytesIO()
+    escrever_xml(registos, destino, "1.0", "id-123456789", pretty_print, serializador)
+    return destino.getvalue()
+
+
+def construir(classe, registos, pretty_print: bool = True) -> str:
+    if classe is ConstrutorXMLTemplate:
+        construtor = ConstrutorXMLTemplate("1.0", "id-123456789", pretty_print)
+    else:
+        construtor = ConstrutorXML("1.0", "id-123456789")
+    construtor.adicionar(registos)
+    return construtor.concluir(pretty_print)
+
+
+def validacao(classe, registos) -> bool:
+    construtor = ConstrutorXMLTemplate("1.0", "") if classe is ConstrutorXMLTemplate else ConstrutorXML("1.0", "")
+    construtor.adicionar(registos)
+    valido, _ = construtor.validar()
+    return valido
+
+
+def erro(funcao):
+    try:
+        funcao()
+    except Exception as e:
+        return type(e)
+    return None
+
+
+def verificar_serializadores() -> list:
+    """
+    Corre todas as verificações e devolve a lista das que falharam.
+    """
+    falhas = []
+
+    def verificar(condicao: bool, descricao: str):
+        if not condicao:
+            falhas.append(descricao)
+
+    # Os atributos gerados têm de ser iguais para comparar os bytes
+    uuid_original = uuid.uuid4
+    uuid.uuid4 = lambda: uuid.UUID(int=0)
+    try:
+        for nome, registos in (("vazio", []), ("especiais", REGISTOS_ESPECIAIS),
+                               ("gerados", list(gerar_registos(500)))):
+            for pretty_print in (True, False):
+                formato = "formatado" if pretty_print else "compacto"
+                esperado = construir(ConstrutorXML, registos, pretty_print)
+
+                verificar(escrever(registos, "lxml", pretty_print) == esperado.encode("utf-8"),
+                          f"escrever_xml lxml ({nome}, {formato})")
+                verificar(escrever(registos, "template", pretty_print) == esperado.encode("utf-8"),
+                          f"escrever_xml template ({nome}, {formato})")
+                verificar(construir(ConstrutorXMLTemplate, registos, pretty_print) == esperado,
+                          f"ConstrutorXMLTemplate ({nome}, {formato})")
+
+                # Os fragmentos do pool, juntos, dão o mesmo documento
+                # (só para registos válidos: um shard inválido não tem fragmento)
+                if nome == "especiais":
+                    continue
+                partes = [registos[inicio:inicio + 100] for inicio in range(0, len(registos), 100)]
+                for serializador in SERIALIZADORES:
+                    fragmentos = [construir_fragmento(parte, pretty_print, serializador)[2] for parte in partes]
+                    junto = juntar_fragmentos(fragmentos, "1.0", "id-123456789", pretty_print)
+                    verificar(junto == esperado, f"construir_fragmento {serializador} ({nome}, {formato})")
+
+        for registo in REGISTOS_INVALIDOS:
+            tipo = erro(lambda: escrever([registo], "lxml"))
+            verificar(tipo is not None and tipo == erro(lambda: escrever([registo], "template")),
+                      f"erro do escritor template para {registo!r}")
+            verificar(tipo == erro(lambda: validacao(ConstrutorXMLTemplate, [registo])),
+                      f"erro do ConstrutorXMLTemplate para {registo!r}")
+    finally:
+        uuid.uuid4 = uuid_original
+
+    for serializador in SERIALIZADORES:
+        valido, msg = validar_xml(escrever(gerar_registos(1000), serializador).decode("utf-8"))
+        verificar(valido, f"XSD do escritor {serializador}: {msg}")
+
+    for classe in (ConstrutorXML, ConstrutorXMLTemplate):
+        verificar(validacao(classe, list(gerar_registos(1000))), f"XSD do {classe.__name__}")
+        for registo in REGISTOS_NAO_VALIDOS:
+            verificar(not validacao(classe, [registo]), f"{classe.__name__} aceitou {registo!r}")
+            # Registo inválido longe do início (o template valida por blocos)
+            registos = list(gerar_registos(2500))
+            registos[1700] = registo
+            verificar(not validacao(classe, registos), f"{classe.__name__} aceitou {registo!r} no registo 1701")
+        verificar(not validacao(classe, []), f"{classe.__name__} aceitou um documento sem registos")
+
+    return falhas
+
+
+def main():
+    falhas = verificar_serializadores()
+    if falhas:
+        print("Serializadores diferentes do ConstrutorXML:")
+        for falha in falhas:
+            print(f"  - {falha}")
+        sys.exit(1)
+
+    print("Serializadores iguais ao ConstrutorXML e validos contra o XSD")
+
+
+if __name__ == "__main__":
+    main()
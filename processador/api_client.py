@@ -1,126 +1,187 @@
-import requests
+import threading
 import time
+from concurrent.futures import Future
+from typing import Callable, Dict
 from urllib.parse import quote
+from config import API_RATE_LIMIT, CACHE_TTL_NEGATIVO
+from cache_paises import criar_cache
+from http_client import cliente_http
+from normalizacao_paises import normalizar_nome_pais, extrair_dados_api, dados_fallback
+from referencia_paises import referencia_paises
 
-# Cache para evitar chamadas repetidas à API externa
-cache_paises_api = {}
+# Cache persistente para evitar chamadas repetidas à API externa
+cache_paises_api = criar_cache()
 
+# Cache separada para os países que a API não reconheceu (404, TTL mais curto)
+cache_negativa_api = criar_cache("cache_paises_negativo", CACHE_TTL_NEGATIVO)
 
-def consultar_api_externa(pais: str) -> dict:
+
+class LimitadorTaxa:
     """
-    Consulta a REST Countries API para obter dados adicionais de um país.
+    Limita o número de pedidos por segundo, partilhado entre threads.
     """
-    try:
-        # Normaliza o nome do país recebido
-        pais_limpo = pais.strip().replace("_", " ").strip()
-        pais_upper = pais_limpo.upper()
-
-        # Mapeamento de nomes comuns para nomes reconhecidos pela API
-        nome_mapping = {
-            "INDIA": "India", "CHINA": "China", "UNITED STATES": "United States",
-            "USA": "United States", "RUSSIA": "Russia", "BRAZIL": "Brazil",
-            "JAPAN": "Japan", "GERMANY": "Germany", "FRANCE": "France",
-            "ITALY": "Italy", "SPAIN": "Spain", "CANADA": "Canada",
-            "AUSTRALIA": "Australia", "MEXICO": "Mexico", "INDONESIA": "Indonesia",
-            "TURKEY": "Turkey", "SOUTH KOREA": "South Korea",
-            "SAUDI ARABIA": "Saudi Arabia", "PORTUGAL": "Portugal"
-        }
-
-        # Trata abreviações como "St." para "Saint"
-        if pais_upper.startswith("ST. ") or pais_upper.startswith("ST "):
-            pais_upper = pais_upper.replace("ST. ", "SAINT ", 1).replace("ST ", "SAINT ", 1)
-        elif pais_upper.startswith("ST."):
-            pais_upper = pais_upper.replace("ST.", "SAINT", 1)
-
-        # Define o nome normalizado a usar na API
-        if pais_upper in nome_mapping:
-            pais_normalizado = nome_mapping[pais_upper]
-        else:
-            palavras = pais_limpo.split()
-            pais_normalizado = " ".join([p.capitalize() for p in palavras])
 
-        # Verifica se o país já está em cache
-        if pais_normalizado in cache_paises_api:
-            return cache_paises_api[pais_normalizado]
-
-        # Extrai os dados relevantes do JSON devolvido pela API
-        def extrair_dados_api(country_data):
-            area = country_data.get("area", 0)
-            population = country_data.get("population", 0)
-
-            capital_list = country_data.get("capital")
-            capital = capital_list[0] if capital_list else "N/A"
-
-            subregion = country_data.get("subregion", "N/A")
-
-            currencies = country_data.get("currencies", {})
-            currency_name = "N/A"
-            if currencies:
-                currency_name = list(currencies.values())[0].get("name", "N/A")
-
-            density = (population / area) if area > 0 else 0
-
-            return {
-                "media_30d": round(area / 1000.0, 2),
-                "maximo_6m": round(population / 1_000_000.0, 2),
-                "capital": capital,
-                "subregion": subregion,
-                "currency": currency_name,
-                "density": round(density, 2)
-            }
-
-        # Faz a chamada HTTP com tentativas em caso de falha
-        def fazer_requisicao_com_retry(url, max_tentativas=3):
-            for tentativa in range(max_tentativas):
-                try:
-                    if tentativa > 0:
-                        time.sleep(0.5 * tentativa)
-                    return requests.get(url, timeout=15)
-                except Exception:
-                    continue
-            return None
-
-        # Codifica o nome do país para URL
-        pais_encoded = quote(pais_normalizado)
-
-        # Primeira tentativa com correspondência exata
-        url = f"https://restcountries.com/v3.1/name/{pais_encoded}?fullText=true"
-        response = fazer_requisicao_com_retry(url)
+    def __init__(self, pedidos_por_segundo: float):
+        self.intervalo = 1.0 / pedidos_por_segundo if pedidos_por_segundo > 0 else 0.0
+        self._lock = threading.Lock()
+        self._proximo = 0.0
 
-        if response and response.status_code == 200:
-            data = response.json()
-            resultado = extrair_dados_api(data[0])
-            cache_paises_api[pais_normalizado] = resultado
+    def aguardar(self):
+        """
+        Bloqueia até o próximo pedido poder ser feito.
+        """
+        if not self.intervalo:
+            return
+
+        with self._lock:
+            agora = time.monotonic()
+            espera = self._proximo - agora
+            self._proximo = max(agora, self._proximo) + self.intervalo
+
+        if espera > 0:
+            time.sleep(espera)
+
+
+# Limitador global dos pedidos HTTP à REST Countries API
+limitador_api = LimitadorTaxa(API_RATE_LIMIT)
+
+
+class ChamadaUnica:
+    """
+    Agrupa chamadas concorrentes com a mesma chave (single-flight):
+    só a primeira faz o trabalho, as restantes esperam pelo mesmo resultado.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._em_curso: Dict[str, Future] = {}
+        self.coalescidas = 0
+
+    def executar(self, chave: str, funcao: Callable[[], dict]) -> dict:
+        with self._lock:
+            futuro = self._em_curso.get(chave)
+            dono = futuro is None
+            if dono:
+                futuro = Future()
+                self._em_curso[chave] = futuro
+            else:
+                self.coalescidas += 1
+
+        # Outra thread já está a consultar esta chave
+        if not dono:
+            return futuro.result()
+
+        try:
+            resultado = funcao()
+            futuro.set_result(resultado)
             return resultado
+        except BaseException as e:
+            futuro.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._em_curso[chave]
+
+    def em_curso(self) -> int:
+        return len(self._em_curso)
+
+
+# Consultas à rede em curso, agrupadas pelo nome normalizado
+chamadas_api = ChamadaUnica()
+
 
-        # Segunda tentativa com correspondência parcial
-        url = f"https://restcountries.com/v3.1/name/{pais_encoded}?fullText=false"
+def falha_temporaria(response) -> bool:
+    """
+    Indica se a resposta é uma falha passageira (sem resposta, 429 ou 5xx).
+    """
+    return response is None or response.status_code == 429 or response.status_code >= 500
+
+
+def fazer_requisicao_com_retry(url: str, max_tentativas: int = 3):
+    """
+    Faz a chamada HTTP com tentativas em caso de falha (erro de rede, 429 ou 5xx).
+    """
+    response = None
+    for tentativa in range(max_tentativas):
+        try:
+            if tentativa > 0:
+                time.sleep(0.5 * tentativa)
+            limitador_api.aguardar()
+            response = cliente_http.get(url, timeout=15)
+        except Exception:
+            continue
+        if not falha_temporaria(response):
+            break
+    return response
+
+
+def consultar_api_rede(pais_normalizado: str) -> dict:
+    """
+    Consulta a REST Countries API (correspondência exata e depois parcial)
+    e guarda o resultado na cache positiva ou na cache negativa.
+    Só um 404 (nome desconhecido) vai para a cache negativa; falhas
+    passageiras da API (timeout, 429, 5xx) não ficam em cache.
+    """
+    # Outra consulta pode ter terminado entre a verificação da cache e agora
+    resultado_cache = cache_paises_api.get(pais_normalizado)
+    if resultado_cache is not None:
+        return resultado_cache
+
+    # Codifica o nome do país para URL
+    pais_encoded = quote(pais_normalizado)
+
+    # Primeira tentativa com correspondência exata, depois parcial
+    nao_encontrado = True
+    for full_text in ("true", "false"):
+        url = f"https://restcountries.com/v3.1/name/{pais_encoded}?fullText={full_text}"
         response = fazer_requisicao_com_retry(url)
 
-        if response and response.status_code == 200:
+        if response is not None and response.status_code == 200:
             data = response.json()
             resultado = extrair_dados_api(data[0])
-            cache_paises_api[pais_normalizado] = resultado
+            cache_paises_api.set(pais_normalizado, resultado)
             return resultado
 
-        # Valores de fallback caso a API não responda
-        return {
-            "media_30d": 0,
-            "maximo_6m": 0,
-            "capital": "N/A",
-            "subregion": "N/A",
-            "currency": "N/A",
-            "density": 0
-        }
+        if response is None or response.status_code != 404:
+            nao_encontrado = False
+
+    resultado = dados_fallback()
+    if nao_encontrado:
+        # A API não conhece o nome: guarda a falha com um TTL curto
+        cache_negativa_api.set(pais_normalizado, resultado)
+    return resultado
+
+
+def consultar_api_externa(pais: str) -> dict:
+    """
+    Consulta a REST Countries API para obter dados adicionais de um país.
+    """
+    try:
+        # Normaliza o nome do país recebido
+        pais_normalizado = normalizar_nome_pais(pais)
+
+        # Procura primeiro no snapshot local de referência (sem rede)
+        resultado_referencia = referencia_paises.procurar(pais)
+        if resultado_referencia is not None:
+            return resultado_referencia
+
+        # Verifica se o país já está em cache
+        resultado_cache = cache_paises_api.get(pais_normalizado)
+        if resultado_cache is not None:
+            return resultado_cache
+
+        # Verifica se o país falhou recentemente
+        resultado_negativo = cache_negativa_api.get(pais_normalizado)
+        if resultado_negativo is not None:
+            return resultado_negativo
+
+        # Apenas um pedido à rede por nome normalizado de cada vez
+        return chamadas_api.executar(
+            pais_normalizado,
+            lambda: consultar_api_rede(pais_normalizado)
+        )
 
     except Exception as e:
         # Fallback em caso de erro inesperado
         print(f"Erro ao consultar API externa para {pais}: {e}")
-        return {
-            "media_30d": 0,
-            "maximo_6m": 0,
-            "capital": "N/A",
-            "subregion": "N/A",
-            "currency": "N/A",
-            "density": 0
-        }
+        return dados_fallback()
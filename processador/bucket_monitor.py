@@ -1,13 +1,105 @@
+import hashlib
+import tempfile
+import threading
+from typing import BinaryIO, List, Optional, Tuple
+from urllib.parse import quote
 from supabase import create_client, Client
-from config import SUPABASE_URL, SUPABASE_KEY, SUPABASE_BUCKET, MAX_ARQUIVOS_BUCKET
+from config import (
+    SUPABASE_URL, SUPABASE_KEY, SUPABASE_BUCKET, MAX_ARQUIVOS_BUCKET,
+    SPOOL_MAX_MEMORIA, DOWNLOAD_TAMANHO_BLOCO,
+    POLL_INTERVALO_MIN, POLL_INTERVALO_MAX
+)
+from http_client import cliente_http
+from registo_ficheiros import registo_ficheiros, ESTADO_PROCESSADO
 
-# Conjunto para guardar os ficheiros já processados
-arquivos_processados = set()
+
+class IntervaloAdaptativo:
+    """
+    Intervalo de verificação do bucket que duplica enquanto o bucket está
+    inativo (até ao máximo) e volta ao mínimo quando há novos ficheiros.
+    Pode ser interrompido por um evento (por exemplo, uma notificação do Storage).
+    """
+
+    def __init__(self, minimo: float = POLL_INTERVALO_MIN, maximo: float = POLL_INTERVALO_MAX):
+        self.minimo = minimo
+        self.maximo = maximo
+        self.atual = minimo
+        self._evento = threading.Event()
+
+    def atualizar(self, houve_atividade: bool) -> float:
+        """
+        Calcula o próximo intervalo consoante a última verificação encontrou ficheiros.
+        """
+        if houve_atividade:
+            self.atual = self.minimo
+        else:
+            self.atual = min(self.maximo, self.atual * 2)
+        return self.atual
+
+    def sinalizar(self):
+        """
+        Acorda a espera atual e repõe o intervalo mínimo.
+        """
+        self.atual = self.minimo
+        self._evento.set()
+
+    def esperar(self) -> bool:
+        """
+        Espera o intervalo atual. Devolve True se foi acordado por um evento.
+        """
+        acordado = self._evento.wait(self.atual)
+        self._evento.clear()
+        return acordado
+
+
+# Intervalo partilhado entre o loop de monitorização e o endpoint de eventos
+intervalo_monitorizacao = IntervaloAdaptativo()
+
+
+def metadados_arquivo(arquivo: dict) -> dict:
+    """
+    Extrai nome, tamanho, etag e data de atualização de uma entrada da listagem do bucket.
+    """
+    metadata = arquivo.get('metadata') or {}
+    return {
+        "nome": arquivo['name'],
+        "tamanho": metadata.get('size', metadata.get('contentLength')),
+        "etag": (metadata.get('eTag') or metadata.get('etag') or '').strip('"'),
+        "atualizado_em": arquivo.get('updated_at') or metadata.get('lastModified')
+    }
 
 
-def monitorizar_bucket():
+def arquivo_inalterado(metadados: dict) -> bool:
+    """
+    Verifica no registo se o ficheiro já foi processado sem ser descarregado:
+    mesmo nome com mesmo etag/tamanho/data, ou mesmo conteúdo (etag) com outro nome.
+    Um ficheiro ainda pendente (enviado sem resposta) conta como não processado.
+    """
+    registo = registo_ficheiros.procurar(metadados["nome"])
+    if registo and registo["estado"] == ESTADO_PROCESSADO:
+        if metadados["etag"] and registo["etag"] == metadados["etag"]:
+            return True
+        if (not metadados["etag"] and registo["tamanho"] == metadados["tamanho"]
+                and registo["atualizado_em"] == metadados["atualizado_em"]):
+            return True
+
+    # Conteúdo idêntico já processado com outro nome
+    original = registo_ficheiros.procurar_por_etag(metadados["etag"], metadados["tamanho"])
+    if original and original["nome"] != metadados["nome"]:
+        print(f"Arquivo {metadados['nome']} identico a {original['nome']} (etag), ignorado")
+        registo_ficheiros.registar(
+            metadados["nome"], metadados["tamanho"], metadados["etag"],
+            metadados["atualizado_em"], original["hash_conteudo"],
+            duplicado_de=original["nome"]
+        )
+        return True
+
+    return False
+
+
+def monitorizar_bucket() -> List[dict]:
     """
-    Verifica o bucket do Supabase e devolve os CSV ainda não processados.
+    Verifica o bucket do Supabase e devolve os metadados dos CSV ainda não processados.
     """
     try:
         # Cria o cliente Supabase
@@ -18,10 +110,14 @@ def monitorizar_bucket():
 
         novos_arquivos = []
 
-        # Filtra apenas ficheiros CSV ainda não processados
+        # Filtra apenas ficheiros CSV novos ou alterados desde o último processamento
         for arquivo in arquivos:
-            if arquivo['name'].endswith('.csv') and arquivo['name'] not in arquivos_processados:
-                novos_arquivos.append(arquivo['name'])
+            if not arquivo['name'].endswith('.csv'):
+                continue
+
+            metadados = metadados_arquivo(arquivo)
+            if not arquivo_inalterado(metadados):
+                novos_arquivos.append(metadados)
 
         return novos_arquivos
 
@@ -30,11 +126,55 @@ def monitorizar_bucket():
         return []
 
 
-def marcar_processado(nome_arquivo: str):
+def descarregar_arquivo(nome_arquivo: str) -> Tuple[BinaryIO, str]:
+    """
+    Descarrega um ficheiro do bucket em blocos para um ficheiro temporário
+    (em memória até SPOOL_MAX_MEMORIA, depois em disco).
+    Devolve o ficheiro posicionado no início, pronto a ser lido pelo CSV reader,
+    e o hash SHA-256 do conteúdo (calculado durante o download).
+    """
+    # Endpoint REST do Supabase Storage para o objeto
+    url = f"{SUPABASE_URL}storage/v1/object/{SUPABASE_BUCKET}/{quote(nome_arquivo)}"
+    headers = {
+        "Authorization": f"Bearer {SUPABASE_KEY}",
+        "apikey": SUPABASE_KEY
+    }
+
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORIA)
+    hash_conteudo = hashlib.sha256()
+    try:
+        with cliente_http.get(url, headers=headers, stream=True, timeout=60) as response:
+            response.raise_for_status()
+            for bloco in response.iter_content(chunk_size=DOWNLOAD_TAMANHO_BLOCO):
+                spool.write(bloco)
+                hash_conteudo.update(bloco)
+
+        spool.seek(0)
+        return spool, hash_conteudo.hexdigest()
+
+    except Exception:
+        spool.close()
+        raise
+
+
+def marcar_processado(nome_arquivo: str, metadados: Optional[dict], hash_conteudo: str,
+                      duplicado_de: Optional[str] = None, id_requisicao: Optional[str] = None,
+                      estado: str = ESTADO_PROCESSADO):
     """
-    Marca um ficheiro CSV como já processado.
+    Marca um ficheiro CSV como já processado (ou pendente) no registo persistente.
+    O id da requisição permite confirmar a marca ou desfazê-la se o webhook trouxer um erro.
     """
-    arquivos_processados.add(nome_arquivo)
+    metadados = metadados or {}
+    registo_ficheiros.registar(
+        nome_arquivo,
+        metadados.get("tamanho"),
+        metadados.get("etag", ""),
+        metadados.get("atualizado_em"),
+        hash_conteudo,
+        duplicado_de=duplicado_de,
+        id_requisicao=id_requisicao,
+        estado=estado
+    )
 
 
 def gerenciar_fifo():
@@ -58,7 +198,6 @@ def gerenciar_fifo():
             try:
                 supabase.storage.from_(SUPABASE_BUCKET).remove([arquivo_para_remover])
                 print(f"FIFO: Arquivo removido do bucket: {arquivo_para_remover}")
-                arquivos_processados.discard(arquivo_para_remover)
 
             except Exception as e:
                 print(f"Aviso: Nao foi possivel remover arquivo: {e}")
@@ -0,0 +1,281 @@
+import atexit
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional
+from config import CACHE_BACKEND, CACHE_DB_PATH, CACHE_TTL, CACHE_MAX_ENTRADAS, CACHE_INTERVALO_ACESSOS
+
+
+class CacheMemoria:
+    """
+    Cache em memória com TTL por entrada e limite de tamanho (LRU).
+    """
+
+    def __init__(self, ttl: float = CACHE_TTL, max_entradas: int = CACHE_MAX_ENTRADAS):
+        self.ttl = ttl
+        self.max_entradas = max_entradas
+        self._lock = threading.RLock()
+
+        # chave -> (valor, expira_em); a ordem reflete o uso mais recente
+        self._entradas = OrderedDict()
+
+        # Contadores para as estatísticas
+        self.hits = 0
+        self.misses = 0
+        self.expiradas = 0
+        self.removidas_lru = 0
+
+    def get(self, chave: str) -> Optional[dict]:
+        """
+        Devolve o valor em cache ou None se não existir ou tiver expirado.
+        """
+        with self._lock:
+            entrada = self._entradas.get(chave)
+            if entrada is None:
+                self.misses += 1
+                return None
+
+            valor, expira_em = entrada
+            if expira_em <= time.time():
+                self._remover(chave)
+                self.expiradas += 1
+                self.misses += 1
+                return None
+
+            self._entradas.move_to_end(chave)
+            self._registar_acesso(chave)
+            self.hits += 1
+            return valor
+
+    def set(self, chave: str, valor: dict, ttl: Optional[float] = None):
+        """
+        Guarda um valor na cache com o TTL indicado (ou o TTL por omissão).
+        """
+        expira_em = time.time() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entradas[chave] = (valor, expira_em)
+            self._entradas.move_to_end(chave)
+            self._guardar(chave, valor, expira_em)
+
+            # Remove as entradas menos usadas quando o limite é ultrapassado
+            while len(self._entradas) > self.max_entradas:
+                chave_antiga, _ = self._entradas.popitem(last=False)
+                self._remover(chave_antiga)
+                self.removidas_lru += 1
+
+    def clear(self) -> int:
+        """
+        Limpa a cache e devolve o número de entradas removidas.
+        """
+        with self._lock:
+            total = len(self._entradas)
+            self._entradas.clear()
+            self._limpar()
+            return total
+
+    def keys(self) -> List[str]:
+        with self._lock:
+            return list(self._entradas.keys())
+
+    def __len__(self):
+        return len(self._entradas)
+
+    def stats(self) -> dict:
+        """
+        Devolve estatísticas de utilização da cache.
+        """
+        with self._lock:
+            return {
+                "backend": type(self).__name__,
+                "entradas": len(self._entradas),
+                "max_entradas": self.max_entradas,
+                "ttl_segundos": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "expiradas": self.expiradas,
+                "removidas_lru": self.removidas_lru
+            }
+
+    def fechar(self):
+        """
+        Liberta os recursos da cache (nada a fazer em memória).
+        """
+        pass
+
+    # Pontos de extensão para backends persistentes
+    def _guardar(self, chave: str, valor: dict, expira_em: float):
+        pass
+
+    def _remover(self, chave: str):
+        self._entradas.pop(chave, None)
+
+    def _registar_acesso(self, chave: str):
+        pass
+
+    def _limpar(self):
+        pass
+
+
+class CacheSQLite(CacheMemoria):
+    """
+    Cache persistida num ficheiro SQLite local.
+    As entradas válidas são carregadas para memória no arranque (warm start)
+    e cada escrita é replicada para o disco. Os acessos (ordem LRU) são
+    gravados em conjunto a cada intervalo_acessos segundos e ao fechar.
+    """
+
+    def __init__(self, caminho: str = CACHE_DB_PATH, ttl: float = CACHE_TTL,
+                 max_entradas: int = CACHE_MAX_ENTRADAS, tabela: str = "cache_paises",
+                 intervalo_acessos: float = CACHE_INTERVALO_ACESSOS):
+        super().__init__(ttl, max_entradas)
+        self.caminho = caminho
+        self.tabela = tabela
+        self.intervalo_acessos = intervalo_acessos
+
+        # Acessos ainda não gravados no disco (evita uma escrita por hit)
+        self._acessos_pendentes = {}
+        self._fechada = threading.Event()
+
+        pasta = os.path.dirname(caminho)
+        if pasta:
+            os.makedirs(pasta, exist_ok=True)
+
+        self._conn = sqlite3.connect(caminho, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS {self.tabela} (
+                chave TEXT PRIMARY KEY,
+                valor TEXT NOT NULL,
+                expira_em REAL NOT NULL,
+                acedido_em REAL NOT NULL
+            )
+            """
+        )
+        self._conn.commit()
+        self._carregar()
+
+        # Grava periodicamente os acessos, mesmo que não haja novas escritas
+        if self.intervalo_acessos > 0:
+            threading.Thread(
+                target=self._loop_acessos, name=f"cache-{self.tabela}", daemon=True
+            ).start()
+        atexit.register(self.fechar)
+
+    def _carregar(self):
+        """
+        Carrega as entradas não expiradas, das menos para as mais usadas.
+        """
+        with self._lock:
+            agora = time.time()
+            self._conn.execute(f"DELETE FROM {self.tabela} WHERE expira_em <= ?", (agora,))
+            linhas = self._conn.execute(
+                f"""
+                SELECT chave, valor, expira_em FROM (
+                    SELECT chave, valor, expira_em, acedido_em FROM {self.tabela}
+                    ORDER BY acedido_em DESC LIMIT ?
+                ) ORDER BY acedido_em ASC
+                """,
+                (self.max_entradas,)
+            ).fetchall()
+
+            for chave, valor, expira_em in linhas:
+                self._entradas[chave] = (json.loads(valor), expira_em)
+
+            # Remove do disco o que já não cabe no limite
+            self._conn.execute(
+                f"""
+                DELETE FROM {self.tabela} WHERE chave NOT IN (
+                    SELECT chave FROM {self.tabela} ORDER BY acedido_em DESC LIMIT ?
+                )
+                """,
+                (self.max_entradas,)
+            )
+            self._conn.commit()
+
+        print(f"Cache {self.tabela} carregada de {self.caminho}: {len(linhas)} entradas")
+
+    def _guardar(self, chave: str, valor: dict, expira_em: float):
+        agora = time.time()
+        self._acessos_pendentes.pop(chave, None)
+        self._conn.execute(
+            f"INSERT OR REPLACE INTO {self.tabela} (chave, valor, expira_em, acedido_em) VALUES (?, ?, ?, ?)",
+            (chave, json.dumps(valor), expira_em, agora)
+        )
+        self._gravar_acessos()
+        self._conn.commit()
+
+    def _remover(self, chave: str):
+        super()._remover(chave)
+        self._acessos_pendentes.pop(chave, None)
+        self._conn.execute(f"DELETE FROM {self.tabela} WHERE chave = ?", (chave,))
+        self._conn.commit()
+
+    def _registar_acesso(self, chave: str):
+        self._acessos_pendentes[chave] = time.time()
+
+    def _gravar_acessos(self):
+        if self._acessos_pendentes:
+            self._conn.executemany(
+                f"UPDATE {self.tabela} SET acedido_em = ? WHERE chave = ?",
+                [(acedido_em, chave) for chave, acedido_em in self._acessos_pendentes.items()]
+            )
+            self._acessos_pendentes.clear()
+
+    def _loop_acessos(self):
+        while not self._fechada.wait(self.intervalo_acessos):
+            self.gravar_acessos()
+
+    def gravar_acessos(self):
+        """
+        Grava no disco os acessos pendentes, para que o próximo arranque
+        mantenha a ordem LRU mesmo numa execução só com leituras.
+        """
+        with self._lock:
+            if self._fechada.is_set() or not self._acessos_pendentes:
+                return
+            try:
+                self._gravar_acessos()
+                self._conn.commit()
+            except sqlite3.Error as e:
+                print(f"Aviso: Nao foi possivel gravar os acessos da cache {self.tabela}: {e}")
+
+    def fechar(self):
+        """
+        Grava os acessos pendentes e fecha a ligação ao ficheiro SQLite.
+        """
+        self.gravar_acessos()
+        with self._lock:
+            if self._fechada.is_set():
+                return
+            self._fechada.set()
+            self._conn.close()
+        atexit.unregister(self.fechar)
+
+    def _limpar(self):
+        self._acessos_pendentes.clear()
+        self._conn.execute(f"DELETE FROM {self.tabela}")
+        self._conn.commit()
+
+    def stats(self) -> dict:
+        estatisticas = super().stats()
+        estatisticas["caminho"] = self.caminho
+        estatisticas["tabela"] = self.tabela
+        return estatisticas
+
+
+def criar_cache(tabela: str = "cache_paises", ttl: float = CACHE_TTL,
+                backend: str = CACHE_BACKEND) -> CacheMemoria:
+    """
+    Cria a cache configurada (sqlite ou memoria).
+    Se o ficheiro SQLite não puder ser aberto, usa a cache em memória.
+    """
+    if backend == "sqlite":
+        try:
+            return CacheSQLite(ttl=ttl, tabela=tabela)
+        except Exception as e:
+            print(f"Aviso: Nao foi possivel abrir a cache SQLite ({e}), a usar cache em memoria")
+    return CacheMemoria(ttl=ttl)
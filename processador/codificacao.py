@@ -0,0 +1,353 @@
+"""
+Codificação dos dados enviados entre o Processador e o XML Service.
+Este módulo é igual no Processador e no XML Service.
+"""
+import json
+import struct
+import sys
+import zlib
+from array import array
+from typing import BinaryIO, Dict, List, Tuple
+
+# Codecs de compressão opcionais (usados apenas se estiverem instalados)
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Codificações suportadas para o payload (valor guardado nas flags da frame)
+CODIFICACAO_JSON = 0
+CODIFICACAO_COLUNAR = 1
+CODIFICACAO_COLUNAR_BLOCOS = 2
+
+NOMES_CODIFICACOES = {
+    "json": CODIFICACAO_JSON,
+    "colunar": CODIFICACAO_COLUNAR,
+    "colunar_blocos": CODIFICACAO_COLUNAR_BLOCOS
+}
+
+# Registos por bloco no formato colunar em blocos
+REGISTOS_POR_BLOCO_COLUNAR = 1000
+
+# Compressão do payload (valor guardado nos 4 bits altos das flags da frame)
+COMPRESSAO_NENHUMA = 0
+COMPRESSAO_ZLIB = 1
+COMPRESSAO_ZSTD = 2
+
+# Tamanho dos blocos usados na compressão/descompressão em streaming
+TAMANHO_BLOCO_COMPRESSAO = 64 * 1024
+
+# Tipos de coluna do formato colunar
+TIPO_TEXTO = "s"
+TIPO_INTEIRO = "q"
+TIPO_DECIMAL = "d"
+TIPO_JSON = "j"
+
+U32 = struct.Struct("<I")
+
+# Os arrays são sempre escritos em little-endian
+_TROCAR_BYTES = sys.byteorder == "big"
+
+
+def _array_bytes(valores: array) -> bytes:
+    if _TROCAR_BYTES:
+        valores = array(valores.typecode, valores)
+        valores.byteswap()
+    return valores.tobytes()
+
+
+def _array_de_bytes(typecode: str, dados) -> array:
+    valores = array(typecode)
+    valores.frombytes(dados)
+    if _TROCAR_BYTES:
+        valores.byteswap()
+    return valores
+
+
+def _tipo_valor(valor) -> str:
+    # bool é subclasse de int, mas tem de manter o tipo original
+    if isinstance(valor, str):
+        return TIPO_TEXTO
+    if isinstance(valor, int) and not isinstance(valor, bool) and -2**63 <= valor < 2**63:
+        return TIPO_INTEIRO
+    if isinstance(valor, float):
+        return TIPO_DECIMAL
+    return TIPO_JSON
+
+
+class Coluna:
+    """
+    Valores de uma chave de todos os registos, guardados num array tipado.
+    Passa para JSON se aparecerem valores de tipos diferentes.
+    """
+
+    def __init__(self, nome: str, linhas_anteriores: int):
+        self.nome = nome
+        self.tipo = None
+        self.valores = []
+
+        # Presença da chave em cada registo (só guardada se faltar em algum)
+        self.presenca = bytearray(linhas_anteriores) if linhas_anteriores else None
+
+    def adicionar(self, valor):
+        tipo = _tipo_valor(valor)
+        if self.tipo is None:
+            self.tipo = tipo
+            self.valores = array(tipo) if tipo in (TIPO_INTEIRO, TIPO_DECIMAL) else []
+        elif tipo != self.tipo and self.tipo != TIPO_JSON:
+            # Tipos misturados: mantém os valores originais numa lista JSON
+            self.tipo = TIPO_JSON
+            self.valores = list(self.valores)
+
+        self.valores.append(valor)
+        if self.presenca is not None:
+            self.presenca.append(1)
+
+    def faltar(self):
+        if self.presenca is None:
+            self.presenca = bytearray(b"\x01" * len(self.valores))
+        self.presenca.append(0)
+
+    def escrever(self, destino: BinaryIO):
+        if self.presenca is not None:
+            destino.write(self.presenca)
+
+        if self.tipo in (TIPO_INTEIRO, TIPO_DECIMAL):
+            destino.write(_array_bytes(self.valores))
+        elif self.tipo == TIPO_TEXTO:
+            # Comprimentos em caracteres + todos os textos concatenados
+            destino.write(_array_bytes(array("I", map(len, self.valores))))
+            texto = "".join(self.valores).encode("utf-8")
+            destino.write(U32.pack(len(texto)))
+            destino.write(texto)
+        else:
+            blob = json.dumps(self.valores).encode("utf-8")
+            destino.write(U32.pack(len(blob)))
+            destino.write(blob)
+
+
+class CodificadorColunar:
+    """
+    Acumula registos por coluna (chaves enviadas uma única vez,
+    valores em arrays tipados) e escreve o payload colunar.
+    """
+
+    def __init__(self, envelope: dict):
+        self.envelope = envelope
+        self.colunas: Dict[str, Coluna] = {}
+        self.total = 0
+
+    def adicionar(self, dado: dict):
+        for nome, valor in dado.items():
+            coluna = self.colunas.get(nome)
+            if coluna is None:
+                coluna = self.colunas[nome] = Coluna(nome, self.total)
+            coluna.adicionar(valor)
+
+        # Chaves que este registo não tem
+        if len(dado) != len(self.colunas):
+            for nome, coluna in self.colunas.items():
+                if nome not in dado:
+                    coluna.faltar()
+
+        self.total += 1
+
+    def escrever(self, destino: BinaryIO):
+        envelope = {
+            **self.envelope,
+            "total": self.total,
+            "colunas": [
+                [coluna.nome, coluna.tipo or TIPO_JSON, coluna.presenca is not None]
+                for coluna in self.colunas.values()
+            ]
+        }
+        envelope_bytes = json.dumps(envelope).encode("utf-8")
+        destino.write(U32.pack(len(envelope_bytes)))
+        destino.write(envelope_bytes)
+
+        for coluna in self.colunas.values():
+            coluna.escrever(destino)
+
+
+class EscritorColunarBlocos:
+    """
+    Escreve o payload colunar em blocos de `registos_por_bloco` registos.
+    Cada bloco tem o formato colunar completo (só o primeiro leva o envelope)
+    e é escrito no destino assim que fica cheio: a memória usada depende
+    do tamanho do bloco e não do número de registos.
+    """
+
+    def __init__(self, envelope: dict, destino: BinaryIO, registos_por_bloco: int = REGISTOS_POR_BLOCO_COLUNAR):
+        self.destino = destino
+        self.registos_por_bloco = max(1, registos_por_bloco)
+        self.total = 0
+        self.blocos = 0
+        self._bloco = CodificadorColunar(envelope)
+
+    def _escrever_bloco(self):
+        self._bloco.escrever(self.destino)
+        self.blocos += 1
+        self._bloco = CodificadorColunar({})
+
+    def adicionar(self, dado: dict):
+        self._bloco.adicionar(dado)
+        self.total += 1
+        if self._bloco.total >= self.registos_por_bloco:
+            self._escrever_bloco()
+
+    def concluir(self):
+        """
+        Escreve o último bloco (ou um bloco vazio com o envelope, se não houve registos).
+        """
+        if self._bloco.total or not self.blocos:
+            self._escrever_bloco()
+
+
+def _descodificar_bloco_colunar(vista: memoryview, posicao: int) -> Tuple[dict, int]:
+    # Lê o bloco que começa em `posicao`; devolve a mensagem do bloco e a posição seguinte
+    def ler(tamanho: int) -> memoryview:
+        nonlocal posicao
+        bloco = vista[posicao:posicao + tamanho]
+        if len(bloco) != tamanho:
+            raise ValueError("Payload colunar truncado")
+        posicao += tamanho
+        return bloco
+
+    tamanho_envelope, = U32.unpack(ler(4))
+    mensagem = json.loads(bytes(ler(tamanho_envelope)).decode("utf-8"))
+    total = mensagem.pop("total")
+    definicoes = mensagem.pop("colunas")
+
+    nomes = []
+    colunas = []
+    presencas = []
+    for nome, tipo, tem_presenca in definicoes:
+        presenca = bytes(ler(total)) if tem_presenca else None
+        quantidade = presenca.count(1) if presenca is not None else total
+
+        if tipo in (TIPO_INTEIRO, TIPO_DECIMAL):
+            valores = _array_de_bytes(tipo, ler(quantidade * 8)).tolist()
+        elif tipo == TIPO_TEXTO:
+            comprimentos = _array_de_bytes("I", ler(quantidade * 4))
+            tamanho_texto, = U32.unpack(ler(4))
+            texto = str(ler(tamanho_texto), "utf-8")
+            valores = []
+            inicio = 0
+            for comprimento in comprimentos:
+                valores.append(texto[inicio:inicio + comprimento])
+                inicio += comprimento
+        else:
+            tamanho_blob, = U32.unpack(ler(4))
+            valores = json.loads(str(ler(tamanho_blob), "utf-8"))
+
+        nomes.append(nome)
+        colunas.append(valores)
+        presencas.append(presenca)
+
+    if not any(presenca is not None for presenca in presencas):
+        # Caso comum: todos os registos têm todas as chaves
+        if nomes:
+            mensagem["dados"] = [dict(zip(nomes, linha)) for linha in zip(*colunas)]
+        else:
+            mensagem["dados"] = [{} for _ in range(total)]
+        return mensagem, posicao
+
+    # Alguns registos não têm todas as chaves
+    dados: List[dict] = [{} for _ in range(total)]
+    for nome, valores, presenca in zip(nomes, colunas, presencas):
+        if presenca is None:
+            for dado, valor in zip(dados, valores):
+                dado[nome] = valor
+        else:
+            iterador = iter(valores)
+            for dado, presente in zip(dados, presenca):
+                if presente:
+                    dado[nome] = next(iterador)
+
+    mensagem["dados"] = dados
+    return mensagem, posicao
+
+
+def descodificar_colunar(payload) -> dict:
+    """
+    Reconstrói a mensagem (envelope + lista "dados" de dicionários)
+    a partir de um payload colunar com um ou mais blocos.
+    """
+    vista = memoryview(payload)
+    mensagem, posicao = _descodificar_bloco_colunar(vista, 0)
+
+    # Blocos seguintes: só registos, os campos do envelope vêm no primeiro
+    while posicao < len(vista):
+        bloco, posicao = _descodificar_bloco_colunar(vista, posicao)
+        mensagem["dados"].extend(bloco["dados"])
+
+    return mensagem
+
+
+def descodificar_mensagem(codificacao: int, payload) -> dict:
+    """
+    Descodifica o payload de um pedido de acordo com a codificação indicada na frame.
+    """
+    if codificacao == CODIFICACAO_JSON:
+        return json.loads(bytes(payload).decode("utf-8"))
+    if codificacao in (CODIFICACAO_COLUNAR, CODIFICACAO_COLUNAR_BLOCOS):
+        return descodificar_colunar(payload)
+    raise ValueError(f"Codificacao desconhecida: {codificacao}")
+
+
+def _criar_compressor_zlib():
+    return zlib.compressobj(6)
+
+
+def _criar_descompressor_zlib():
+    return zlib.decompressobj()
+
+
+def _criar_compressor_zstd():
+    return zstandard.ZstdCompressor(level=3).compressobj()
+
+
+def _criar_descompressor_zstd():
+    return zstandard.ZstdDecompressor().decompressobj()
+
+
+# Codecs disponíveis: nome -> (id nas flags, compressor, descompressor)
+CODECS_COMPRESSAO = {
+    "zlib": (COMPRESSAO_ZLIB, _criar_compressor_zlib, _criar_descompressor_zlib)
+}
+if zstandard is not None:
+    CODECS_COMPRESSAO["zstd"] = (COMPRESSAO_ZSTD, _criar_compressor_zstd, _criar_descompressor_zstd)
+
+_DESCOMPRESSORES = {codigo: descompressor for codigo, _, descompressor in CODECS_COMPRESSAO.values()}
+
+
+def comprimir_ficheiro(origem: BinaryIO, destino: BinaryIO, nome_codec: str) -> int:
+    """
+    Comprime o conteúdo de origem para destino, bloco a bloco.
+    Devolve o número de bytes escritos.
+    """
+    _, criar_compressor, _ = CODECS_COMPRESSAO[nome_codec]
+    compressor = criar_compressor()
+    escritos = 0
+
+    while True:
+        bloco = origem.read(TAMANHO_BLOCO_COMPRESSAO)
+        if not bloco:
+            break
+        comprimido = compressor.compress(bloco)
+        if comprimido:
+            escritos += destino.write(comprimido)
+
+    escritos += destino.write(compressor.flush())
+    return escritos
+
+
+def criar_descompressor(codigo: int):
+    """
+    Devolve um descompressor em streaming (métodos decompress/flush)
+    para o codec indicado nas flags da frame.
+    """
+    criar = _DESCOMPRESSORES.get(codigo)
+    if criar is None:
+        raise ValueError(f"Compressao desconhecida: {codigo}")
+    return criar()
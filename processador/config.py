@@ -15,9 +15,129 @@ XML_SERVICE_HOST = os.getenv("XML_SERVICE_HOST", "xml-service")
 # Porta do XML Service
 XML_SERVICE_PORT = int(os.getenv("XML_SERVICE_PORT", "8888"))
 
+# Número de ligações persistentes mantidas com o XML Service
+XML_SERVICE_POOL = int(os.getenv("XML_SERVICE_POOL", "2"))
+
+# Tempo máximo de espera pela resposta de um pedido ao XML Service (segundos)
+XML_SERVICE_TIMEOUT = float(os.getenv("XML_SERVICE_TIMEOUT", "120"))
+
+# Intervalo entre verificações (PING) das ligações ao XML Service (segundos)
+XML_SERVICE_PING_INTERVALO = float(os.getenv("XML_SERVICE_PING_INTERVALO", "30"))
+
+# Codificação dos dados enviados ao XML Service ("colunar", enviado em blocos, ou "json")
+XML_SERVICE_CODIFICACAO = os.getenv("XML_SERVICE_CODIFICACAO", "colunar")
+
+# Compressão das mensagens enviadas ao XML Service ("zlib", "zstd" ou "" para desativar)
+XML_SERVICE_COMPRESSAO = os.getenv("XML_SERVICE_COMPRESSAO", "zlib")
+
+# Tamanho mínimo (bytes) a partir do qual as mensagens são comprimidas
+COMPRESSAO_MINIMO = int(os.getenv("COMPRESSAO_MINIMO", str(16 * 1024)))
+
+# Modo dos pedidos ao XML Service: "assincrono" (resposta imediata, resultado por webhook),
+# "sincrono" ou "streaming" (registos enviados em lotes, XML criado à medida que chegam)
+XML_SERVICE_MODO = os.getenv("XML_SERVICE_MODO", "assincrono")
+
+# Número de registos por lote nos envios em streaming
+XML_SERVICE_TAMANHO_LOTE = int(os.getenv("XML_SERVICE_TAMANHO_LOTE", "1000"))
+
+# Tentativas extra quando o XML Service responde "OCUPADO" (com espera exponencial)
+XML_SERVICE_TENTATIVAS_OCUPADO = int(os.getenv("XML_SERVICE_TENTATIVAS_OCUPADO", "5"))
+
+# Tamanho máximo (bytes) de uma frame/mensagem recebida por socket
+TAMANHO_MAX_FRAME = int(os.getenv("TAMANHO_MAX_FRAME", str(256 * 1024 * 1024)))
+
 # URL do webhook usado para notificações
 WEBHOOK_URL = os.getenv("WEBHOOK_URL", "http://processador:5001/webhook")
 
+# Número máximo de consultas simultâneas à API externa
+API_MAX_WORKERS = int(os.getenv("API_MAX_WORKERS", "8"))
+
+# Limite de pedidos por segundo à API externa (0 = sem limite)
+API_RATE_LIMIT = float(os.getenv("API_RATE_LIMIT", "10"))
+
+# Pasta para os dados locais persistentes (cache, registos)
+DATA_DIR = os.getenv("DATA_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data"))
+
+# Ficheiro SQLite com o registo dos ficheiros já processados
+REGISTO_DB_PATH = os.getenv("REGISTO_DB_PATH", os.path.join(DATA_DIR, "registo_ficheiros.db"))
+
+# Backend da cache da API externa ("sqlite" ou "memoria")
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "sqlite")
+
+# Ficheiro SQLite da cache da API externa
+CACHE_DB_PATH = os.getenv("CACHE_DB_PATH", os.path.join(DATA_DIR, "cache_paises.db"))
+
+# Tempo de vida de cada entrada da cache (segundos, 7 dias por omissão)
+CACHE_TTL = float(os.getenv("CACHE_TTL", str(7 * 24 * 3600)))
+
+# Tempo de vida na cache negativa dos nomes que a API não conhece (404, segundos)
+CACHE_TTL_NEGATIVO = float(os.getenv("CACHE_TTL_NEGATIVO", "900"))
+
+# Número máximo de entradas na cache (as menos usadas são removidas)
+CACHE_MAX_ENTRADAS = int(os.getenv("CACHE_MAX_ENTRADAS", "5000"))
+
+# Intervalo máximo (segundos) até os acessos à cache (ordem LRU) serem gravados em disco
+CACHE_INTERVALO_ACESSOS = float(os.getenv("CACHE_INTERVALO_ACESSOS", "30"))
+
+# Ativa o modo de referência offline (snapshot local de todos os países)
+REFERENCIA_ATIVA = os.getenv("REFERENCIA_ATIVA", "true").lower() == "true"
+
+# Ficheiro JSON com o snapshot de todos os países (formato da REST Countries API)
+REFERENCIA_SNAPSHOT_PATH = os.getenv("REFERENCIA_SNAPSHOT_PATH", os.path.join(DATA_DIR, "paises_snapshot.json"))
+
+# URL da exportação completa usada para atualizar o snapshot
+REFERENCIA_URL = os.getenv(
+    "REFERENCIA_URL",
+    "https://restcountries.com/v3.1/all?fields=name,altSpellings,area,population,capital,subregion,currencies"
+)
+
+# Intervalo entre atualizações do snapshot (segundos, 24 horas por omissão)
+REFERENCIA_INTERVALO = float(os.getenv("REFERENCIA_INTERVALO", str(24 * 3600)))
+
+# Número de hosts com pool de ligações HTTP mantido em simultâneo
+HTTP_POOL_HOSTS = int(os.getenv("HTTP_POOL_HOSTS", "4"))
+
+# Número máximo de ligações HTTP abertas por host
+HTTP_POOL_POR_HOST = int(os.getenv("HTTP_POOL_POR_HOST", "8"))
+
+# Timeout por omissão dos pedidos HTTP (segundos)
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "15"))
+
+# Número de linhas do CSV processadas (enriquecidas e serializadas) por lote
+CSV_TAMANHO_LOTE = int(os.getenv("CSV_TAMANHO_LOTE", "500"))
+
+# Bytes da mensagem mantidos em memória antes de passar para ficheiro temporário
+SPOOL_MAX_MEMORIA = int(os.getenv("SPOOL_MAX_MEMORIA", str(8 * 1024 * 1024)))
+
+# Tamanho dos blocos lidos ao descarregar ficheiros do bucket
+DOWNLOAD_TAMANHO_BLOCO = int(os.getenv("DOWNLOAD_TAMANHO_BLOCO", str(1024 * 1024)))
+
+# Intervalo mínimo e máximo entre verificações do bucket (segundos);
+# o intervalo duplica enquanto não aparecem ficheiros novos
+POLL_INTERVALO_MIN = float(os.getenv("POLL_INTERVALO_MIN", "10"))
+POLL_INTERVALO_MAX = float(os.getenv("POLL_INTERVALO_MAX", "300"))
+
+# Token partilhado exigido nas notificações do Storage (vazio = sem verificação)
+EVENTOS_TOKEN = os.getenv("EVENTOS_TOKEN", "")
+
+# Número de ficheiros processados em paralelo
+PROCESSADOR_WORKERS = int(os.getenv("PROCESSADOR_WORKERS", "2"))
+
+# Número máximo de ficheiros à espera na fila de processamento
+FILA_MAX_ARQUIVOS = int(os.getenv("FILA_MAX_ARQUIVOS", "20"))
+
+# Número máximo de pedidos ao XML Service acompanhados em simultâneo
+PEDIDOS_MAX_EM_CURSO = int(os.getenv("PEDIDOS_MAX_EM_CURSO", "10000"))
+
+# Número de pedidos concluídos guardados para calcular latências e débito
+PEDIDOS_AMOSTRAS = int(os.getenv("PEDIDOS_AMOSTRAS", "1000"))
+
+# Janela (segundos) usada para calcular o débito
+PEDIDOS_JANELA_DEBITO = int(os.getenv("PEDIDOS_JANELA_DEBITO", "300"))
+
+# Tempo (segundos) sem webhook a partir do qual um pedido é considerado preso
+PEDIDOS_LIMITE_PRESO = int(os.getenv("PEDIDOS_LIMITE_PRESO", "600"))
+
 # Número máximo de ficheiros CSV no bucket
 MAX_ARQUIVOS_BUCKET = 3
 
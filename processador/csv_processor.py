@@ -1,25 +1,45 @@
 import csv
 import io
-import time
 import re
-from typing import Dict, List
-from config import MAPPER
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Tuple, Union
+from config import MAPPER, API_MAX_WORKERS, CSV_TAMANHO_LOTE
 from api_client import consultar_api_externa
+from normalizacao_paises import normalizar_nome_pais
 
 
-def processar_csv_stream(csv_bytes: bytes) -> List[Dict]:
+def enriquecer_paises(paises: Iterable[str]) -> Dict[str, dict]:
     """
-    Processa um ficheiro CSV em memória e enriquece os dados com uma API externa.
+    Consulta a API externa uma única vez por país distinto, em paralelo.
+    Devolve um dicionário nome normalizado -> dados da API.
     """
-    # Lista onde serão guardados os dados finais processados
-    dados_processados = []
+    # Agrupa os nomes pelo nome normalizado (um pedido por país)
+    representantes = {}
+    for pais in paises:
+        chave = normalizar_nome_pais(pais)
+        if chave not in representantes:
+            representantes[chave] = pais
 
-    # Converte os bytes do CSV para um stream de texto
-    csv_io = io.TextIOWrapper(
-        io.BytesIO(csv_bytes),
-        encoding='utf-8-sig',
-        newline=''
-    )
+    if not representantes:
+        return {}
+
+    # Resolve os países distintos com um número limitado de threads
+    max_workers = max(1, min(API_MAX_WORKERS, len(representantes)))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        resultados = executor.map(consultar_api_externa, representantes.values())
+        return dict(zip(representantes.keys(), resultados))
+
+
+def ler_registos_csv(fonte: Union[bytes, BinaryIO]) -> Iterator[Tuple[Dict, str]]:
+    """
+    Lê o CSV linha a linha e devolve pares (dados mapeados, nome do país).
+    """
+    # Aceita os bytes do CSV ou um ficheiro binário já aberto
+    if isinstance(fonte, (bytes, bytearray)):
+        fonte = io.BytesIO(fonte)
+
+    # Converte o ficheiro binário para um stream de texto
+    csv_io = io.TextIOWrapper(fonte, encoding='utf-8-sig', newline='')
 
     # Lê o CSV como dicionários (chave = nome da coluna)
     reader = csv.DictReader(csv_io)
@@ -43,12 +63,21 @@ def processar_csv_stream(csv_bytes: bytes) -> List[Dict]:
             if match:
                 pais = match.group(1).replace("_", " ").strip()
 
-        # Consulta a API externa para enriquecer os dados
-        dados_api = consultar_api_externa(pais)
+        yield dado_mapeado, pais
+
+
+def enriquecer_lote(registos: List[Tuple[Dict, str]]) -> List[Dict]:
+    """
+    Enriquece um lote de registos com os dados da API externa.
+    """
+    # Consulta a API externa apenas para os países distintos do lote
+    dados_por_pais = enriquecer_paises(pais for _, pais in registos)
+
+    # Lista onde serão guardados os dados finais processados
+    dados_processados = []
 
-        # Pequena pausa para evitar excesso de pedidos à API
-        if len(dados_processados) % 10 == 0:
-            time.sleep(0.1)
+    for dado_mapeado, pais in registos:
+        dados_api = dados_por_pais[normalizar_nome_pais(pais)]
 
         # Combina os dados do CSV com os dados enriquecidos
         dado_final = {
@@ -61,8 +90,31 @@ def processar_csv_stream(csv_bytes: bytes) -> List[Dict]:
             "DensidadePopulacao": dados_api.get("density", 0)
         }
 
-        # Adiciona o registo processado à lista final
         dados_processados.append(dado_final)
 
-    # Devolve a lista de dados processados e enriquecidos
     return dados_processados
+
+
+def processar_csv_lotes(fonte: Union[bytes, BinaryIO],
+                        tamanho_lote: int = CSV_TAMANHO_LOTE) -> Iterator[List[Dict]]:
+    """
+    Processa o CSV em lotes de tamanho fixo: cada lote é lido, enriquecido
+    e devolvido antes de o seguinte ser lido, mantendo a memória constante.
+    """
+    lote = []
+    for registo in ler_registos_csv(fonte):
+        lote.append(registo)
+        if len(lote) >= tamanho_lote:
+            yield enriquecer_lote(lote)
+            lote = []
+
+    if lote:
+        yield enriquecer_lote(lote)
+
+
+def processar_csv_stream(csv_bytes: bytes) -> List[Dict]:
+    """
+    Processa um ficheiro CSV em memória e enriquece os dados com uma API externa.
+    """
+    # Devolve a lista de dados processados e enriquecidos
+    return [dado for lote in processar_csv_lotes(csv_bytes) for dado in lote]
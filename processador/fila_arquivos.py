@@ -0,0 +1,110 @@
+import queue
+import threading
+from typing import Callable, Optional
+from config import PROCESSADOR_WORKERS, FILA_MAX_ARQUIVOS
+
+
+class FilaArquivos:
+    """
+    Fila limitada de ficheiros a processar, consumida por um grupo de workers.
+    Cada ficheiro (por nome e por etag) só pode estar na fila ou em
+    processamento uma vez de cada vez.
+    """
+
+    def __init__(self, num_workers: int = PROCESSADOR_WORKERS, tamanho_max: int = FILA_MAX_ARQUIVOS):
+        self.num_workers = num_workers
+        self._fila = queue.Queue(maxsize=tamanho_max)
+        self._lock = threading.Lock()
+
+        # Chaves (nome e etag) dos ficheiros em fila ou em processamento
+        self._reclamados = set()
+        self._workers = []
+
+        # Contadores para as estatísticas
+        self.em_processamento = 0
+        self.processados = 0
+        self.rejeitados = 0
+
+    @staticmethod
+    def _chaves(nome: str, metadados: Optional[dict]) -> set:
+        chaves = {f"nome:{nome}"}
+        etag = (metadados or {}).get("etag")
+        if etag:
+            chaves.add(f"etag:{etag}")
+        return chaves
+
+    def enfileirar(self, nome: str, metadados: Optional[dict] = None, timeout: Optional[float] = None) -> bool:
+        """
+        Reclama o ficheiro e coloca-o na fila.
+        Devolve False se já estiver reclamado ou se a fila estiver cheia.
+        """
+        chaves = self._chaves(nome, metadados)
+        with self._lock:
+            if chaves & self._reclamados:
+                return False
+            self._reclamados |= chaves
+
+        try:
+            self._fila.put((nome, metadados), block=timeout is not None, timeout=timeout)
+            return True
+
+        except queue.Full:
+            # Fila cheia: liberta o ficheiro para ser tentado mais tarde
+            with self._lock:
+                self._reclamados -= chaves
+                self.rejeitados += 1
+            return False
+
+    def reclamado(self, nome: str, metadados: Optional[dict] = None) -> bool:
+        """
+        Indica se o ficheiro já está na fila ou em processamento.
+        """
+        with self._lock:
+            return bool(self._chaves(nome, metadados) & self._reclamados)
+
+    def iniciar(self, processar: Callable[[str, Optional[dict]], None]):
+        """
+        Inicia os workers que consomem a fila com a função indicada.
+        """
+        for _ in range(self.num_workers - len(self._workers)):
+            worker = threading.Thread(
+                target=self._loop_worker,
+                args=(processar,),
+                name=f"processador-worker-{len(self._workers) + 1}",
+                daemon=True
+            )
+            worker.start()
+            self._workers.append(worker)
+
+    def _loop_worker(self, processar: Callable[[str, Optional[dict]], None]):
+        while True:
+            nome, metadados = self._fila.get()
+            with self._lock:
+                self.em_processamento += 1
+
+            try:
+                processar(nome, metadados)
+            except Exception as e:
+                print(f"Erro no worker ao processar {nome}: {e}")
+            finally:
+                # Só liberta o ficheiro depois de o processamento (e o registo) terminar
+                with self._lock:
+                    self._reclamados -= self._chaves(nome, metadados)
+                    self.em_processamento -= 1
+                    self.processados += 1
+                self._fila.task_done()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.num_workers,
+                "em_fila": self._fila.qsize(),
+                "capacidade_fila": self._fila.maxsize,
+                "em_processamento": self.em_processamento,
+                "processados": self.processados,
+                "rejeitados": self.rejeitados
+            }
+
+
+# Fila global partilhada pelo loop de monitorização
+fila_arquivos = FilaArquivos()
@@ -0,0 +1,79 @@
+"""
+Cliente HTTP partilhado (pool de ligações keep-alive).
+Este módulo é igual no Processador e no XML Service.
+"""
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from config import HTTP_POOL_HOSTS, HTTP_POOL_POR_HOST, HTTP_TIMEOUT
+
+
+class ClienteHTTP:
+    """
+    Sessão HTTP thread-safe com pool de ligações reutilizáveis por host.
+    Evita abrir uma nova ligação TCP+TLS em cada pedido.
+    """
+
+    def __init__(self, pool_hosts: int = HTTP_POOL_HOSTS, pool_por_host: int = HTTP_POOL_POR_HOST,
+                 timeout: float = HTTP_TIMEOUT):
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self.pedidos = 0
+        self.erros = 0
+
+        # pool_maxsize limita as ligações abertas por host;
+        # pool_block faz esperar por uma ligação livre em vez de abrir outra
+        self._adapter = HTTPAdapter(
+            pool_connections=pool_hosts,
+            pool_maxsize=pool_por_host,
+            pool_block=True
+        )
+        self._sessao = requests.Session()
+        self._sessao.mount("http://", self._adapter)
+        self._sessao.mount("https://", self._adapter)
+
+    def request(self, metodo: str, url: str, **kwargs) -> requests.Response:
+        kwargs.setdefault("timeout", self.timeout)
+        with self._lock:
+            self.pedidos += 1
+        try:
+            return self._sessao.request(metodo, url, **kwargs)
+        except Exception:
+            with self._lock:
+                self.erros += 1
+            raise
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def stats(self) -> dict:
+        """
+        Devolve contadores de pedidos e de reutilização de ligações por host.
+        """
+        hosts = {}
+        pools = self._adapter.poolmanager.pools
+        for chave in list(pools.keys()):
+            pool = pools.get(chave)
+            if pool is None:
+                continue
+            host = f"{pool.scheme}://{pool.host}:{pool.port}"
+            hosts[host] = {
+                "pedidos": pool.num_requests,
+                "ligacoes_criadas": pool.num_connections,
+                "ligacoes_reutilizadas": max(0, pool.num_requests - pool.num_connections)
+            }
+
+        return {
+            "pedidos": self.pedidos,
+            "erros": self.erros,
+            "ligacoes_criadas": sum(h["ligacoes_criadas"] for h in hosts.values()),
+            "ligacoes_reutilizadas": sum(h["ligacoes_reutilizadas"] for h in hosts.values()),
+            "hosts": hosts
+        }
+
+
+# Cliente partilhado por todo o serviço
+cliente_http = ClienteHTTP()
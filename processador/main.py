@@ -6,53 +6,97 @@ import os
 import time
 import threading
 import uuid
-from supabase import create_client, Client
+from typing import Optional
 from config import (
-    SUPABASE_URL, SUPABASE_KEY, SUPABASE_BUCKET,
+    SUPABASE_BUCKET,
     XML_SERVICE_HOST, XML_SERVICE_PORT,
     WEBHOOK_URL, MAX_ARQUIVOS_BUCKET, MAPPER
 )
-from bucket_monitor import monitorizar_bucket, marcar_processado, gerenciar_fifo
-from csv_processor import processar_csv_stream
+from bucket_monitor import (
+    monitorizar_bucket, marcar_processado, gerenciar_fifo,
+    descarregar_arquivo, arquivo_inalterado, intervalo_monitorizacao
+)
+from registo_ficheiros import registo_ficheiros, ESTADO_PENDENTE
+from fila_arquivos import fila_arquivos
+from csv_processor import processar_csv_lotes
 from socket_client import enviar_para_xml_service
 from webhook_server import app
+from referencia_paises import iniciar_referencia
 
 
-def processar_arquivo(nome_arquivo: str):
+def processar_arquivo(nome_arquivo: str, metadados: Optional[dict] = None):
     """
     Processa um ficheiro CSV do bucket:
     faz download, processa/enriquece e envia para o XML Service.
     """
     try:
+        # Outro worker pode ter registado o ficheiro e libertado a reclamação
+        # entre a verificação de quem o colocou na fila e o enfileirar:
+        # com a reclamação já feita, volta a confirmar no registo
+        if metadados and arquivo_inalterado(metadados):
+            print(f"\nArquivo {nome_arquivo} ja processado, ignorado")
+            return
+
         print(f"\nProcessando arquivo: {nome_arquivo}")
 
         # Aplica FIFO antes de processar (mantém o limite de ficheiros no bucket)
         gerenciar_fifo()
 
-        # Cria o cliente Supabase e descarrega o CSV
-        supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
-        csv_bytes = supabase.storage.from_(SUPABASE_BUCKET).download(nome_arquivo)
-
-        print(f"Arquivo baixado: {len(csv_bytes)} bytes")
-
-        # Processa o CSV e enriquece os dados com API externa
-        dados_processados = processar_csv_stream(csv_bytes)
-        print(f"Processados {len(dados_processados)} registros")
-
-        # Gera um identificador único para a requisição
-        id_requisicao = str(uuid.uuid4())
-
-        # Envia os dados para o XML Service via socket
-        sucesso = enviar_para_xml_service(
-            id_requisicao=id_requisicao,
-            mapper=MAPPER,
-            webhook_url=WEBHOOK_URL,
-            dados=dados_processados
-        )
+        # Descarrega o CSV em blocos para um ficheiro temporário
+        csv_arquivo, hash_conteudo = descarregar_arquivo(nome_arquivo)
+        with csv_arquivo:
+            tamanho_arquivo = csv_arquivo.seek(0, 2)
+            csv_arquivo.seek(0)
+
+            print(f"Arquivo baixado: {tamanho_arquivo} bytes")
+
+            # Conteúdo idêntico já processado com outro nome: não volta a processar
+            original = registo_ficheiros.procurar_por_hash(hash_conteudo)
+            if original and original["nome"] != nome_arquivo:
+                print(f"Arquivo identico a {original['nome']} (hash), ignorado")
+                marcar_processado(nome_arquivo, metadados, hash_conteudo, duplicado_de=original["nome"])
+                return
+
+            # Processa o CSV em lotes diretamente a partir do ficheiro temporário
+            # e enriquece os dados com API externa; cada lote é serializado
+            # assim que fica pronto
+            dados_processados = (
+                dado
+                for lote in processar_csv_lotes(csv_arquivo)
+                for dado in lote
+            )
+
+            # Gera um identificador único para a requisição
+            id_requisicao = str(uuid.uuid4())
+
+            # Regista o ficheiro como pendente antes do envio: o webhook pode chegar
+            # antes da resposta e encontra o registo pelo id da requisição.
+            # Um registo pendente conta como não processado (e é limpo no arranque),
+            # por isso uma paragem a meio do envio não perde o ficheiro
+            marcar_processado(
+                nome_arquivo, metadados, hash_conteudo,
+                id_requisicao=id_requisicao, estado=ESTADO_PENDENTE
+            )
+
+            # Envia os dados para o XML Service via socket
+            sucesso = False
+            try:
+                sucesso = enviar_para_xml_service(
+                    id_requisicao=id_requisicao,
+                    mapper=MAPPER,
+                    webhook_url=WEBHOOK_URL,
+                    dados=dados_processados,
+                    ficheiro=nome_arquivo
+                )
+            finally:
+                if sucesso:
+                    # Aceite (ACCEPTED/OK): um webhook de erro posterior ainda desfaz a marca
+                    registo_ficheiros.confirmar_requisicao(id_requisicao)
+                else:
+                    registo_ficheiros.remover_por_requisicao(id_requisicao)
 
         if sucesso:
-            # Marca o ficheiro como processado e reaplica FIFO
-            marcar_processado(nome_arquivo)
+            # Reaplica FIFO
             gerenciar_fifo()
         else:
             print(f"Falha ao processar arquivo: {nome_arquivo}")
@@ -66,7 +110,10 @@ def processar_arquivo(nome_arquivo: str):
 def loop_monitoramento():
     """
     Loop principal:
-    verifica o bucket a cada 10 segundos e processa novos ficheiros CSV.
+    verifica o bucket periodicamente e coloca os novos ficheiros CSV
+    na fila processada pelos workers.
+    Os ficheiros chegam normalmente pelo endpoint de eventos; esta verificação
+    é uma rede de segurança com intervalo adaptativo (cresce com o bucket inativo).
     """
     print("=" * 60)
     print("PROCESSADOR SERVICE - TP3")
@@ -74,22 +121,37 @@ def loop_monitoramento():
     print(f"Supabase Bucket: {SUPABASE_BUCKET}")
     print(f"XML Service: {XML_SERVICE_HOST}:{XML_SERVICE_PORT}")
     print(f"Webhook URL: {WEBHOOK_URL}")
+    print(f"Workers: {fila_arquivos.num_workers}")
     print("=" * 60)
 
+    # Ficheiros cujo envio foi interrompido pela última paragem voltam a ser processados
+    pendentes = registo_ficheiros.limpar_pendentes()
+    if pendentes:
+        print(f"{pendentes} arquivo(s) pendente(s) da ultima execucao voltam a ser processados")
+
+    # Inicia os workers que processam os ficheiros em paralelo
+    fila_arquivos.iniciar(processar_arquivo)
+
     while True:
         try:
             # Procura novos CSV ainda não processados
             novos_arquivos = monitorizar_bucket()
 
-            if novos_arquivos:
-                print(f"\nEncontrados {len(novos_arquivos)} novo(s) arquivo(s)")
-                for arquivo in novos_arquivos:
-                    processar_arquivo(arquivo)
+            # Ficheiros já em fila são ignorados; com a fila cheia ficam para a próxima verificação
+            enfileirados = [
+                arquivo for arquivo in novos_arquivos
+                if fila_arquivos.enfileirar(arquivo["nome"], arquivo)
+            ]
+
+            if enfileirados:
+                print(f"\nEncontrados {len(enfileirados)} novo(s) arquivo(s)")
             else:
                 # Indicador simples de que o serviço está ativo
                 print(".", end="", flush=True)
 
-            time.sleep(10)
+            # Espera o próximo intervalo (ou até chegar uma notificação)
+            intervalo_monitorizacao.atualizar(bool(novos_arquivos))
+            intervalo_monitorizacao.esperar()
 
         except KeyboardInterrupt:
             print("\n\nProcessador interrompido pelo usuario")
@@ -97,7 +159,7 @@ def loop_monitoramento():
 
         except Exception as e:
             print(f"\nErro no loop de monitoramento: {e}")
-            time.sleep(10)
+            time.sleep(intervalo_monitorizacao.minimo)
 
 
 if __name__ == "__main__":
@@ -111,5 +173,8 @@ if __name__ == "__main__":
     )
     flask_thread.start()
 
+    # Carrega a referência offline de países e agenda a sua atualização
+    iniciar_referencia()
+
     # Inicia o loop principal de monitoramento do bucket
     loop_monitoramento()
@@ -0,0 +1,97 @@
+from typing import List
+
+# Mapeamento de nomes comuns para nomes reconhecidos pela API
+NOME_MAPPING = {
+    "INDIA": "India", "CHINA": "China", "UNITED STATES": "United States",
+    "USA": "United States", "RUSSIA": "Russia", "BRAZIL": "Brazil",
+    "JAPAN": "Japan", "GERMANY": "Germany", "FRANCE": "France",
+    "ITALY": "Italy", "SPAIN": "Spain", "CANADA": "Canada",
+    "AUSTRALIA": "Australia", "MEXICO": "Mexico", "INDONESIA": "Indonesia",
+    "TURKEY": "Turkey", "SOUTH KOREA": "South Korea",
+    "SAUDI ARABIA": "Saudi Arabia", "PORTUGAL": "Portugal"
+}
+
+
+def expandir_saint(pais_upper: str) -> str:
+    """
+    Trata abreviações como "St." para "Saint" (nome já em maiúsculas).
+    """
+    if pais_upper.startswith("ST. ") or pais_upper.startswith("ST "):
+        return pais_upper.replace("ST. ", "SAINT ", 1).replace("ST ", "SAINT ", 1)
+    elif pais_upper.startswith("ST."):
+        return pais_upper.replace("ST.", "SAINT", 1)
+    return pais_upper
+
+
+def normalizar_nome_pais(pais: str) -> str:
+    """
+    Normaliza o nome de um país para o formato usado na API (e na cache).
+    """
+    # Normaliza o nome do país recebido
+    pais_limpo = pais.strip().replace("_", " ").strip()
+    pais_upper = expandir_saint(pais_limpo.upper())
+
+    # Define o nome normalizado a usar na API
+    if pais_upper in NOME_MAPPING:
+        return NOME_MAPPING[pais_upper]
+
+    palavras = pais_limpo.split()
+    return " ".join([p.capitalize() for p in palavras])
+
+
+def chaves_pais(pais: str) -> List[str]:
+    """
+    Devolve as chaves de pesquisa (em maiúsculas) associadas a um nome de país:
+    o nome normalizado e a variante com "St." expandido para "Saint".
+    """
+    normalizado = " ".join(normalizar_nome_pais(pais).upper().split())
+    chaves = [normalizado]
+
+    expandido = expandir_saint(normalizado)
+    if expandido not in chaves:
+        chaves.append(expandido)
+
+    return chaves
+
+
+def extrair_dados_api(country_data: dict) -> dict:
+    """
+    Extrai os dados relevantes do JSON devolvido pela API.
+    """
+    area = country_data.get("area", 0)
+    population = country_data.get("population", 0)
+
+    capital_list = country_data.get("capital")
+    capital = capital_list[0] if capital_list else "N/A"
+
+    subregion = country_data.get("subregion", "N/A")
+
+    currencies = country_data.get("currencies", {})
+    currency_name = "N/A"
+    if currencies:
+        currency_name = list(currencies.values())[0].get("name", "N/A")
+
+    density = (population / area) if area > 0 else 0
+
+    return {
+        "media_30d": round(area / 1000.0, 2),
+        "maximo_6m": round(population / 1_000_000.0, 2),
+        "capital": capital,
+        "subregion": subregion,
+        "currency": currency_name,
+        "density": round(density, 2)
+    }
+
+
+def dados_fallback() -> dict:
+    """
+    Valores de fallback usados quando não há dados para o país.
+    """
+    return {
+        "media_30d": 0,
+        "maximo_6m": 0,
+        "capital": "N/A",
+        "subregion": "N/A",
+        "currency": "N/A",
+        "density": 0
+    }
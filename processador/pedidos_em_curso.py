@@ -0,0 +1,133 @@
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import List, Optional
+from config import PEDIDOS_MAX_EM_CURSO, PEDIDOS_AMOSTRAS, PEDIDOS_JANELA_DEBITO, PEDIDOS_LIMITE_PRESO
+from percentis import percentil
+
+
+class RegistoPedidos:
+    """
+    Registo em memória (limitado) dos pedidos enviados ao XML Service
+    que ainda não receberam o webhook final.
+    Guarda a hora de envio, o número de registos e o tamanho do payload,
+    e mede a latência de ponta a ponta quando o webhook chega.
+    """
+
+    def __init__(self, max_em_curso: int = PEDIDOS_MAX_EM_CURSO, amostras: int = PEDIDOS_AMOSTRAS):
+        self.max_em_curso = max_em_curso
+        self._lock = threading.Lock()
+        self._em_curso: "OrderedDict[str, dict]" = OrderedDict()
+
+        # Últimos pedidos concluídos: (concluido_em, latencia, registos, bytes)
+        self._concluidos = deque(maxlen=amostras)
+
+        # Contadores para as estatísticas
+        self.total_concluidos = 0
+        self.descartados = 0
+        self.desconhecidos = 0
+        self.por_status = {}
+
+    def registar(self, id_requisicao: str, registos: int = 0, tamanho: int = 0, ficheiro: Optional[str] = None):
+        """
+        Regista um pedido no momento do envio.
+        Se o registo estiver cheio, esquece o pedido mais antigo.
+        """
+        with self._lock:
+            self._em_curso[id_requisicao] = {
+                "enviado_em": time.time(),
+                "registos": registos,
+                "bytes": tamanho,
+                "ficheiro": ficheiro
+            }
+            while len(self._em_curso) > self.max_em_curso:
+                self._em_curso.popitem(last=False)
+                self.descartados += 1
+
+    def atualizar(self, id_requisicao: str, **campos):
+        """
+        Atualiza os dados de um pedido em curso (ex.: registos de um envio em streaming).
+        """
+        with self._lock:
+            pedido = self._em_curso.get(id_requisicao)
+            if pedido is not None:
+                pedido.update(campos)
+
+    def remover(self, id_requisicao: str):
+        """
+        Esquece um pedido que não chegou a ser aceite pelo XML Service.
+        """
+        with self._lock:
+            self._em_curso.pop(id_requisicao, None)
+
+    def concluir(self, id_requisicao: str, status: str) -> Optional[float]:
+        """
+        Fecha o pedido quando chega o webhook. Devolve a latência de ponta a ponta
+        (segundos) ou None se o pedido não estava registado.
+        """
+        agora = time.time()
+        with self._lock:
+            self.por_status[status] = self.por_status.get(status, 0) + 1
+            pedido = self._em_curso.pop(id_requisicao, None)
+            if pedido is None:
+                self.desconhecidos += 1
+                return None
+
+            latencia = agora - pedido["enviado_em"]
+            self._concluidos.append((agora, latencia, pedido["registos"], pedido["bytes"]))
+            self.total_concluidos += 1
+            return latencia
+
+    def presos(self, limite: float = PEDIDOS_LIMITE_PRESO, maximo: int = 20) -> List[dict]:
+        """
+        Pedidos há mais de `limite` segundos à espera do webhook (mais antigos primeiro).
+        """
+        agora = time.time()
+        resultado = []
+        with self._lock:
+            # O OrderedDict está por ordem de envio
+            for id_requisicao, pedido in self._em_curso.items():
+                idade = agora - pedido["enviado_em"]
+                if idade < limite or len(resultado) >= maximo:
+                    break
+                resultado.append({"id_requisicao": id_requisicao, "segundos": round(idade, 1), **pedido})
+        return resultado
+
+    def stats(self, janela: float = PEDIDOS_JANELA_DEBITO) -> dict:
+        agora = time.time()
+        with self._lock:
+            em_curso = len(self._em_curso)
+            concluidos = list(self._concluidos)
+            contadores = {
+                "total_concluidos": self.total_concluidos,
+                "descartados": self.descartados,
+                "webhooks_desconhecidos": self.desconhecidos,
+                "por_status": dict(self.por_status)
+            }
+
+        latencias = sorted(latencia for _, latencia, _, _ in concluidos)
+        recentes = [(registos, tamanho) for concluido_em, _, registos, tamanho in concluidos
+                    if concluido_em >= agora - janela]
+
+        return {
+            "em_curso": em_curso,
+            **contadores,
+            "latencia_segundos": {
+                "amostras": len(latencias),
+                "p50": percentil(latencias, 50),
+                "p95": percentil(latencias, 95),
+                "p99": percentil(latencias, 99),
+                "max": latencias[-1] if latencias else None
+            },
+            "debito": {
+                "janela_segundos": janela,
+                "pedidos_por_segundo": round(len(recentes) / janela, 4),
+                "registos_por_segundo": round(sum(r for r, _ in recentes) / janela, 2),
+                "bytes_por_segundo": round(sum(t for _, t in recentes) / janela, 1)
+            },
+            "presos": self.presos()
+        }
+
+
+# Registo global partilhado pelo envio (socket_client) e pelo webhook
+pedidos_em_curso = RegistoPedidos()
@@ -0,0 +1,12 @@
+import math
+from typing import List, Optional
+
+
+def percentil(valores: List[float], p: float) -> Optional[float]:
+    """
+    Percentil pelo método nearest-rank (valores já ordenados).
+    """
+    if not valores:
+        return None
+    indice = min(len(valores), max(1, math.ceil(p / 100 * len(valores)))) - 1
+    return valores[indice]
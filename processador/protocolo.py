@@ -0,0 +1,187 @@
+"""
+Enquadramento das mensagens trocadas por socket entre o Processador e o XML Service.
+Este módulo é igual no Processador e no XML Service.
+"""
+import asyncio
+import socket
+import struct
+from typing import BinaryIO, List, Tuple
+from config import TAMANHO_MAX_FRAME
+
+# Versão do protocolo multiplexado (negociada com uma mensagem HELLO)
+VERSAO_PROTOCOLO = 2
+
+# Prefixo das mensagens no formato original: tamanho do JSON (4 bytes, big-endian)
+PREFIXO_SIMPLES = struct.Struct(">I")
+
+# Cabeçalho das frames v2: tamanho do payload (4), flags (1), tipo (1), id do pedido (4)
+CABECALHO_V2 = struct.Struct(">IBBI")
+
+# Bits das flags com a codificação (baixos) e a compressão (altos) do payload
+FLAGS_CODIFICACAO = 0x0F
+FLAGS_COMPRESSAO_SHIFT = 4
+
+# Tipos de frame do protocolo v2
+FRAME_PEDIDO = 1
+FRAME_RESPOSTA = 2
+FRAME_PING = 3
+FRAME_PONG = 4
+FRAME_PEDIDO_ASSINCRONO = 5
+FRAME_ESTADO = 6
+FRAME_INICIO = 7
+FRAME_LOTE = 8
+FRAME_FIM = 9
+FRAME_CANCELAR = 10
+
+# Tamanho dos blocos lidos de ficheiros e enviados pelo socket
+TAMANHO_BLOCO_ENVIO = 64 * 1024
+
+# Abaixo deste tamanho é mais barato juntar os buffers do que usar scatter-gather
+LIMITE_CONCATENAR = 16 * 1024
+
+# sendmsg não existe em todas as plataformas
+_TEM_SENDMSG = hasattr(socket.socket, "sendmsg")
+
+
+class ErroFrame(ValueError):
+    """
+    Frame inválida: maior do que o permitido ou ligação fechada a meio.
+    """
+
+
+def verificar_tamanho(tamanho: int, maximo: int = TAMANHO_MAX_FRAME):
+    """
+    Rejeita frames acima do tamanho máximo antes de reservar memória para elas.
+    """
+    if tamanho > maximo:
+        raise ErroFrame(f"Frame com {tamanho} bytes excede o maximo de {maximo} bytes")
+
+
+def receber_para(sock: socket.socket, vista: memoryview):
+    """
+    Preenche a memoryview com dados do socket (recv_into, sem cópias intermédias).
+    """
+    recebidos = 0
+    total = len(vista)
+    while recebidos < total:
+        n = sock.recv_into(vista[recebidos:])
+        if n == 0:
+            raise ErroFrame(f"Conexao fechada depois de {recebidos} de {total} bytes")
+        recebidos += n
+
+
+def receber_exato(sock: socket.socket, tamanho: int, maximo: int = TAMANHO_MAX_FRAME) -> bytearray:
+    """
+    Recebe exatamente o número de bytes indicado para um buffer pré-alocado.
+    """
+    verificar_tamanho(tamanho, maximo)
+    buffer = bytearray(tamanho)
+    receber_para(sock, memoryview(buffer))
+    return buffer
+
+
+def receber_mensagem_simples(sock: socket.socket, maximo: int = TAMANHO_MAX_FRAME) -> bytearray:
+    """
+    Recebe uma mensagem no formato original (tamanho + JSON).
+    """
+    prefixo = bytearray(PREFIXO_SIMPLES.size)
+    receber_para(sock, memoryview(prefixo))
+    tamanho, = PREFIXO_SIMPLES.unpack(prefixo)
+    return receber_exato(sock, tamanho, maximo)
+
+
+def receber_frame(sock: socket.socket, maximo: int = TAMANHO_MAX_FRAME) -> Tuple[int, int, int, bytearray]:
+    """
+    Recebe uma frame v2. Devolve (flags, tipo, id do pedido, payload).
+    """
+    cabecalho = bytearray(CABECALHO_V2.size)
+    receber_para(sock, memoryview(cabecalho))
+    tamanho, flags, tipo, id_pedido = CABECALHO_V2.unpack(cabecalho)
+    return flags, tipo, id_pedido, receber_exato(sock, tamanho, maximo)
+
+
+def enviar_buffers(sock: socket.socket, buffers: List):
+    """
+    Envia vários buffers de uma vez (sendmsg scatter-gather), sem os juntar.
+    Continua a partir do ponto certo se o envio for parcial.
+    """
+    if not _TEM_SENDMSG or sum(map(len, buffers)) < LIMITE_CONCATENAR:
+        sock.sendall(b''.join(buffers))
+        return
+
+    vistas = [memoryview(buffer) for buffer in buffers if len(buffer)]
+    while vistas:
+        enviados = sock.sendmsg(vistas)
+        while enviados:
+            if enviados >= len(vistas[0]):
+                enviados -= len(vistas[0])
+                vistas.pop(0)
+            else:
+                vistas[0] = vistas[0][enviados:]
+                enviados = 0
+
+
+def enviar_mensagem_simples(sock: socket.socket, payload: bytes):
+    """
+    Envia uma mensagem no formato original (tamanho + JSON).
+    """
+    verificar_tamanho(len(payload))
+    enviar_buffers(sock, [PREFIXO_SIMPLES.pack(len(payload)), payload])
+
+
+def enviar_frame(sock: socket.socket, tipo: int, id_pedido: int, payload=b'', flags: int = 0):
+    """
+    Envia uma frame v2 (cabeçalho + payload em memória).
+    """
+    verificar_tamanho(len(payload))
+    enviar_buffers(sock, [CABECALHO_V2.pack(len(payload), flags, tipo, id_pedido), payload])
+
+
+def enviar_frame_ficheiro(sock: socket.socket, tipo: int, id_pedido: int, ficheiro: BinaryIO,
+                          tamanho: int, flags: int = 0):
+    """
+    Envia uma frame v2 cujo payload está num ficheiro, bloco a bloco,
+    reutilizando sempre o mesmo buffer de leitura.
+    """
+    verificar_tamanho(tamanho)
+    buffer = bytearray(min(tamanho, TAMANHO_BLOCO_ENVIO))
+    vista = memoryview(buffer)
+    partes = [CABECALHO_V2.pack(tamanho, flags, tipo, id_pedido)]
+
+    em_falta = tamanho
+    while em_falta > 0:
+        lidos = ficheiro.readinto(vista[:min(em_falta, len(buffer))])
+        if not lidos:
+            raise ErroFrame(f"Ficheiro terminou com {em_falta} bytes em falta")
+        # O cabeçalho segue com o primeiro bloco na mesma chamada
+        partes.append(vista[:lidos])
+        enviar_buffers(sock, partes)
+        partes = []
+        em_falta -= lidos
+
+    if partes:
+        enviar_buffers(sock, partes)
+
+
+async def ler_mensagem_simples(reader: asyncio.StreamReader, maximo: int = TAMANHO_MAX_FRAME) -> bytes:
+    """
+    Versão asyncio de receber_mensagem_simples.
+    """
+    tamanho, = PREFIXO_SIMPLES.unpack(await reader.readexactly(PREFIXO_SIMPLES.size))
+    verificar_tamanho(tamanho, maximo)
+    return await reader.readexactly(tamanho)
+
+
+def escrever_mensagem_simples(writer: asyncio.StreamWriter, payload: bytes):
+    """
+    Versão asyncio de enviar_mensagem_simples (o chamador faz drain()).
+    """
+    writer.writelines([PREFIXO_SIMPLES.pack(len(payload)), payload])
+
+
+def escrever_frame(writer: asyncio.StreamWriter, tipo: int, id_pedido: int, payload=b'', flags: int = 0):
+    """
+    Versão asyncio de enviar_frame: cabeçalho e payload seguem para o
+    transporte sem serem concatenados (o chamador faz drain()).
+    """
+    writer.writelines([CABECALHO_V2.pack(len(payload), flags, tipo, id_pedido), payload])
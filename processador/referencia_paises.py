@@ -0,0 +1,165 @@
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+from config import (
+    REFERENCIA_ATIVA, REFERENCIA_SNAPSHOT_PATH,
+    REFERENCIA_URL, REFERENCIA_INTERVALO
+)
+from http_client import cliente_http
+from normalizacao_paises import chaves_pais, extrair_dados_api
+
+
+class ReferenciaPaises:
+    """
+    Índice em memória com os dados de todos os países, carregado a partir
+    de um snapshot JSON local ou da exportação completa da REST Countries API.
+    Permite enriquecer os dados sem qualquer pedido à rede.
+    """
+
+    def __init__(self, caminho: str = REFERENCIA_SNAPSHOT_PATH, url: str = REFERENCIA_URL,
+                 intervalo: float = REFERENCIA_INTERVALO):
+        self.caminho = caminho
+        self.url = url
+        self.intervalo = intervalo
+
+        # chave normalizada (maiúsculas) -> dados extraídos
+        self._indice: Dict[str, dict] = {}
+        self.total_paises = 0
+        self.atualizado_em = 0.0
+        self._thread = None
+
+    def procurar(self, pais: str) -> Optional[dict]:
+        """
+        Devolve os dados do país a partir do índice local, ou None se não existir.
+        """
+        indice = self._indice
+        if not indice:
+            return None
+
+        for chave in chaves_pais(pais):
+            resultado = indice.get(chave)
+            if resultado is not None:
+                return resultado
+        return None
+
+    def carregar(self, paises: List[dict]):
+        """
+        Constrói o índice a partir da lista de países (formato da API)
+        e substitui o índice atual de forma atómica.
+        """
+        indice = {}
+        for country_data in paises:
+            dados = extrair_dados_api(country_data)
+
+            nome = country_data.get("name", {})
+            nomes = [nome.get("common", ""), nome.get("official", "")]
+            nomes.extend(country_data.get("altSpellings", []))
+
+            for nome_pais in nomes:
+                if not nome_pais:
+                    continue
+                for chave in chaves_pais(nome_pais):
+                    # O primeiro país a reclamar uma chave fica com ela
+                    indice.setdefault(chave, dados)
+
+        self._indice = indice
+        self.total_paises = len(paises)
+        self.atualizado_em = time.time()
+
+    def carregar_snapshot(self) -> bool:
+        """
+        Carrega o índice a partir do ficheiro de snapshot local, se existir.
+        """
+        if not os.path.exists(self.caminho):
+            return False
+
+        try:
+            with open(self.caminho, encoding="utf-8") as f:
+                paises = json.load(f)
+            self.carregar(paises)
+            self.atualizado_em = os.path.getmtime(self.caminho)
+            print(f"Referencia de paises carregada de {self.caminho}: {self.total_paises} paises")
+            return True
+
+        except Exception as e:
+            print(f"Erro ao carregar snapshot de paises: {e}")
+            return False
+
+    def atualizar(self) -> bool:
+        """
+        Descarrega a exportação completa da API, atualiza o índice
+        e grava o snapshot local (escrita atómica).
+        """
+        try:
+            response = cliente_http.get(self.url, timeout=60)
+            if response.status_code != 200:
+                print(f"Erro ao descarregar referencia de paises: HTTP {response.status_code}")
+                return False
+
+            paises = response.json()
+            self.carregar(paises)
+
+            pasta = os.path.dirname(self.caminho)
+            if pasta:
+                os.makedirs(pasta, exist_ok=True)
+
+            caminho_tmp = self.caminho + ".tmp"
+            with open(caminho_tmp, "w", encoding="utf-8") as f:
+                json.dump(paises, f)
+            os.replace(caminho_tmp, self.caminho)
+
+            print(f"Referencia de paises atualizada: {self.total_paises} paises")
+            return True
+
+        except Exception as e:
+            print(f"Erro ao atualizar referencia de paises: {e}")
+            return False
+
+    def _loop_atualizacao(self):
+        """
+        Atualiza o snapshot periodicamente em background.
+        """
+        while True:
+            # Atualiza já se o snapshot não existir ou estiver desatualizado
+            idade = time.time() - self.atualizado_em
+            if idade >= self.intervalo:
+                if not self.atualizar():
+                    # Tenta novamente mais tarde, mantendo o índice atual
+                    time.sleep(300)
+                    continue
+                idade = 0
+
+            time.sleep(self.intervalo - idade)
+
+    def iniciar(self):
+        """
+        Carrega o snapshot local e inicia a atualização periódica em background.
+        """
+        self.carregar_snapshot()
+
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop_atualizacao, daemon=True)
+            self._thread.start()
+
+    def stats(self) -> dict:
+        return {
+            "ativa": REFERENCIA_ATIVA,
+            "paises": self.total_paises,
+            "chaves": len(self._indice),
+            "atualizado_em": self.atualizado_em,
+            "caminho": self.caminho
+        }
+
+
+# Referência global usada pelo api_client
+referencia_paises = ReferenciaPaises()
+
+
+def iniciar_referencia():
+    """
+    Inicia o modo de referência offline, se estiver ativo na configuração.
+    """
+    if REFERENCIA_ATIVA:
+        referencia_paises.iniciar()
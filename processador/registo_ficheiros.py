@@ -0,0 +1,168 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+from config import REGISTO_DB_PATH
+
+# Estados de um ficheiro no registo: enviado mas ainda sem resposta do
+# XML Service (conta como não processado) ou aceite/guardado
+ESTADO_PENDENTE = "PENDENTE"
+ESTADO_PROCESSADO = "PROCESSADO"
+
+
+class RegistoFicheiros:
+    """
+    Registo persistente (SQLite) dos ficheiros já processados.
+    Guarda nome, tamanho, etag, data de atualização e hash do conteúdo,
+    para que reinícios não voltem a processar os mesmos ficheiros.
+    Um ficheiro fica PENDENTE enquanto é enviado e só passa a PROCESSADO
+    quando o XML Service o aceita; se o serviço parar a meio, o ficheiro
+    volta a ser processado.
+    """
+
+    def __init__(self, caminho: str = REGISTO_DB_PATH):
+        self.caminho = caminho
+        self._lock = threading.Lock()
+
+        pasta = os.path.dirname(caminho)
+        if pasta:
+            os.makedirs(pasta, exist_ok=True)
+
+        self._conn = sqlite3.connect(caminho, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS ficheiros_processados (
+                nome TEXT PRIMARY KEY,
+                tamanho INTEGER,
+                etag TEXT,
+                atualizado_em TEXT,
+                hash_conteudo TEXT,
+                duplicado_de TEXT,
+                processado_em REAL NOT NULL,
+                id_requisicao TEXT,
+                estado TEXT NOT NULL DEFAULT 'PROCESSADO'
+            )
+            """
+        )
+
+        # Registos criados antes de existir a coluna id_requisicao
+        colunas = [linha["name"] for linha in self._conn.execute("PRAGMA table_info(ficheiros_processados)")]
+        if "id_requisicao" not in colunas:
+            self._conn.execute("ALTER TABLE ficheiros_processados ADD COLUMN id_requisicao TEXT")
+        if "estado" not in colunas:
+            self._conn.execute(
+                "ALTER TABLE ficheiros_processados ADD COLUMN estado TEXT NOT NULL DEFAULT 'PROCESSADO'"
+            )
+
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_ficheiros_hash ON ficheiros_processados (hash_conteudo)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_ficheiros_etag ON ficheiros_processados (etag)")
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_ficheiros_requisicao ON ficheiros_processados (id_requisicao)"
+        )
+        self._conn.commit()
+
+    def _procurar_um(self, sql: str, parametros: tuple) -> Optional[dict]:
+        with self._lock:
+            linha = self._conn.execute(sql, parametros).fetchone()
+        return dict(linha) if linha else None
+
+    def procurar(self, nome: str) -> Optional[dict]:
+        """
+        Devolve o registo do ficheiro com este nome, se existir.
+        """
+        return self._procurar_um("SELECT * FROM ficheiros_processados WHERE nome = ?", (nome,))
+
+    def procurar_por_etag(self, etag: str, tamanho: int) -> Optional[dict]:
+        """
+        Procura um ficheiro já processado com o mesmo etag e tamanho.
+        """
+        if not etag:
+            return None
+        return self._procurar_um(
+            "SELECT * FROM ficheiros_processados WHERE etag = ? AND tamanho = ? AND estado = ? LIMIT 1",
+            (etag, tamanho, ESTADO_PROCESSADO)
+        )
+
+    def procurar_por_hash(self, hash_conteudo: str) -> Optional[dict]:
+        """
+        Procura um ficheiro já processado com o mesmo conteúdo.
+        """
+        return self._procurar_um(
+            "SELECT * FROM ficheiros_processados WHERE hash_conteudo = ? AND estado = ? LIMIT 1",
+            (hash_conteudo, ESTADO_PROCESSADO)
+        )
+
+    def registar(self, nome: str, tamanho: int, etag: str, atualizado_em: str,
+                 hash_conteudo: Optional[str], duplicado_de: Optional[str] = None,
+                 id_requisicao: Optional[str] = None, estado: str = ESTADO_PROCESSADO):
+        """
+        Regista (ou atualiza) um ficheiro como processado (ou pendente).
+        """
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT OR REPLACE INTO ficheiros_processados
+                    (nome, tamanho, etag, atualizado_em, hash_conteudo, duplicado_de, processado_em,
+                     id_requisicao, estado)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (nome, tamanho, etag, atualizado_em, hash_conteudo, duplicado_de, time.time(),
+                 id_requisicao, estado)
+            )
+            self._conn.commit()
+
+    def confirmar_requisicao(self, id_requisicao: str) -> bool:
+        """
+        Passa a PROCESSADO o ficheiro pendente enviado na requisição indicada
+        (resposta ACCEPTED/OK ou webhook OK, o que chegar primeiro).
+        Devolve False se nenhum ficheiro estava registado com essa requisição.
+        """
+        if not id_requisicao:
+            return False
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE ficheiros_processados SET estado = ?, processado_em = ? WHERE id_requisicao = ?",
+                (ESTADO_PROCESSADO, time.time(), id_requisicao)
+            )
+            self._conn.commit()
+            return cursor.rowcount > 0
+
+    def limpar_pendentes(self) -> int:
+        """
+        Remove os ficheiros que ficaram pendentes (envio interrompido por um
+        reinício), para voltarem a ser processados. Chamado no arranque.
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM ficheiros_processados WHERE estado = ?", (ESTADO_PENDENTE,)
+            )
+            self._conn.commit()
+            return cursor.rowcount
+
+    def remover_por_requisicao(self, id_requisicao: str) -> Optional[str]:
+        """
+        Esquece o ficheiro enviado na requisição indicada, para voltar a ser processado.
+        Devolve o nome do ficheiro ou None se nenhum estava registado com essa requisição.
+        """
+        if not id_requisicao:
+            return None
+        with self._lock:
+            linha = self._conn.execute(
+                "SELECT nome FROM ficheiros_processados WHERE id_requisicao = ?", (id_requisicao,)
+            ).fetchone()
+            if linha is None:
+                return None
+            self._conn.execute("DELETE FROM ficheiros_processados WHERE nome = ?", (linha["nome"],))
+            self._conn.commit()
+            return linha["nome"]
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM ficheiros_processados").fetchone()[0]
+
+
+# Registo global usado pelo monitor do bucket
+registo_ficheiros = RegistoFicheiros()
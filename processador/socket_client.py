@@ -1,60 +1,564 @@
+import io
 import socket
 import json
-from config import XML_SERVICE_HOST, XML_SERVICE_PORT, MAPPER_VERSION, WEBHOOK_URL
+import tempfile
+import threading
+import time
+import itertools
+from concurrent.futures import Future
+from typing import BinaryIO, Dict, Iterable, List, Optional, Tuple
+from config import (
+    XML_SERVICE_HOST, XML_SERVICE_PORT, MAPPER_VERSION, WEBHOOK_URL, SPOOL_MAX_MEMORIA,
+    XML_SERVICE_POOL, XML_SERVICE_TIMEOUT, XML_SERVICE_PING_INTERVALO, XML_SERVICE_CODIFICACAO,
+    XML_SERVICE_COMPRESSAO, COMPRESSAO_MINIMO, XML_SERVICE_TENTATIVAS_OCUPADO,
+    XML_SERVICE_MODO, XML_SERVICE_TAMANHO_LOTE
+)
+from codificacao import (
+    NOMES_CODIFICACOES, CODIFICACAO_JSON, CODIFICACAO_COLUNAR, CODIFICACAO_COLUNAR_BLOCOS, CODECS_COMPRESSAO,
+    CodificadorColunar, EscritorColunarBlocos, comprimir_ficheiro
+)
+from pedidos_em_curso import pedidos_em_curso
+from protocolo import (
+    VERSAO_PROTOCOLO, FLAGS_COMPRESSAO_SHIFT,
+    FRAME_PEDIDO, FRAME_RESPOSTA, FRAME_PING, FRAME_PONG, FRAME_PEDIDO_ASSINCRONO, FRAME_ESTADO,
+    FRAME_INICIO, FRAME_LOTE, FRAME_FIM, FRAME_CANCELAR,
+    ErroFrame, receber_frame, receber_mensagem_simples, enviar_mensagem_simples, enviar_frame, enviar_frame_ficheiro
+)
 
+class ErroEnvio(ConnectionError):
+    """
+    Falha de ligação antes de o pedido ter sido totalmente enviado
+    (o pedido pode ser repetido noutra ligação sem risco de duplicação).
+    """
 
-def enviar_para_xml_service(id_requisicao: str, mapper: dict, webhook_url: str, dados: list) -> bool:
+
+def cabecalho_mensagem(id_requisicao: str, mapper: dict, webhook_url: str) -> dict:
     """
-    Envia os dados processados para o XML Service através de um socket TCP.
+    Campos fixos de uma mensagem para o XML Service (tudo menos os dados).
     """
-    try:
-        # Cria a mensagem a enviar para o XML Service
-        mensagem = {
-            "id_requisicao": id_requisicao,
-            "mapper": mapper,
-            "mapper_version": MAPPER_VERSION,
-            "webhook_url": webhook_url,
-            "dados": dados
-        }
+    return {
+        "id_requisicao": id_requisicao,
+        "mapper": mapper,
+        "mapper_version": MAPPER_VERSION,
+        "webhook_url": webhook_url
+    }
+
+
+def serializar_mensagem(id_requisicao: str, mapper: dict, webhook_url: str, dados: Iterable[Dict],
+                        codificacao: int = CODIFICACAO_JSON) -> Tuple[BinaryIO, int]:
+    """
+    Serializa a mensagem registo a registo para um ficheiro temporário
+    (em memória até SPOOL_MAX_MEMORIA, depois em disco), em JSON ou no formato colunar.
+    Devolve o ficheiro posicionado no início e o número de registos.
+    """
+    cabecalho = cabecalho_mensagem(id_requisicao, mapper, webhook_url)
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORIA)
+
+    if codificacao == CODIFICACAO_COLUNAR_BLOCOS:
+        # Chaves enviadas uma vez por bloco, valores agrupados por coluna em arrays
+        # tipados; cada bloco vai para o ficheiro assim que fica completo
+        escritor = EscritorColunarBlocos(cabecalho, spool)
+        for dado in dados:
+            escritor.adicionar(dado)
+        escritor.concluir()
+        spool.seek(0)
+        return spool, escritor.total
+
+    if codificacao == CODIFICACAO_COLUNAR:
+        # Um único bloco colunar (todos os registos ficam em memória até ao fim)
+        codificador = CodificadorColunar(cabecalho)
+        for dado in dados:
+            codificador.adicionar(dado)
+        codificador.escrever(spool)
+        spool.seek(0)
+        return spool, codificador.total
+
+    # Escreve os campos fixos e abre a lista "dados" (mesmo JSON que json.dumps)
+    spool.write(json.dumps(cabecalho)[:-1].encode('utf-8'))
+    spool.write(b', "dados": [')
+
+    total = 0
+    for dado in dados:
+        if total:
+            spool.write(b', ')
+        spool.write(json.dumps(dado).encode('utf-8'))
+        total += 1
+
+    spool.write(b']}')
+    spool.seek(0)
+    return spool, total
+
+
+def serializar_lote(dados: List[Dict], codificacao: int, codec: Optional[str]) -> Tuple[bytes, int]:
+    """
+    Serializa um lote de registos para uma frame LOTE (mensagem só com "dados"),
+    comprimido se for grande o suficiente. Devolve o payload e as flags.
+    """
+    if codificacao in (CODIFICACAO_COLUNAR, CODIFICACAO_COLUNAR_BLOCOS):
+        # O lote já é limitado: basta um bloco
+        codificador = CodificadorColunar({})
+        for dado in dados:
+            codificador.adicionar(dado)
+        destino = io.BytesIO()
+        codificador.escrever(destino)
+        payload = destino.getvalue()
+    else:
+        payload = json.dumps({"dados": dados}).encode('utf-8')
+
+    flags = codificacao
+    if codec and len(payload) >= COMPRESSAO_MINIMO:
+        comprimido = io.BytesIO()
+        comprimir_ficheiro(io.BytesIO(payload), comprimido, codec)
+        payload = comprimido.getvalue()
+        flags |= CODECS_COMPRESSAO[codec][0] << FLAGS_COMPRESSAO_SHIFT
+
+    return payload, flags
+
+
+class LigacaoXMLService:
+    """
+    Ligação TCP persistente ao XML Service (protocolo v2).
+    Vários pedidos podem estar em curso ao mesmo tempo: cada frame leva um id
+    e as respostas são entregues a quem as pediu por uma thread de leitura.
+    """
+
+    def __init__(self, host: str = XML_SERVICE_HOST, port: int = XML_SERVICE_PORT):
+        self.host = host
+        self.port = port
+        self.ativa = False
+        self._sock: Optional[socket.socket] = None
+        self._lock = threading.Lock()
+        self._lock_envio = threading.Lock()
+        self._pendentes: Dict[int, Future] = {}
+        self._ids = itertools.count(1)
 
-        # Converte a mensagem para JSON e depois para bytes
-        mensagem_json = json.dumps(mensagem)
-        mensagem_bytes = mensagem_json.encode('utf-8')
+        # Codificações e compressões aceites pelo XML Service nesta ligação
+        self.codificacoes = ["json"]
+        self.compressoes = []
+        self.modos = ["sincrono"]
 
-        # Cria o socket TCP
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        sock.settimeout(30)
+    def ligar(self):
+        """
+        Abre a ligação, negoceia o protocolo v2 e inicia a thread de leitura.
+        """
+        with self._lock:
+            if self.ativa:
+                return
 
-        # Estabelece ligação ao XML Service
-        print(f"Conectando ao XML Service em {XML_SERVICE_HOST}:{XML_SERVICE_PORT}...")
-        sock.connect((XML_SERVICE_HOST, XML_SERVICE_PORT))
+            sock = socket.create_connection((self.host, self.port), timeout=10)
+            try:
+                # Negociação no formato original (tamanho + JSON)
+                hello = json.dumps({
+                    "tipo": "HELLO",
+                    "versao_protocolo": VERSAO_PROTOCOLO,
+                    "codificacoes": list(NOMES_CODIFICACOES),
+                    "compressoes": list(CODECS_COMPRESSAO)
+                }).encode('utf-8')
+                enviar_mensagem_simples(sock, hello)
+                resposta = json.loads(receber_mensagem_simples(sock).decode('utf-8'))
 
-        # Envia primeiro o tamanho da mensagem
-        tamanho = len(mensagem_bytes)
-        sock.sendall(tamanho.to_bytes(4, byteorder='big'))
+                if resposta.get("status") == "OCUPADO":
+                    raise ConnectionError("XML Service ocupado")
+                if resposta.get("versao_protocolo", 1) < VERSAO_PROTOCOLO:
+                    raise ConnectionError("XML Service nao suporta o protocolo persistente")
+                self.codificacoes = resposta.get("codificacoes", ["json"])
+                self.compressoes = resposta.get("compressoes", [])
+                self.modos = resposta.get("modos", ["sincrono"])
 
-        # Envia a mensagem propriamente dita
-        sock.sendall(mensagem_bytes)
+                # A thread de leitura bloqueia à espera de respostas
+                sock.settimeout(None)
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
 
-        # Recebe o tamanho da resposta
-        resposta_tamanho = int.from_bytes(sock.recv(4), byteorder='big')
+            except Exception:
+                sock.close()
+                raise
 
-        # Recebe a resposta do XML Service
-        resposta_bytes = sock.recv(resposta_tamanho)
-        resposta = json.loads(resposta_bytes.decode('utf-8'))
+            self._sock = sock
+            self.ativa = True
 
-        # Fecha o socket
-        sock.close()
+        threading.Thread(target=self._loop_leitura, args=(sock,), daemon=True).start()
+        print(f"Ligacao persistente ao XML Service em {self.host}:{self.port}")
 
-        # Verifica se o envio foi bem-sucedido
-        if resposta.get("status") == "OK":
-            print(f"Dados enviados com sucesso. ID Requisicao: {id_requisicao}")
+    def _loop_leitura(self, sock: socket.socket):
+        """
+        Lê as frames de resposta e entrega-as aos pedidos pendentes.
+        """
+        try:
+            while True:
+                _, tipo, id_pedido, payload = receber_frame(sock)
+
+                with self._lock:
+                    futuro = self._pendentes.pop(id_pedido, None)
+
+                if futuro is None:
+                    continue
+                if tipo in (FRAME_RESPOSTA, FRAME_PONG):
+                    futuro.set_result(payload)
+                else:
+                    # O pedido já não pode receber resposta: falha já em vez de esperar pelo timeout
+                    futuro.set_exception(ErroFrame(f"Resposta inesperada (frame tipo {tipo}) ao pedido {id_pedido}"))
+
+        except Exception as e:
+            self._falhar(sock, e)
+
+    def _falhar(self, sock: socket.socket, erro: Exception):
+        """
+        Marca a ligação como inativa e falha todos os pedidos pendentes.
+        """
+        with self._lock:
+            if self._sock is not sock:
+                return
+            self.ativa = False
+            self._sock = None
+            pendentes = self._pendentes
+            self._pendentes = {}
+
+        try:
+            sock.close()
+        except Exception:
+            pass
+
+        for futuro in pendentes.values():
+            if not futuro.done():
+                futuro.set_exception(ConnectionError(f"Ligacao ao XML Service perdida: {erro}"))
+
+    def novo_id(self) -> int:
+        with self._lock:
+            return next(self._ids) & 0xFFFFFFFF
+
+    def pedido(self, tipo: int, payload: BinaryIO, tamanho: int, flags: int = 0,
+               timeout: float = XML_SERVICE_TIMEOUT, id_pedido: Optional[int] = None) -> bytes:
+        """
+        Envia uma frame e espera pela resposta com o mesmo id.
+        As flags indicam a codificação e a compressão do payload.
+        O id só é indicado nas frames de um upload em streaming.
+        """
+        with self._lock:
+            sock = self._sock
+            if not self.ativa or sock is None:
+                raise ErroEnvio("Ligacao ao XML Service inativa")
+            if id_pedido is None:
+                id_pedido = next(self._ids) & 0xFFFFFFFF
+            futuro = Future()
+            self._pendentes[id_pedido] = futuro
+
+        try:
+            # O envio de uma frame não pode ser intercalado com outras
+            with self._lock_envio:
+                enviar_frame_ficheiro(sock, tipo, id_pedido, payload, tamanho, flags)
+
+        except Exception as e:
+            self._falhar(sock, e)
+            raise ErroEnvio(f"Falha ao enviar pedido: {e}")
+
+        try:
+            return futuro.result(timeout=timeout)
+        finally:
+            with self._lock:
+                self._pendentes.pop(id_pedido, None)
+
+    def enviar_frame(self, tipo: int, id_pedido: int, payload: bytes, flags: int = 0):
+        """
+        Envia uma frame sem esperar por resposta (lotes de um upload em streaming).
+        """
+        sock = self._sock
+        if not self.ativa or sock is None:
+            raise ErroEnvio("Ligacao ao XML Service inativa")
+
+        try:
+            with self._lock_envio:
+                enviar_frame(sock, tipo, id_pedido, payload, flags)
+        except Exception as e:
+            self._falhar(sock, e)
+            raise ErroEnvio(f"Falha ao enviar lote: {e}")
+
+    def ping(self, timeout: float = 5) -> bool:
+        """
+        Verifica se a ligação responde (frame PING/PONG).
+        """
+        sock = self._sock
+        try:
+            self.pedido(FRAME_PING, io.BytesIO(b''), 0, timeout=timeout)
             return True
-        else:
-            print(f"Erro ao enviar dados: {resposta.get('erro', 'Erro desconhecido')}")
+        except Exception as e:
+            if sock is not None:
+                self._falhar(sock, e)
             return False
 
+    def em_curso(self) -> int:
+        return len(self._pendentes)
+
+    def codificacao_preferida(self) -> int:
+        """
+        Devolve a codificação configurada, se o XML Service a aceitar, ou JSON.
+        O colunar é enviado em blocos; a um XML Service que só aceita um
+        bloco são enviados registos em JSON, para a memória não crescer com a mensagem.
+        """
+        if XML_SERVICE_CODIFICACAO == "colunar":
+            return CODIFICACAO_COLUNAR_BLOCOS if "colunar_blocos" in self.codificacoes else CODIFICACAO_JSON
+        if XML_SERVICE_CODIFICACAO in self.codificacoes:
+            return NOMES_CODIFICACOES[XML_SERVICE_CODIFICACAO]
+        return CODIFICACAO_JSON
+
+    def compressao_preferida(self) -> Optional[str]:
+        """
+        Devolve o codec de compressão configurado, se o XML Service o aceitar.
+        """
+        if XML_SERVICE_COMPRESSAO in self.compressoes:
+            return XML_SERVICE_COMPRESSAO
+        return None
+
+    def frame_pedido(self) -> int:
+        """
+        Devolve o tipo de frame do pedido: assíncrono ou streaming se estiver
+        configurado e o XML Service o aceitar, senão síncrono.
+        """
+        if XML_SERVICE_MODO == "assincrono" and "assincrono" in self.modos:
+            return FRAME_PEDIDO_ASSINCRONO
+        if XML_SERVICE_MODO == "streaming" and "streaming" in self.modos:
+            return FRAME_INICIO
+        return FRAME_PEDIDO
+
+
+class PoolLigacoes:
+    """
+    Pequeno pool de ligações persistentes ao XML Service.
+    Escolhe a ligação ativa com menos pedidos em curso, volta a ligar
+    automaticamente as ligações perdidas e verifica-as periodicamente com PING.
+    """
+
+    def __init__(self, tamanho: int = XML_SERVICE_POOL, host: str = XML_SERVICE_HOST,
+                 port: int = XML_SERVICE_PORT):
+        self._ligacoes: List[LigacaoXMLService] = [LigacaoXMLService(host, port) for _ in range(tamanho)]
+        self._verificacao = None
+
+    def obter(self) -> LigacaoXMLService:
+        """
+        Devolve uma ligação ativa, ligando (ou religando) se necessário.
+        """
+        self.iniciar_verificacao()
+        ativas = [ligacao for ligacao in self._ligacoes if ligacao.ativa]
+
+        # Abre mais ligações enquanto todas as ativas estiverem ocupadas
+        if not ativas or min(ligacao.em_curso() for ligacao in ativas) > 0:
+            for ligacao in self._ligacoes:
+                if not ligacao.ativa:
+                    try:
+                        ligacao.ligar()
+                        ativas.append(ligacao)
+                        break
+                    except Exception as e:
+                        print(f"Erro ao ligar ao XML Service: {e}")
+                        break
+
+        if not ativas:
+            raise ErroEnvio("Nenhuma ligacao ao XML Service disponivel")
+
+        return min(ativas, key=lambda ligacao: ligacao.em_curso())
+
+    def _loop_verificacao(self, intervalo: float):
+        while True:
+            time.sleep(intervalo)
+            for ligacao in self._ligacoes:
+                if ligacao.ativa and ligacao.em_curso() == 0 and not ligacao.ping():
+                    print("Ligacao ao XML Service sem resposta ao PING, a religar")
+                    try:
+                        ligacao.ligar()
+                    except Exception as e:
+                        print(f"Erro ao religar ao XML Service: {e}")
+
+    def iniciar_verificacao(self, intervalo: float = XML_SERVICE_PING_INTERVALO):
+        """
+        Inicia a verificação periódica (PING) das ligações ativas.
+        """
+        if self._verificacao is None:
+            self._verificacao = threading.Thread(target=self._loop_verificacao, args=(intervalo,), daemon=True)
+            self._verificacao.start()
+
+    def stats(self) -> dict:
+        return {
+            "ligacoes": len(self._ligacoes),
+            "ativas": sum(1 for ligacao in self._ligacoes if ligacao.ativa),
+            "pedidos_em_curso": sum(ligacao.em_curso() for ligacao in self._ligacoes)
+        }
+
+
+# Pool partilhado por todos os workers do Processador
+pool_xml_service = PoolLigacoes()
+
+
+def _enviar_pedido(ligacao: LigacaoXMLService, mensagem: BinaryIO, tamanho: int, flags: int,
+                   codificacao: int, codec: Optional[str], tipo: int) -> bytes:
+    """
+    Envia a mensagem e devolve a resposta.
+    Repete noutra ligação apenas se o pedido não chegou a ser enviado.
+    """
+    for tentativa in range(2):
+        mensagem.seek(0)
+        try:
+            if tentativa > 0:
+                ligacao = pool_xml_service.obter()
+            if (ligacao.codificacao_preferida() != codificacao or ligacao.compressao_preferida() != codec
+                    or ligacao.frame_pedido() != tipo):
+                raise ErroEnvio("Codificacao nao suportada pela nova ligacao")
+            return ligacao.pedido(tipo, mensagem, tamanho, flags=flags)
+        except ErroEnvio as e:
+            if tentativa == 1:
+                raise
+            print(f"Aviso: {e}, a tentar novamente")
+
+
+def _resultado_envio(resposta: dict, id_requisicao: str) -> bool:
+    """
+    Verifica se o envio foi bem-sucedido a partir da resposta do XML Service.
+    """
+    if resposta.get("status") == "OK":
+        print(f"Dados enviados com sucesso. ID Requisicao: {id_requisicao}")
+        return True
+    elif resposta.get("status") == "ACCEPTED":
+        # O pedido ficou guardado no XML Service; o resultado chega pelo webhook
+        print(f"Dados aceites pelo XML Service. ID Requisicao: {id_requisicao}, trabalho: {resposta.get('id_trabalho')}")
+        return True
+    else:
+        print(f"Erro ao enviar dados: {resposta.get('erro', 'Erro desconhecido')}")
+        return False
+
+
+def _enviar_fluxo(ligacao: LigacaoXMLService, cabecalho: dict, dados: Iterable[Dict]) -> dict:
+    """
+    Envia um pedido em streaming: frame INICIO com os metadados, uma frame LOTE
+    por cada XML_SERVICE_TAMANHO_LOTE registos (à medida que ficam prontos) e
+    uma frame FIM. Devolve a resposta final do XML Service.
+    Se a leitura dos registos falhar a meio, envia uma frame CANCELAR para o
+    XML Service descartar o upload (e libertar a vaga) e volta a lançar o erro.
+    """
+    codificacao = ligacao.codificacao_preferida()
+    codec = ligacao.compressao_preferida()
+    id_pedido = ligacao.novo_id()
+
+    # O INICIO é confirmado antes de se consumirem os registos
+    inicio = json.dumps(cabecalho).encode('utf-8')
+    for tentativa in range(XML_SERVICE_TENTATIVAS_OCUPADO + 1):
+        resposta = json.loads(ligacao.pedido(
+            FRAME_INICIO, io.BytesIO(inicio), len(inicio), id_pedido=id_pedido
+        ).decode('utf-8'))
+        if resposta.get("status") != "OCUPADO" or tentativa == XML_SERVICE_TENTATIVAS_OCUPADO:
+            break
+        espera = float(resposta.get("tentar_apos", 1)) * 2 ** tentativa
+        print(f"XML Service ocupado, nova tentativa em {espera:.0f}s")
+        time.sleep(espera)
+
+    if resposta.get("status") != "OK":
+        return resposta
+
+    registos = iter(dados)
+    total_registos = 0
+    total_lotes = 0
+    total_bytes = 0
+    try:
+        while True:
+            lote = list(itertools.islice(registos, XML_SERVICE_TAMANHO_LOTE))
+            if not lote:
+                break
+            payload, flags = serializar_lote(lote, codificacao, codec)
+            ligacao.enviar_frame(FRAME_LOTE, id_pedido, payload, flags)
+            total_registos += len(lote)
+            total_lotes += 1
+            total_bytes += len(payload)
+    except BaseException:
+        try:
+            ligacao.enviar_frame(FRAME_CANCELAR, id_pedido, b'')
+        except ErroEnvio:
+            # Ligação em falha: o XML Service descarta o upload ao fechá-la
+            pass
+        raise
+
+    pedidos_em_curso.atualizar(cabecalho["id_requisicao"], registos=total_registos, bytes=total_bytes)
+    print(f"Mensagem enviada em streaming: {total_registos} registros em {total_lotes} lotes")
+    return json.loads(ligacao.pedido(FRAME_FIM, io.BytesIO(b''), 0, id_pedido=id_pedido).decode('utf-8'))
+
+
+def enviar_para_xml_service(id_requisicao: str, mapper: dict, webhook_url: str, dados: Iterable[Dict],
+                            ficheiro: Optional[str] = None) -> bool:
+    """
+    Envia os dados processados para o XML Service através de uma ligação
+    TCP persistente (partilhada com outros pedidos).
+    Em modo assíncrono o XML Service responde logo que guarda o pedido
+    e o resultado final chega pelo webhook; em streaming os registos seguem
+    em lotes e o XML é criado enquanto os restantes ainda estão a ser lidos.
+    Os dados podem ser uma lista ou um gerador de registos.
+    O pedido fica registado em pedidos_em_curso até chegar o webhook.
+    """
+    sucesso = False
+    try:
+        # A codificação depende do que a ligação negociou com o XML Service
+        ligacao = pool_xml_service.obter()
+        codificacao = ligacao.codificacao_preferida()
+        tipo = ligacao.frame_pedido()
+
+        if tipo == FRAME_INICIO:
+            pedidos_em_curso.registar(id_requisicao, ficheiro=ficheiro)
+            resposta = _enviar_fluxo(ligacao, cabecalho_mensagem(id_requisicao, mapper, webhook_url), dados)
+            sucesso = _resultado_envio(resposta, id_requisicao)
+            return sucesso
+
+        # Serializa a mensagem à medida que os registos ficam prontos
+        mensagem, total_registos = serializar_mensagem(id_requisicao, mapper, webhook_url, dados, codificacao)
+
+        # Comprime a mensagem (em streaming) se for grande o suficiente
+        codec = ligacao.compressao_preferida()
+        flags = codificacao
+        tamanho = mensagem.seek(0, 2)
+        mensagem.seek(0)
+        print(f"Mensagem serializada: {total_registos} registros, {tamanho} bytes")
+
+        if codec and tamanho >= COMPRESSAO_MINIMO:
+            comprimida = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORIA)
+            with mensagem:
+                tamanho_comprimido = comprimir_ficheiro(mensagem, comprimida, codec)
+            print(f"Mensagem comprimida ({codec}): {tamanho} -> {tamanho_comprimido} bytes")
+            mensagem, tamanho = comprimida, tamanho_comprimido
+            flags |= CODECS_COMPRESSAO[codec][0] << FLAGS_COMPRESSAO_SHIFT
+
+        # Registado antes do envio: o webhook pode chegar antes da resposta
+        pedidos_em_curso.registar(id_requisicao, total_registos, tamanho, ficheiro)
+
+        with mensagem:
+            for tentativa in range(XML_SERVICE_TENTATIVAS_OCUPADO + 1):
+                if tentativa > 0:
+                    ligacao = pool_xml_service.obter()
+                resposta = json.loads(_enviar_pedido(ligacao, mensagem, tamanho, flags, codificacao, codec, tipo).decode('utf-8'))
+
+                # Pedido rejeitado sem ser processado: espera e volta a tentar
+                if resposta.get("status") != "OCUPADO" or tentativa == XML_SERVICE_TENTATIVAS_OCUPADO:
+                    break
+                espera = float(resposta.get("tentar_apos", 1)) * 2 ** tentativa
+                print(f"XML Service ocupado, nova tentativa em {espera:.0f}s")
+                time.sleep(espera)
+
+        sucesso = _resultado_envio(resposta, id_requisicao)
+        return sucesso
+
     except Exception as e:
         # Erro de ligação ou comunicação com o XML Service
         print(f"Erro ao conectar ao XML Service: {e}")
         return False
+
+    finally:
+        # Um pedido recusado ou falhado não vai receber webhook
+        if not sucesso:
+            pedidos_em_curso.remover(id_requisicao)
+
+
+def consultar_trabalho(id_trabalho: str) -> Optional[dict]:
+    """
+    Consulta no XML Service o estado de um trabalho assíncrono.
+    """
+    try:
+        payload = json.dumps({"id_trabalho": id_trabalho}).encode('utf-8')
+        resposta = pool_xml_service.obter().pedido(FRAME_ESTADO, io.BytesIO(payload), len(payload), timeout=10)
+        return json.loads(resposta.decode('utf-8'))
+
+    except Exception as e:
+        print(f"Erro ao consultar trabalho {id_trabalho}: {e}")
+        return None
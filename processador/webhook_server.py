@@ -1,5 +1,14 @@
+import hmac
 from flask import Flask, request, jsonify
-from api_client import cache_paises_api
+from config import SUPABASE_BUCKET, EVENTOS_TOKEN
+from api_client import cache_paises_api, cache_negativa_api, chamadas_api
+from referencia_paises import referencia_paises
+from http_client import cliente_http
+from fila_arquivos import fila_arquivos
+from socket_client import pool_xml_service, consultar_trabalho
+from pedidos_em_curso import pedidos_em_curso
+from bucket_monitor import metadados_arquivo, arquivo_inalterado, intervalo_monitorizacao
+from registo_ficheiros import registo_ficheiros
 
 # Cria a aplicação Flask
 app = Flask(__name__)
@@ -11,11 +20,8 @@ def limpar_cache():
     Limpa a cache utilizada nas consultas à API externa.
     """
     try:
-        # Guarda o tamanho da cache antes da limpeza
-        tamanho_antes = len(cache_paises_api)
-
-        # Limpa a cache
-        cache_paises_api.clear()
+        # Limpa as caches (memória e disco) e obtém o número de entradas removidas
+        tamanho_antes = cache_paises_api.clear() + cache_negativa_api.clear()
         print(f"Cache limpa: {tamanho_antes} entradas removidas")
 
         return jsonify({
@@ -36,38 +42,166 @@ def estatisticas_cache():
     return jsonify({
         "sucesso": True,
         "tamanho_cache": len(cache_paises_api),
-        "paises_em_cache": list(cache_paises_api.keys())[:10]
+        "paises_em_cache": cache_paises_api.keys()[:10],
+        "detalhes": cache_paises_api.stats(),
+        "cache_negativa": cache_negativa_api.stats(),
+        "consultas_em_curso": chamadas_api.em_curso(),
+        "consultas_coalescidas": chamadas_api.coalescidas,
+        "referencia": referencia_paises.stats()
+    }), 200
+
+
+@app.route('/http/stats', methods=['GET'])
+def estatisticas_http():
+    """
+    Devolve os contadores do pool de ligações HTTP (reutilização por host).
+    """
+    return jsonify({
+        "sucesso": True,
+        **cliente_http.stats()
     }), 200
 
 
+@app.route('/eventos/storage', methods=['POST'])
+def evento_storage():
+    """
+    Recebe notificações de "objeto criado" do Supabase Storage
+    (Database Webhook sobre storage.objects) e coloca o CSV na fila de imediato.
+    """
+    try:
+        # Verifica o token partilhado, se configurado
+        autorizacao = request.headers.get("Authorization", "")
+        if EVENTOS_TOKEN and not hmac.compare_digest(autorizacao.encode(), f"Bearer {EVENTOS_TOKEN}".encode()):
+            return jsonify({"sucesso": False, "erro": "Nao autorizado"}), 401
+
+        dados = request.get_json(silent=True) or {}
+
+        # Aceita o formato do Database Webhook ({"type", "record"}) ou um objeto simples
+        tipo = dados.get("type", "INSERT")
+        registo = dados.get("record") or dados
+        nome = registo.get("name") or registo.get("nome")
+        bucket = registo.get("bucket_id", SUPABASE_BUCKET)
+
+        if tipo not in ("INSERT", "UPDATE") or not nome:
+            return jsonify({"sucesso": True, "estado": "ignorado"}), 200
+
+        if bucket != SUPABASE_BUCKET or not nome.endswith('.csv'):
+            return jsonify({"sucesso": True, "estado": "ignorado"}), 200
+
+        # Não volta a processar ficheiros que o registo já conhece
+        metadados = metadados_arquivo({**registo, "name": nome})
+        if arquivo_inalterado(metadados):
+            return jsonify({"sucesso": True, "estado": "ja_processado"}), 200
+
+        if fila_arquivos.enfileirar(nome, metadados):
+            print(f"\nEvento do Storage: {nome} colocado na fila")
+            estado = "enfileirado"
+        elif fila_arquivos.reclamado(nome, metadados):
+            estado = "em_fila"
+        else:
+            # Fila cheia: só neste caso se acorda a verificação periódica,
+            # que volta a tentar com o intervalo mínimo
+            estado = "adiado"
+            intervalo_monitorizacao.sinalizar()
+
+        return jsonify({"sucesso": True, "estado": estado}), 202
+
+    except Exception as e:
+        print(f"Erro ao processar evento do Storage: {e}")
+        return jsonify({"sucesso": False, "erro": str(e)}), 500
+
+
+@app.route('/fila/stats', methods=['GET'])
+def estatisticas_fila():
+    """
+    Devolve o estado da fila de ficheiros e dos workers.
+    """
+    return jsonify({
+        "sucesso": True,
+        **fila_arquivos.stats(),
+        "intervalo_verificacao": intervalo_monitorizacao.atual,
+        "xml_service": pool_xml_service.stats()
+    }), 200
+
+
+@app.route('/pedidos/stats', methods=['GET'])
+def estatisticas_pedidos():
+    """
+    Devolve os pedidos ao XML Service à espera de webhook, as latências
+    de ponta a ponta (p50/p95/p99), o débito e os pedidos presos.
+    """
+    return jsonify({"sucesso": True, **pedidos_em_curso.stats()}), 200
+
+
+@app.route('/trabalhos/<id_trabalho>', methods=['GET'])
+def estado_trabalho(id_trabalho):
+    """
+    Consulta no XML Service o estado de um trabalho assíncrono.
+    """
+    resposta = consultar_trabalho(id_trabalho)
+    if resposta is None:
+        return jsonify({"sucesso": False, "erro": "XML Service indisponivel"}), 503
+    if resposta.get("status") == "DESCONHECIDO":
+        return jsonify({"sucesso": False, "erro": resposta.get("erro")}), 404
+    return jsonify({"sucesso": True, **resposta}), 200
+
+
+def registar_notificacao(dados: dict):
+    """
+    Mostra o resultado de uma notificação do XML Service.
+    Num OK, o ficheiro da requisição passa a processado (se ainda estava pendente).
+    Num erro, o ficheiro da requisição deixa de estar marcado como processado
+    e volta a ser tentado na próxima verificação do bucket.
+    """
+    id_requisicao = dados.get('id_requisicao')
+    status = dados.get('status')
+    documento_id = dados.get('documento_id')
+
+    # Mostra o resultado recebido
+    print(f"\nWebhook recebido:")
+    print(f"   ID Requisicao: {id_requisicao}")
+    print(f"   Status: {status}")
+    print(f"   Documento ID: {documento_id}")
+
+    # Fecha o pedido em curso e mede a latência de ponta a ponta
+    latencia = pedidos_em_curso.concluir(id_requisicao, status)
+    if latencia is not None:
+        print(f"   Latencia: {latencia:.2f}s")
+
+    # Interpreta o estado devolvido pelo XML Service
+    if status == "OK":
+        print("XML salvo com sucesso!")
+    elif status == "ERRO_VALIDACAO":
+        print("Erro na validacao do XML")
+    elif status == "ERRO_PERSISTENCIA":
+        print("Erro ao persistir XML no banco")
+    else:
+        print("Erro no processamento do pedido")
+
+    if status == "OK":
+        registo_ficheiros.confirmar_requisicao(id_requisicao)
+    else:
+        nome_arquivo = registo_ficheiros.remover_por_requisicao(id_requisicao)
+        if nome_arquivo:
+            print(f"Arquivo {nome_arquivo} volta a ser processado")
+            intervalo_monitorizacao.sinalizar()
+
+
 @app.route('/webhook', methods=['POST'])
 def webhook():
     """
     Recebe notificações do XML Service sobre o estado da persistência.
+    Aceita uma notificação ou um lote em {"notificacoes": [...]}.
     """
     try:
         # Lê os dados enviados pelo XML Service
         dados = request.get_json()
+        notificacoes = dados.get('notificacoes', [dados])
+
+        for notificacao in notificacoes:
+            registar_notificacao(notificacao)
 
-        id_requisicao = dados.get('id_requisicao')
-        status = dados.get('status')
-        documento_id = dados.get('documento_id')
-
-        # Mostra o resultado recebido
-        print(f"\nWebhook recebido:")
-        print(f"   ID Requisicao: {id_requisicao}")
-        print(f"   Status: {status}")
-        print(f"   Documento ID: {documento_id}")
-
-        # Interpreta o estado devolvido pelo XML Service
-        if status == "OK":
-            print("XML salvo com sucesso!")
-        elif status == "ERRO_VALIDACAO":
-            print("Erro na validacao do XML")
-        elif status == "ERRO_PERSISTENCIA":
-            print("Erro ao persistir XML no banco")
-
-        return jsonify({"status": "received"}), 200
+        return jsonify({"status": "received", "notificacoes": len(notificacoes)}), 200
 
     except Exception as e:
         print(f"Erro ao processar webhook: {e}")
@@ -8,3 +8,103 @@ SOCKET_PORT = int(os.getenv("SOCKET_PORT", "8888"))
 
 # Porta usada pelo serviço gRPC
 GRPC_PORT = int(os.getenv("GRPC_PORT", "5000"))
+
+# Tamanho da fila de ligações pendentes do servidor de sockets
+SOCKET_BACKLOG = int(os.getenv("SOCKET_BACKLOG", "1024"))
+
+# Número máximo de ligações abertas ao servidor de sockets
+SOCKET_MAX_LIGACOES = int(os.getenv("SOCKET_MAX_LIGACOES", "2000"))
+
+# Número máximo de pedidos em processamento (os restantes recebem "OCUPADO")
+SOCKET_MAX_PEDIDOS = int(os.getenv("SOCKET_MAX_PEDIDOS", "16"))
+
+# Threads para criar e validar XML (trabalho de CPU com lxml)
+XML_WORKERS = int(os.getenv("XML_WORKERS", str(os.cpu_count() or 2)))
+
+# Processos que constroem e validam XML grandes em paralelo (0 desativa)
+XML_PROCESSOS = int(os.getenv("XML_PROCESSOS", str(os.cpu_count() or 2)))
+
+# Registos por parte (shard) enviada a um processo; pedidos mais pequenos não são divididos
+XML_SHARD_REGISTOS = int(os.getenv("XML_SHARD_REGISTOS", "5000"))
+
+# Número máximo de partes submetidas ao pool e ainda por terminar
+XML_SHARDS_PENDENTES = int(os.getenv("XML_SHARDS_PENDENTES", str(2 * XML_PROCESSOS)))
+
+# Tempo máximo (segundos) à espera de uma parte; se o pool não responder é desativado
+XML_SHARD_TIMEOUT = float(os.getenv("XML_SHARD_TIMEOUT", "300"))
+
+# Guarda o XML formatado (indentado) na base de dados; por omissão fica compacto
+XML_FORMATADO = os.getenv("XML_FORMATADO", "false").lower() == "true"
+
+# Serializador do XML dos pedidos: "template" (texto gerado por template, rápido) ou "lxml" (árvore)
+XML_SERIALIZADOR = os.getenv("XML_SERIALIZADOR", "template")
+
+# Threads para escritas na base de dados e envio de webhooks
+DB_WORKERS = int(os.getenv("DB_WORKERS", "4"))
+
+# Intervalo (segundos) entre os registos de estatísticas no log (0 desativa)
+ESTATISTICAS_INTERVALO = float(os.getenv("ESTATISTICAS_INTERVALO", "60"))
+
+# Segundos sugeridos ao cliente antes de repetir um pedido rejeitado por "OCUPADO"
+SOCKET_TENTAR_APOS = float(os.getenv("SOCKET_TENTAR_APOS", "1"))
+
+# Número de hosts com pool de ligações HTTP mantido em simultâneo
+HTTP_POOL_HOSTS = int(os.getenv("HTTP_POOL_HOSTS", "4"))
+
+# Número máximo de ligações HTTP abertas por host
+HTTP_POOL_POR_HOST = int(os.getenv("HTTP_POOL_POR_HOST", "4"))
+
+# Timeout por omissão dos pedidos HTTP (segundos)
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "10"))
+
+# Pasta para os dados locais persistentes (fila de trabalhos)
+DATA_DIR = os.getenv("DATA_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data"))
+
+# Ficheiro SQLite com a fila de trabalhos assíncronos
+TRABALHOS_DB_PATH = os.getenv("TRABALHOS_DB_PATH", os.path.join(DATA_DIR, "trabalhos.db"))
+
+# Pasta onde ficam os payloads dos trabalhos por processar
+TRABALHOS_DIR = os.getenv("TRABALHOS_DIR", os.path.join(DATA_DIR, "trabalhos"))
+
+# Número de workers que processam os trabalhos assíncronos
+TRABALHOS_WORKERS = int(os.getenv("TRABALHOS_WORKERS", "2"))
+
+# Número máximo de trabalhos pendentes (acima disto o pedido recebe "OCUPADO")
+TRABALHOS_MAX_PENDENTES = int(os.getenv("TRABALHOS_MAX_PENDENTES", "500"))
+
+# Tempo (segundos) que os trabalhos terminados ficam disponíveis para consulta
+TRABALHOS_RETENCAO = int(os.getenv("TRABALHOS_RETENCAO", str(7 * 24 * 3600)))
+
+# Número máximo de lotes de um upload em streaming guardados em memória ao mesmo tempo
+FLUXO_MAX_LOTES_PENDENTES = int(os.getenv("FLUXO_MAX_LOTES_PENDENTES", "4"))
+
+# Tempo (segundos) sem frames de um upload em streaming até ser descartado (0 desativa)
+FLUXO_TIMEOUT = float(os.getenv("FLUXO_TIMEOUT", "300"))
+
+# Tamanho máximo (bytes) de uma frame/mensagem recebida por socket
+TAMANHO_MAX_FRAME = int(os.getenv("TAMANHO_MAX_FRAME", str(256 * 1024 * 1024)))
+
+# Ficheiro SQLite com a fila de webhooks por entregar
+WEBHOOKS_DB_PATH = os.getenv("WEBHOOKS_DB_PATH", os.path.join(DATA_DIR, "webhooks.db"))
+
+# Número de threads que entregam webhooks
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "2"))
+
+# Número máximo de notificações enviadas num só POST (1 desativa o agrupamento)
+WEBHOOK_LOTE_MAX = int(os.getenv("WEBHOOK_LOTE_MAX", "20"))
+
+# Tempo (segundos) de espera por mais notificações antes de enviar um lote
+WEBHOOK_ESPERA_LOTE = float(os.getenv("WEBHOOK_ESPERA_LOTE", "0.2"))
+
+# Número máximo de tentativas de entrega de uma notificação
+WEBHOOK_MAX_TENTATIVAS = int(os.getenv("WEBHOOK_MAX_TENTATIVAS", "10"))
+
+# Espera (segundos) antes da primeira repetição e máximo da espera exponencial
+WEBHOOK_ESPERA_BASE = float(os.getenv("WEBHOOK_ESPERA_BASE", "1"))
+WEBHOOK_ESPERA_MAX = float(os.getenv("WEBHOOK_ESPERA_MAX", "300"))
+
+# Timeout (segundos) de cada POST de webhook
+WEBHOOK_TIMEOUT = float(os.getenv("WEBHOOK_TIMEOUT", "10"))
+
+# Tempo (segundos) que as notificações falhadas ficam guardadas para inspeção
+WEBHOOK_RETENCAO = int(os.getenv("WEBHOOK_RETENCAO", str(7 * 24 * 3600)))
@@ -0,0 +1,245 @@
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from typing import List, Optional, Tuple
+from http_client import cliente_http
+from config import (
+    WEBHOOKS_DB_PATH, WEBHOOK_WORKERS, WEBHOOK_LOTE_MAX, WEBHOOK_ESPERA_LOTE,
+    WEBHOOK_MAX_TENTATIVAS, WEBHOOK_ESPERA_BASE, WEBHOOK_ESPERA_MAX, WEBHOOK_TIMEOUT, WEBHOOK_RETENCAO
+)
+
+# Estados de uma notificação na fila
+ESTADO_PENDENTE = "PENDENTE"
+ESTADO_ENVIANDO = "ENVIANDO"
+ESTADO_FALHADO = "FALHADO"
+
+# Intervalo (segundos) entre limpezas das notificações falhadas antigas
+INTERVALO_LIMPEZA = 3600
+
+
+class DespachanteWebhooks:
+    """
+    Entrega os webhooks em background a partir de uma fila persistente (SQLite).
+    Quem gera a notificação só a guarda na fila e continua; os workers enviam-na
+    pelo pool de ligações HTTP, repetem com espera exponencial quando o destino
+    falha e juntam várias notificações para o mesmo URL num só POST.
+    """
+
+    def __init__(self, caminho: str = WEBHOOKS_DB_PATH, num_workers: int = WEBHOOK_WORKERS,
+                 lote_max: int = WEBHOOK_LOTE_MAX, espera_lote: float = WEBHOOK_ESPERA_LOTE):
+        self.caminho = caminho
+        self.num_workers = num_workers
+        self.lote_max = max(1, lote_max)
+        self.espera_lote = espera_lote
+        self._lock = threading.Lock()
+        self._condicao = threading.Condition(self._lock)
+        self._workers = []
+        self._ultima_limpeza = 0.0
+
+        # Contadores para as estatísticas
+        self.entregues = 0
+        self.posts = 0
+        self.falhas = 0
+
+        pasta = os.path.dirname(caminho)
+        if pasta:
+            os.makedirs(pasta, exist_ok=True)
+
+        self._conn = sqlite3.connect(caminho, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS webhooks (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                url TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                estado TEXT NOT NULL,
+                tentativas INTEGER NOT NULL DEFAULT 0,
+                proxima_tentativa REAL NOT NULL,
+                ultimo_erro TEXT,
+                criado_em REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_webhooks_estado ON webhooks (estado, proxima_tentativa)")
+
+        # Notificações que estavam a ser enviadas quando o serviço parou
+        self._conn.execute("UPDATE webhooks SET estado = ? WHERE estado = ?", (ESTADO_PENDENTE, ESTADO_ENVIANDO))
+        self._conn.commit()
+
+    def enfileirar(self, url: str, payload: dict) -> bool:
+        """
+        Guarda a notificação na fila e acorda um worker. Não espera pela entrega.
+        """
+        if not url:
+            return False
+
+        agora = time.time()
+        with self._condicao:
+            self._conn.execute(
+                """
+                INSERT INTO webhooks (url, payload, estado, proxima_tentativa, criado_em)
+                VALUES (?, ?, ?, ?, ?)
+                """,
+                (url, json.dumps(payload), ESTADO_PENDENTE, agora, agora)
+            )
+            self._conn.commit()
+            self._condicao.notify()
+        return True
+
+    def _reclamar(self) -> Tuple[Optional[str], List[tuple], float]:
+        # Chamado com o lock adquirido. Devolve (url, [(id, payload)], segundos até à próxima)
+        agora = time.time()
+        linha = self._conn.execute(
+            "SELECT url FROM webhooks WHERE estado = ? AND proxima_tentativa <= ? ORDER BY id LIMIT 1",
+            (ESTADO_PENDENTE, agora)
+        ).fetchone()
+
+        if linha is None:
+            proxima = self._conn.execute(
+                "SELECT MIN(proxima_tentativa) FROM webhooks WHERE estado = ?", (ESTADO_PENDENTE,)
+            ).fetchone()[0]
+            espera = 30.0 if proxima is None else min(30.0, max(0.05, proxima - agora))
+            return None, [], espera
+
+        url = linha[0]
+        linhas = self._conn.execute(
+            """
+            SELECT id, payload FROM webhooks
+            WHERE estado = ? AND url = ? AND proxima_tentativa <= ?
+            ORDER BY id LIMIT ?
+            """,
+            (ESTADO_PENDENTE, url, agora, self.lote_max)
+        ).fetchall()
+
+        self._conn.executemany(
+            "UPDATE webhooks SET estado = ? WHERE id = ?",
+            [(ESTADO_ENVIANDO, id_webhook) for id_webhook, _ in linhas]
+        )
+        self._conn.commit()
+        return url, linhas, 0.0
+
+    def _entregar(self, url: str, payloads: List[dict]) -> Optional[str]:
+        """
+        Envia as notificações num POST. Devolve None se correu bem, senão o erro.
+        Uma notificação sozinha segue no formato original; várias seguem em
+        {"notificacoes": [...]}.
+        """
+        corpo = payloads[0] if len(payloads) == 1 else {"notificacoes": payloads}
+        try:
+            response = cliente_http.post(url, json=corpo, timeout=WEBHOOK_TIMEOUT)
+            if 200 <= response.status_code < 300:
+                return None
+            return f"HTTP {response.status_code}"
+        except Exception as e:
+            return str(e)
+
+    def _concluir(self, linhas: List[tuple], erro: Optional[str]):
+        ids = [id_webhook for id_webhook, _ in linhas]
+        with self._lock:
+            self.posts += 1
+            if erro is None:
+                self.entregues += len(ids)
+                self._conn.executemany("DELETE FROM webhooks WHERE id = ?", [(i,) for i in ids])
+                self._conn.commit()
+                return
+
+            self.falhas += 1
+            agora = time.time()
+
+            # Jitter igual para o lote todo, para as notificações voltarem a seguir juntas
+            jitter = random.uniform(0.5, 1.0)
+            for id_webhook in ids:
+                tentativas = self._conn.execute(
+                    "SELECT tentativas FROM webhooks WHERE id = ?", (id_webhook,)
+                ).fetchone()[0] + 1
+
+                # Espera exponencial com jitter para não insistir todos ao mesmo tempo
+                espera = min(WEBHOOK_ESPERA_MAX, WEBHOOK_ESPERA_BASE * 2 ** (tentativas - 1)) * jitter
+                estado = ESTADO_FALHADO if tentativas >= WEBHOOK_MAX_TENTATIVAS else ESTADO_PENDENTE
+
+                self._conn.execute(
+                    """
+                    UPDATE webhooks SET estado = ?, tentativas = ?, proxima_tentativa = ?, ultimo_erro = ?
+                    WHERE id = ?
+                    """,
+                    (estado, tentativas, agora + espera, erro, id_webhook)
+                )
+            self._conn.commit()
+
+    def _loop_worker(self):
+        while True:
+            with self._condicao:
+                url, linhas, espera = self._reclamar()
+                acordado = False
+                if not linhas:
+                    acordado = self._condicao.wait(timeout=espera)
+
+            if not linhas:
+                # Dá tempo para chegarem mais notificações e seguirem no mesmo POST
+                if acordado and self.lote_max > 1 and self.espera_lote > 0:
+                    time.sleep(self.espera_lote)
+                elif time.time() - self._ultima_limpeza >= INTERVALO_LIMPEZA:
+                    self.limpar_falhados()
+                continue
+
+            erro = self._entregar(url, [json.loads(payload) for _, payload in linhas])
+            self._concluir(linhas, erro)
+
+            if erro is None:
+                estatisticas = cliente_http.stats()
+                print(
+                    f"Webhook enviado para {url}: {len(linhas)} notificacao(oes) "
+                    f"(ligacoes reutilizadas: {estatisticas['ligacoes_reutilizadas']}/{estatisticas['pedidos']})"
+                )
+            else:
+                print(f"Erro ao enviar webhook para {url} ({len(linhas)} notificacao(oes)): {erro}")
+
+    def limpar_falhados(self, retencao: int = WEBHOOK_RETENCAO) -> int:
+        """
+        Remove as notificações falhadas criadas há mais tempo do que a retenção.
+        """
+        with self._lock:
+            self._ultima_limpeza = time.time()
+            cursor = self._conn.execute(
+                "DELETE FROM webhooks WHERE estado = ? AND criado_em < ?",
+                (ESTADO_FALHADO, time.time() - retencao)
+            )
+            self._conn.commit()
+        if cursor.rowcount:
+            print(f"Removidas {cursor.rowcount} notificacao(oes) falhada(s) antiga(s)")
+        return cursor.rowcount
+
+    def iniciar(self):
+        """
+        Remove as notificações falhadas antigas e inicia os workers que entregam os webhooks.
+        """
+        self.limpar_falhados()
+        for _ in range(self.num_workers - len(self._workers)):
+            worker = threading.Thread(
+                target=self._loop_worker,
+                name=f"webhook-worker-{len(self._workers) + 1}",
+                daemon=True
+            )
+            worker.start()
+            self._workers.append(worker)
+
+    def stats(self) -> dict:
+        with self._lock:
+            contagens = dict(self._conn.execute("SELECT estado, COUNT(*) FROM webhooks GROUP BY estado").fetchall())
+            return {
+                "workers": self.num_workers,
+                "lote_max": self.lote_max,
+                "pendentes": contagens.get(ESTADO_PENDENTE, 0) + contagens.get(ESTADO_ENVIANDO, 0),
+                "falhados": contagens.get(ESTADO_FALHADO, 0),
+                "entregues": self.entregues,
+                "posts": self.posts,
+                "falhas": self.falhas
+            }
+
+
+# Despachante global usado pelo servidor de sockets
+despachante_webhooks = DespachanteWebhooks()
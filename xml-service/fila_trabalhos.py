@@ -0,0 +1,226 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Callable, Optional
+from config import (
+    TRABALHOS_DB_PATH, TRABALHOS_DIR, TRABALHOS_WORKERS, TRABALHOS_MAX_PENDENTES, TRABALHOS_RETENCAO
+)
+
+# Estados de um trabalho assíncrono
+ESTADO_PENDENTE = "PENDENTE"
+ESTADO_EM_PROCESSAMENTO = "EM_PROCESSAMENTO"
+ESTADO_CONCLUIDO = "CONCLUIDO"
+ESTADO_ERRO = "ERRO"
+
+
+class FilaTrabalhos:
+    """
+    Fila persistente (SQLite + ficheiros) dos pedidos em modo assíncrono.
+    O pedido é guardado em disco antes de o cliente receber "ACCEPTED" e é
+    processado depois por um grupo de workers. Trabalhos interrompidos por
+    um reinício voltam a ficar pendentes (processamento pelo menos uma vez).
+    """
+
+    def __init__(self, caminho: str = TRABALHOS_DB_PATH, pasta: str = TRABALHOS_DIR,
+                 num_workers: int = TRABALHOS_WORKERS, max_pendentes: int = TRABALHOS_MAX_PENDENTES):
+        self.caminho = caminho
+        self.pasta = pasta
+        self.num_workers = num_workers
+        self.max_pendentes = max_pendentes
+        self._lock = threading.Lock()
+        self._condicao = threading.Condition(self._lock)
+        self._workers = []
+
+        os.makedirs(pasta, exist_ok=True)
+        pasta_db = os.path.dirname(caminho)
+        if pasta_db:
+            os.makedirs(pasta_db, exist_ok=True)
+
+        self._conn = sqlite3.connect(caminho, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS trabalhos (
+                id TEXT PRIMARY KEY,
+                estado TEXT NOT NULL,
+                codificacao INTEGER NOT NULL,
+                ficheiro TEXT,
+                resultado TEXT,
+                criado_em REAL NOT NULL,
+                atualizado_em REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_trabalhos_estado ON trabalhos (estado, criado_em)")
+
+        # Trabalhos que estavam a ser processados quando o serviço parou
+        self._conn.execute(
+            "UPDATE trabalhos SET estado = ? WHERE estado = ?",
+            (ESTADO_PENDENTE, ESTADO_EM_PROCESSAMENTO)
+        )
+        self._conn.commit()
+
+    def _pendentes(self) -> int:
+        return self._conn.execute(
+            "SELECT COUNT(*) FROM trabalhos WHERE estado IN (?, ?)",
+            (ESTADO_PENDENTE, ESTADO_EM_PROCESSAMENTO)
+        ).fetchone()[0]
+
+    def adicionar(self, codificacao: int, payload: bytes) -> Optional[str]:
+        """
+        Guarda o pedido em disco e coloca-o na fila.
+        Devolve o id do trabalho, ou None se a fila estiver cheia.
+        """
+        with self._lock:
+            if self._pendentes() >= self.max_pendentes:
+                return None
+
+        id_trabalho = uuid.uuid4().hex
+        ficheiro = os.path.join(self.pasta, f"{id_trabalho}.bin")
+
+        # Escrita atómica e sincronizada: o "ACCEPTED" só é enviado depois disto
+        temporario = ficheiro + ".tmp"
+        with open(temporario, "wb") as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporario, ficheiro)
+
+        agora = time.time()
+        with self._condicao:
+            self._conn.execute(
+                """
+                INSERT INTO trabalhos (id, estado, codificacao, ficheiro, criado_em, atualizado_em)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                (id_trabalho, ESTADO_PENDENTE, codificacao, ficheiro, agora, agora)
+            )
+            self._conn.commit()
+            self._condicao.notify()
+
+        return id_trabalho
+
+    def estado(self, id_trabalho: str) -> Optional[dict]:
+        """
+        Devolve o estado (e o resultado, se já terminou) de um trabalho.
+        """
+        with self._lock:
+            linha = self._conn.execute(
+                "SELECT id, estado, resultado, criado_em, atualizado_em FROM trabalhos WHERE id = ?",
+                (id_trabalho,)
+            ).fetchone()
+
+        if linha is None:
+            return None
+
+        return {
+            "id_trabalho": linha["id"],
+            "estado": linha["estado"],
+            "resultado": json.loads(linha["resultado"]) if linha["resultado"] else None,
+            "criado_em": linha["criado_em"],
+            "atualizado_em": linha["atualizado_em"]
+        }
+
+    def _reclamar(self) -> Optional[sqlite3.Row]:
+        # Chamado com o lock adquirido
+        linha = self._conn.execute(
+            "SELECT id, codificacao, ficheiro FROM trabalhos WHERE estado = ? ORDER BY criado_em LIMIT 1",
+            (ESTADO_PENDENTE,)
+        ).fetchone()
+        if linha is not None:
+            self._conn.execute(
+                "UPDATE trabalhos SET estado = ?, atualizado_em = ? WHERE id = ?",
+                (ESTADO_EM_PROCESSAMENTO, time.time(), linha["id"])
+            )
+            self._conn.commit()
+        return linha
+
+    def _concluir(self, id_trabalho: str, ficheiro: str, resposta: dict):
+        estado = ESTADO_CONCLUIDO if resposta.get("status") == "OK" else ESTADO_ERRO
+        with self._lock:
+            self._conn.execute(
+                "UPDATE trabalhos SET estado = ?, resultado = ?, ficheiro = NULL, atualizado_em = ? WHERE id = ?",
+                (estado, json.dumps(resposta), time.time(), id_trabalho)
+            )
+            self._conn.commit()
+
+        try:
+            os.remove(ficheiro)
+        except OSError:
+            pass
+
+    def _loop_worker(self, processar: Callable[[int, bytes], dict],
+                     ao_falhar: Optional[Callable[[int, bytes, dict], None]]):
+        while True:
+            with self._condicao:
+                trabalho = self._reclamar()
+                while trabalho is None:
+                    self._condicao.wait(timeout=30)
+                    trabalho = self._reclamar()
+
+            id_trabalho = trabalho["id"]
+            payload = None
+            try:
+                with open(trabalho["ficheiro"], "rb") as f:
+                    payload = f.read()
+                resposta = processar(trabalho["codificacao"], payload)
+            except Exception as e:
+                print(f"Erro ao processar trabalho {id_trabalho}: {e}")
+                resposta = {"status": "ERRO", "erro": str(e)}
+
+                # O processamento não chegou a notificar o cliente: avisa agora
+                if ao_falhar is not None and payload is not None:
+                    try:
+                        ao_falhar(trabalho["codificacao"], payload, resposta)
+                    except Exception as erro_aviso:
+                        print(f"Erro ao notificar a falha do trabalho {id_trabalho}: {erro_aviso}")
+
+            self._concluir(id_trabalho, trabalho["ficheiro"], resposta)
+            print(f"Trabalho {id_trabalho} terminado: {resposta.get('status')}")
+
+    def iniciar(self, processar: Callable[[int, bytes], dict],
+                ao_falhar: Optional[Callable[[int, bytes, dict], None]] = None):
+        """
+        Remove os trabalhos antigos e inicia os workers com a função indicada.
+        Se `processar` lançar uma exceção, `ao_falhar` é chamada com o pedido e a resposta de erro.
+        """
+        self.limpar_antigos()
+        for _ in range(self.num_workers - len(self._workers)):
+            worker = threading.Thread(
+                target=self._loop_worker,
+                args=(processar, ao_falhar),
+                name=f"trabalhos-worker-{len(self._workers) + 1}",
+                daemon=True
+            )
+            worker.start()
+            self._workers.append(worker)
+
+    def limpar_antigos(self, retencao: int = TRABALHOS_RETENCAO) -> int:
+        """
+        Remove os trabalhos terminados há mais tempo do que a retenção.
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM trabalhos WHERE estado IN (?, ?) AND atualizado_em < ?",
+                (ESTADO_CONCLUIDO, ESTADO_ERRO, time.time() - retencao)
+            )
+            self._conn.commit()
+            return cursor.rowcount
+
+    def stats(self) -> dict:
+        with self._lock:
+            contagens = dict(self._conn.execute("SELECT estado, COUNT(*) FROM trabalhos GROUP BY estado").fetchall())
+        return {
+            "workers": self.num_workers,
+            "max_pendentes": self.max_pendentes,
+            **{estado.lower(): contagens.get(estado, 0) for estado in
+               (ESTADO_PENDENTE, ESTADO_EM_PROCESSAMENTO, ESTADO_CONCLUIDO, ESTADO_ERRO)}
+        }
+
+
+# Fila global usada pelo servidor de sockets
+fila_trabalhos = FilaTrabalhos()
@@ -18,6 +18,7 @@ except ImportError:
     import xml_service_pb2
 
 from config import SOCKET_PORT, GRPC_PORT
+from pool_xml import pool_xml
 from socket_server import servidor_socket
 from grpc_server import servidor_grpc
 
@@ -35,6 +36,9 @@ def main():
     print(f"gRPC: 0.0.0.0:{GRPC_PORT}")
     print("=" * 60)
 
+    # Cria os processos do pool de XML (com fork) antes de iniciar qualquer thread
+    pool_xml.iniciar()
+
     # Inicia o servidor de sockets em background
     socket_thread = threading.Thread(target=servidor_socket, daemon=True)
     socket_thread.start()
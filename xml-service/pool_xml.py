@@ -0,0 +1,168 @@
+import multiprocessing
+import threading
+from concurrent.futures import CancelledError, Future, ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional, Tuple
+from xml_builder import construir_fragmento, criar_construtor, juntar_fragmentos
+from config import XML_PROCESSOS, XML_SHARD_REGISTOS, XML_SHARDS_PENDENTES, XML_SHARD_TIMEOUT, XML_FORMATADO
+
+
+class PoolXML:
+    """
+    Constrói XML grandes em vários núcleos: os registos são divididos em
+    partes (shards) de XML_SHARD_REGISTOS, cada parte é construída e validada
+    num processo do pool e os fragmentos são juntos no documento final.
+    O pool é partilhado por todos os pedidos e no máximo XML_SHARDS_PENDENTES
+    partes ficam à espera de um processo: quem submete fica bloqueado até
+    XML_SHARD_TIMEOUT e depois constrói essa parte na sua própria thread.
+    """
+
+    def __init__(self, num_processos: int = XML_PROCESSOS, tamanho_shard: int = XML_SHARD_REGISTOS,
+                 max_pendentes: int = XML_SHARDS_PENDENTES, timeout: float = XML_SHARD_TIMEOUT):
+        self.num_processos = num_processos
+        self.tamanho_shard = max(1, tamanho_shard)
+        self.max_pendentes = max(1, max_pendentes)
+        self.timeout = timeout
+        self._vagas = threading.BoundedSemaphore(self.max_pendentes)
+        self._lock = threading.Lock()
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+        # Contadores para as estatísticas
+        self.documentos = 0
+        self.shards = 0
+        self.shards_locais = 0
+        self.falhas_pool = 0
+
+    @property
+    def ativo(self) -> bool:
+        return self._executor is not None
+
+    def usar_para(self, dados: List[Dict]) -> bool:
+        """
+        Só compensa dividir quando há registos para pelo menos dois shards
+        (e o pool foi criado e não avariou).
+        """
+        return self.ativo and len(dados) > self.tamanho_shard
+
+    def iniciar(self):
+        """
+        Cria os processos do pool. Os processos são criados com fork, por isso
+        tem de ser chamado por main() no arranque, antes de qualquer thread
+        (servidor de sockets, gRPC, workers) ser iniciada; se já houver
+        threads a correr, o pool não é criado e o XML é construído nas threads.
+        """
+        if self.num_processos <= 0 or self._executor is not None:
+            return
+        if threading.active_count() > 1:
+            print("Pool de processos XML nao iniciado: ja ha threads a correr")
+            return
+
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.num_processos, mp_context=multiprocessing.get_context("fork")
+        )
+        # Com fork, todos os processos são criados na primeira submissão
+        self._executor.submit(int).result()
+
+    def _desativar(self, executor: ProcessPoolExecutor):
+        # Um processo morreu ou deixou de responder. Criar outro pool obrigaria
+        # a um fork com as threads já a correr: a partir daqui o XML é construído
+        # nas threads. As partes de outros pedidos ainda no pool não são
+        # canceladas; terminam ou falham e esses pedidos fazem o mesmo.
+        with self._lock:
+            if self._executor is not executor:
+                return
+            self._executor = None
+            self.falhas_pool += 1
+        print("Pool de processos XML desativado; o XML passa a ser construido nas threads")
+        executor.shutdown(wait=False)
+
+    def _construir_shard_local(self, shard: List[Dict], pretty_print: bool, primeiro: int) -> Future:
+        with self._lock:
+            self.shards_locais += 1
+        futuro = Future()
+        futuro.set_result(construir_fragmento(shard, pretty_print, primeiro_registo=primeiro))
+        return futuro
+
+    def _submeter(self, executor: ProcessPoolExecutor, shard: List[Dict], pretty_print: bool,
+                  primeiro: int) -> Future:
+        if not self._vagas.acquire(timeout=self.timeout):
+            # Pool ocupado com partes de outros pedidos (não avariado):
+            # esta parte é construída nesta thread
+            return self._construir_shard_local(shard, pretty_print, primeiro)
+        try:
+            futuro = executor.submit(construir_fragmento, shard, pretty_print, primeiro_registo=primeiro)
+        except RuntimeError:
+            # O pool foi desativado por outro pedido depois de este começar
+            self._vagas.release()
+            if self._executor is executor:
+                raise
+            return self._construir_shard_local(shard, pretty_print, primeiro)
+        except BaseException:
+            self._vagas.release()
+            raise
+        futuro.add_done_callback(lambda _: self._vagas.release())
+        return futuro
+
+    def construir(self, dados: List[Dict], mapper_version: str, id_requisicao: str,
+                  pretty_print: bool = XML_FORMATADO) -> Tuple[bool, str, Optional[str]]:
+        """
+        Constrói e valida o documento em paralelo (ou nesta thread, se o pool
+        não estiver ativo ou falhar durante o pedido).
+        Devolve (valido, mensagem, xml_string); o XML só é devolvido se for válido.
+        """
+        executor = self._executor
+        if executor is None:
+            return self._construir_local(dados, mapper_version, id_requisicao, pretty_print)
+
+        try:
+            futuros = [
+                self._submeter(executor, dados[inicio:inicio + self.tamanho_shard], pretty_print, inicio + 1)
+                for inicio in range(0, len(dados), self.tamanho_shard)
+            ]
+
+            fragmentos = []
+            msg_validacao = ""
+            for futuro in futuros:
+                valido, msg_validacao, fragmento = futuro.result(timeout=self.timeout)
+                if not valido:
+                    # A mensagem já indica os registos em causa
+                    for restante in futuros:
+                        restante.cancel()
+                    return False, msg_validacao, None
+                fragmentos.append(fragmento)
+
+        except (BrokenProcessPool, TimeoutError, CancelledError) as e:
+            print(f"Pool de processos XML falhou ({e or type(e).__name__}); a construir o XML nesta thread")
+            if not isinstance(e, CancelledError):
+                self._desativar(executor)
+            return self._construir_local(dados, mapper_version, id_requisicao, pretty_print)
+
+        with self._lock:
+            self.documentos += 1
+            self.shards += len(futuros)
+
+        return True, msg_validacao, juntar_fragmentos(fragmentos, mapper_version, id_requisicao, pretty_print)
+
+    def _construir_local(self, dados: List[Dict], mapper_version: str, id_requisicao: str,
+                         pretty_print: bool) -> Tuple[bool, str, Optional[str]]:
+        construtor = criar_construtor(mapper_version, id_requisicao, pretty_print)
+        construtor.adicionar(dados)
+        valido, msg_validacao = construtor.validar()
+        return valido, msg_validacao, construtor.concluir(pretty_print) if valido else None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "processos": self.num_processos,
+                "ativo": self._executor is not None,
+                "tamanho_shard": self.tamanho_shard,
+                "max_pendentes": self.max_pendentes,
+                "documentos": self.documentos,
+                "shards": self.shards,
+                "shards_locais": self.shards_locais,
+                "falhas_pool": self.falhas_pool
+            }
+
+
+# Pool global partilhado pelos pedidos do servidor de sockets
+pool_xml = PoolXML()
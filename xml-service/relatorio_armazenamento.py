@@ -0,0 +1,101 @@
+"""
+Relatório do espaço ocupado pelos XML guardados em documentos_xml:
+bytes por registo (<Pais>) como estão guardados e em formato compacto
+(sem os espaços de indentação entre elementos).
+Os tamanhos são calculados na base de dados; os documentos não são transferidos.
+
+Uso:
+  python relatorio_armazenamento.py [--ultimos N]
+  python relatorio_armazenamento.py --mostrar ID   (mostra um documento formatado)
+"""
+import argparse
+from psycopg2.extras import RealDictCursor
+from db import get_db_connection
+from xml_builder import formatar_xml
+
+# Tamanho de cada documento: texto atual, texto compacto, tamanho guardado (TOAST) e registos
+CONSULTA_TAMANHOS = r"""
+    SELECT id,
+           data_criacao,
+           octet_length(xml_documento::text) AS bytes_texto,
+           octet_length(regexp_replace(xml_documento::text, '>\s+<', '><', 'g')) AS bytes_compacto,
+           pg_column_size(xml_documento) AS bytes_guardados,
+           (xpath('count(/RelatorioConformidade/Paises/Pais)', xml_documento))[1]::text::numeric::bigint AS registos
+    FROM documentos_xml
+    ORDER BY id
+"""
+
+
+def por_registo(total: int, registos: int) -> float:
+    return total / registos if registos else 0.0
+
+
+def relatorio_tamanhos(ultimos: int):
+    """
+    Mostra os últimos documentos e o total do histórico, antes e depois de compactar.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    cursor.execute(CONSULTA_TAMANHOS)
+    documentos = cursor.fetchall()
+    cursor.close()
+    conn.close()
+
+    if not documentos:
+        print("Sem documentos em documentos_xml")
+        return
+
+    print(f"{'id':>8} {'registos':>9} {'bytes':>12} {'compacto':>12} {'guardados':>12} "
+          f"{'B/reg':>8} {'B/reg compacto':>15}")
+    for doc in (documentos[-ultimos:] if ultimos > 0 else []):
+        print(
+            f"{doc['id']:>8} {doc['registos']:>9} {doc['bytes_texto']:>12} {doc['bytes_compacto']:>12} "
+            f"{doc['bytes_guardados']:>12} {por_registo(doc['bytes_texto'], doc['registos']):>8.1f} "
+            f"{por_registo(doc['bytes_compacto'], doc['registos']):>15.1f}"
+        )
+
+    registos = sum(doc["registos"] for doc in documentos)
+    texto = sum(doc["bytes_texto"] for doc in documentos)
+    compacto = sum(doc["bytes_compacto"] for doc in documentos)
+    guardados = sum(doc["bytes_guardados"] for doc in documentos)
+
+    print()
+    print(f"Documentos: {len(documentos)}, registos: {registos}")
+    print(f"Texto atual:    {texto} bytes ({por_registo(texto, registos):.1f} bytes/registo)")
+    print(f"Texto compacto: {compacto} bytes ({por_registo(compacto, registos):.1f} bytes/registo)")
+    print(f"Guardado (TOAST): {guardados} bytes ({por_registo(guardados, registos):.1f} bytes/registo)")
+    if texto:
+        print(f"Poupanca do formato compacto: {(1 - compacto / texto) * 100:.1f}% do texto")
+
+
+def mostrar_documento(id_documento: int):
+    """
+    Mostra um documento guardado, formatado com indentação.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT xml_documento::text FROM documentos_xml WHERE id = %s", (id_documento,))
+    linha = cursor.fetchone()
+    cursor.close()
+    conn.close()
+
+    if linha is None:
+        print(f"Documento nao encontrado: {id_documento}")
+        return
+    print(formatar_xml(linha[0]), end="")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Espaco ocupado pelos XML guardados")
+    parser.add_argument("--ultimos", type=int, default=20, help="documentos mostrados individualmente")
+    parser.add_argument("--mostrar", type=int, help="mostra o documento com este id, formatado")
+    args = parser.parse_args()
+
+    if args.mostrar is not None:
+        mostrar_documento(args.mostrar)
+    else:
+        relatorio_tamanhos(args.ultimos)
+
+
+if __name__ == "__main__":
+    main()
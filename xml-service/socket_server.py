@@ -1,99 +1,645 @@
-import socket
+import asyncio
+import collections
 import json
-import threading
-import requests
-from xml_builder import criar_xml, validar_xml
+import time
+from concurrent.futures import ThreadPoolExecutor
+from xml_builder import criar_construtor
+from pool_xml import pool_xml
 from db import persistir_xml
-from config import SOCKET_PORT
+from fila_trabalhos import fila_trabalhos
+from despachante_webhooks import despachante_webhooks
+from http_client import cliente_http
+from config import (
+    SOCKET_PORT, SOCKET_BACKLOG, SOCKET_MAX_LIGACOES, SOCKET_MAX_PEDIDOS,
+    XML_WORKERS, DB_WORKERS, SOCKET_TENTAR_APOS, FLUXO_MAX_LOTES_PENDENTES, FLUXO_TIMEOUT, XML_FORMATADO,
+    ESTATISTICAS_INTERVALO
+)
+from codificacao import (
+    NOMES_CODIFICACOES, CODECS_COMPRESSAO, COMPRESSAO_NENHUMA, TAMANHO_BLOCO_COMPRESSAO,
+    descodificar_mensagem, criar_descompressor
+)
+from protocolo import (
+    VERSAO_PROTOCOLO, CABECALHO_V2, FLAGS_CODIFICACAO, FLAGS_COMPRESSAO_SHIFT, TAMANHO_MAX_FRAME,
+    FRAME_PEDIDO, FRAME_RESPOSTA, FRAME_PING, FRAME_PONG, FRAME_PEDIDO_ASSINCRONO, FRAME_ESTADO,
+    FRAME_INICIO, FRAME_LOTE, FRAME_FIM, FRAME_CANCELAR,
+    ErroFrame, verificar_tamanho, ler_mensagem_simples, escrever_mensagem_simples, escrever_frame
+)
 
+# Modos de pedido aceites (o assíncrono responde "ACCEPTED" e termina em background;
+# o streaming envia os registos em vários lotes entre uma frame INICIO e uma FIM)
+MODOS_PEDIDO = ["sincrono", "assincrono", "streaming"]
 
-def enviar_webhook(webhook_url: str, id_requisicao: str, status: str, documento_id: int):
+# Frames que ocupam um lugar no controlo de admissão
+FRAMES_ADMISSAO = (FRAME_PEDIDO, FRAME_INICIO)
+
+# Executores limitados: o event loop só faz I/O de rede
+executor_xml = ThreadPoolExecutor(max_workers=XML_WORKERS, thread_name_prefix="xml-worker")
+executor_db = ThreadPoolExecutor(max_workers=DB_WORKERS, thread_name_prefix="db-worker")
+
+
+class ControloAdmissao:
     """
-    Envia um webhook para o Processador com o estado da operação.
+    Limita as ligações abertas e os pedidos em processamento.
+    Acima dos limites o pedido é rejeitado logo com o estado "OCUPADO",
+    em vez de ficar em fila e atrasar todos os outros.
+    Só é usado dentro do event loop, por isso não precisa de locks.
     """
-    try:
-        payload = {
-            "id_requisicao": id_requisicao,
-            "status": status,
-            "documento_id": documento_id
+
+    def __init__(self, max_ligacoes: int = SOCKET_MAX_LIGACOES, max_pedidos: int = SOCKET_MAX_PEDIDOS):
+        self.max_ligacoes = max_ligacoes
+        self.max_pedidos = max_pedidos
+        self.ligacoes = 0
+        self.pedidos = 0
+
+        # Contadores para as estatísticas
+        self.pedidos_aceites = 0
+        self.pedidos_rejeitados = 0
+        self.ligacoes_rejeitadas = 0
+
+    def admitir_ligacao(self) -> bool:
+        if self.ligacoes >= self.max_ligacoes:
+            self.ligacoes_rejeitadas += 1
+            return False
+        self.ligacoes += 1
+        return True
+
+    def libertar_ligacao(self):
+        self.ligacoes -= 1
+
+    def admitir_pedido(self) -> bool:
+        if self.pedidos >= self.max_pedidos:
+            self.pedidos_rejeitados += 1
+            return False
+        self.pedidos += 1
+        self.pedidos_aceites += 1
+        return True
+
+    def libertar_pedido(self):
+        self.pedidos -= 1
+
+    def stats(self) -> dict:
+        return {
+            "ligacoes": self.ligacoes,
+            "max_ligacoes": self.max_ligacoes,
+            "pedidos_em_curso": self.pedidos,
+            "max_pedidos": self.max_pedidos,
+            "pedidos_aceites": self.pedidos_aceites,
+            "pedidos_rejeitados": self.pedidos_rejeitados,
+            "ligacoes_rejeitadas": self.ligacoes_rejeitadas
         }
 
-        response = requests.post(webhook_url, json=payload, timeout=10)
-        print(f"Webhook enviado para {webhook_url}: {status}")
-        return response.status_code == 200
 
+# Controlo de admissão partilhado por todas as ligações
+admissao = ControloAdmissao()
+
+
+def resposta_ocupado() -> dict:
+    return {
+        "status": "OCUPADO",
+        "erro": "XML Service ocupado, tente novamente mais tarde",
+        "tentar_apos": SOCKET_TENTAR_APOS
+    }
+
+
+def enviar_webhook(webhook_url: str, id_requisicao: str, status: str, documento_id: int):
+    """
+    Coloca na fila o webhook para o Processador com o estado da operação.
+    A entrega (com repetições) é feita em background pelo despachante.
+    """
+    payload = {
+        "id_requisicao": id_requisicao,
+        "status": status,
+        "documento_id": documento_id
+    }
+    try:
+        return despachante_webhooks.enfileirar(webhook_url, payload)
     except Exception as e:
-        print(f"Erro ao enviar webhook: {e}")
+        print(f"Erro ao colocar webhook na fila: {e}")
         return False
 
 
-def processar_requisicao_socket(conn: socket.socket, addr: tuple):
+async def receber_descomprimido(reader: asyncio.StreamReader, tamanho: int, compressao: int) -> bytes:
     """
-    Processa um pedido recebido por socket:
-    recebe dados, cria XML, valida, persiste no banco e responde ao cliente.
+    Recebe um payload comprimido e descomprime-o em streaming, bloco a bloco,
+    sem guardar a versão comprimida completa em memória.
+    """
+    descompressor = criar_descompressor(compressao)
+    dados = bytearray()
+    em_falta = tamanho
+
+    while em_falta > 0:
+        chunk = await reader.readexactly(min(em_falta, TAMANHO_BLOCO_COMPRESSAO))
+        em_falta -= len(chunk)
+        dados += descompressor.decompress(chunk)
+
+        # O limite aplica-se também ao tamanho depois de descomprimido
+        if len(dados) > TAMANHO_MAX_FRAME:
+            raise ErroFrame(f"Payload descomprimido excede o maximo de {TAMANHO_MAX_FRAME} bytes")
+
+    dados += descompressor.flush()
+    verificar_tamanho(len(dados))
+    return bytes(dados)
+
+
+async def descartar(reader: asyncio.StreamReader, tamanho: int):
+    """
+    Lê e descarta um payload (pedido rejeitado), mantendo a ligação sincronizada.
+    """
+    em_falta = tamanho
+    while em_falta > 0:
+        chunk = await reader.readexactly(min(em_falta, TAMANHO_BLOCO_COMPRESSAO))
+        em_falta -= len(chunk)
+
+
+async def enviar_resposta_simples(writer: asyncio.StreamWriter, resposta: dict):
+    """
+    Envia uma resposta no formato original (tamanho + JSON).
+    """
+    escrever_mensagem_simples(writer, json.dumps(resposta).encode('utf-8'))
+    await writer.drain()
+
+
+async def enviar_frame(writer: asyncio.StreamWriter, tipo: int, id_pedido: int, payload: bytes):
+    """
+    Envia uma frame v2 (cabeçalho + payload JSON).
+    Cada frame é escrita de uma só vez, por isso não se mistura com outras.
+    """
+    escrever_frame(writer, tipo, id_pedido, payload)
+    await writer.drain()
+
+
+def construir_xml(codificacao: int, payload) -> tuple:
+    """
+    Descodifica a mensagem, cria o XML e valida-o (corre no executor de XML).
+    Devolve a mensagem, o XML e o resultado da validação.
+    """
+    mensagem = descodificar_mensagem(codificacao, payload)
+
+    # Extrai campos principais da mensagem
+    id_requisicao = mensagem.get("id_requisicao")
+    mapper_version = mensagem.get("mapper_version", "1.0")
+    dados = mensagem.get("dados", [])
+
+    print(f"Processando requisicao: {id_requisicao}")
+    print(f"   Registros: {len(dados)}")
+
+    # Pedidos grandes são divididos em partes construídas em vários processos
+    if pool_xml.usar_para(dados):
+        valido, msg_validacao, xml_string = pool_xml.construir(dados, mapper_version, id_requisicao)
+        print(f"XML criado em paralelo ({pool_xml.num_processos} processos)")
+        return mensagem, xml_string, valido, msg_validacao
+
+    # Cria o XML a partir dos dados recebidos (com o serializador configurado)
+    construtor = criar_construtor(mapper_version, id_requisicao, XML_FORMATADO)
+    construtor.adicionar(dados)
+    print("XML criado")
+
+    # Valida o documento; só é devolvido se for para persistir
+    valido, msg_validacao = construtor.validar()
+    xml_string = construtor.concluir(XML_FORMATADO) if valido else None
+    return mensagem, xml_string, valido, msg_validacao
+
+
+def persistir_e_notificar(mensagem: dict, xml_string: str, valido: bool, msg_validacao: str) -> dict:
+    """
+    Persiste o XML no banco e coloca o webhook na fila (corre no executor da base de dados).
+    Devolve a resposta a enviar ao cliente.
+    """
+    id_requisicao = mensagem.get("id_requisicao")
+    mapper_version = mensagem.get("mapper_version", "1.0")
+    webhook_url = mensagem.get("webhook_url")
+
+    if not valido:
+        print(f"{msg_validacao}")
+        enviar_webhook(webhook_url, id_requisicao, "ERRO_VALIDACAO", 0)
+        return {"status": "ERRO_VALIDACAO", "erro": msg_validacao}
+
+    print("XML validado")
+
+    # Guarda o XML no banco de dados
+    sucesso, documento_id, status = persistir_xml(xml_string, mapper_version, id_requisicao)
+
+    if sucesso:
+        print(f"XML persistido no banco. ID: {documento_id}")
+        enviar_webhook(webhook_url, id_requisicao, "OK", documento_id)
+        return {"status": "OK", "documento_id": documento_id}
+
+    print(f"{status}")
+    enviar_webhook(webhook_url, id_requisicao, "ERRO_PERSISTENCIA", 0)
+    return {"status": "ERRO_PERSISTENCIA", "erro": status}
+
+
+async def processar_mensagem(codificacao: int, payload) -> dict:
+    """
+    Cria o XML, valida, persiste no banco e envia o webhook.
+    O trabalho de CPU e as escritas bloqueantes correm nos executores limitados.
+    """
+    loop = asyncio.get_running_loop()
+    mensagem, xml_string, valido, msg_validacao = await loop.run_in_executor(
+        executor_xml, construir_xml, codificacao, payload
+    )
+    return await loop.run_in_executor(
+        executor_db, persistir_e_notificar, mensagem, xml_string, valido, msg_validacao
+    )
+
+
+def descodificar_lote(codificacao: int, payload) -> list:
+    """
+    Descodifica o payload de uma frame LOTE (mensagem só com a lista "dados").
+    """
+    return descodificar_mensagem(codificacao, payload).get("dados", [])
+
+
+class FluxoUpload:
+    """
+    Pedido recebido em várias frames: INICIO (metadados), N x LOTE e FIM.
+    Cada lote é descodificado no executor de XML assim que chega e os
+    <Pais> são acrescentados ao documento pela ordem de chegada, enquanto
+    os lotes seguintes continuam a ser recebidos.
+    No máximo FLUXO_MAX_LOTES_PENDENTES lotes ficam em memória de cada vez.
+    """
+
+    def __init__(self, mensagem: dict):
+        self.mensagem = mensagem
+        self.construtor = criar_construtor(
+            mensagem.get("mapper_version", "1.0"), mensagem.get("id_requisicao") or "", XML_FORMATADO
+        )
+        self._lotes = collections.deque()
+        self.erro = None
+        self.ultima_atividade = time.monotonic()
+
+    def inativo_ha(self) -> float:
+        """
+        Segundos desde a última frame recebida (0 se ainda há lotes a processar).
+        """
+        if any(not tarefa.done() for tarefa in self._lotes):
+            return 0.0
+        return time.monotonic() - self.ultima_atividade
+
+    async def _processar_lote(self, anterior: asyncio.Task, codificacao: int, payload: bytes):
+        loop = asyncio.get_running_loop()
+        try:
+            # A descodificação de lotes diferentes pode correr em paralelo
+            dados = await loop.run_in_executor(executor_xml, descodificar_lote, codificacao, payload)
+
+            # A construção do XML segue a ordem de chegada dos lotes
+            if anterior is not None:
+                await anterior
+            if self.erro is None:
+                await loop.run_in_executor(executor_xml, self.construtor.adicionar, dados)
+
+        except Exception as e:
+            if self.erro is None:
+                self.erro = e
+
+    async def adicionar(self, codificacao: int, payload: bytes):
+        """
+        Agenda o processamento de um lote. Se houver demasiados lotes em
+        memória, espera pelo mais antigo (e deixa de ler da ligação).
+        """
+        self.ultima_atividade = time.monotonic()
+        anterior = self._lotes[-1] if self._lotes else None
+        self._lotes.append(asyncio.create_task(self._processar_lote(anterior, codificacao, payload)))
+
+        while self._lotes and (len(self._lotes) > FLUXO_MAX_LOTES_PENDENTES or self._lotes[0].done()):
+            await self._lotes.popleft()
+        self.ultima_atividade = time.monotonic()
+
+    def _concluir_xml(self) -> tuple:
+        print(f"XML criado ({self.construtor.total} registros em streaming)")
+        valido, msg_validacao = self.construtor.validar()
+        xml_string = self.construtor.concluir(XML_FORMATADO) if valido else None
+        return xml_string, valido, msg_validacao
+
+    async def concluir(self) -> dict:
+        """
+        Espera pelos últimos lotes, valida, persiste e envia o webhook.
+        """
+        while self._lotes:
+            await self._lotes.popleft()
+        if self.erro is not None:
+            raise self.erro
+
+        loop = asyncio.get_running_loop()
+        xml_string, valido, msg_validacao = await loop.run_in_executor(executor_xml, self._concluir_xml)
+        return await loop.run_in_executor(
+            executor_db, persistir_e_notificar, self.mensagem, xml_string, valido, msg_validacao
+        )
+
+    def cancelar(self):
+        for tarefa in self._lotes:
+            tarefa.cancel()
+        self._lotes.clear()
+
+
+async def iniciar_fluxo_v2(writer: asyncio.StreamWriter, fluxos: dict, id_pedido: int, payload: bytes):
+    """
+    Abre um upload em streaming e confirma ao cliente que pode enviar os lotes.
     """
     try:
-        print(f"\nConexao recebida de {addr}")
+        mensagem = json.loads(payload.decode('utf-8'))
+        fluxos[id_pedido] = FluxoUpload(mensagem)
+        print(f"Processando requisicao em streaming: {mensagem.get('id_requisicao')}")
+        resposta = {"status": "OK"}
+    except Exception as e:
+        admissao.libertar_pedido()
+        resposta = {"status": "ERRO", "erro": str(e)}
 
-        # Lê os 4 bytes iniciais com o tamanho da mensagem
-        tamanho_bytes = conn.recv(4)
-        if len(tamanho_bytes) < 4:
-            raise ValueError("Tamanho da mensagem invalido")
+    await enviar_frame(writer, FRAME_RESPOSTA, id_pedido, json.dumps(resposta).encode('utf-8'))
 
-        tamanho = int.from_bytes(tamanho_bytes, byteorder='big')
 
-        # Recebe a mensagem completa com base no tamanho
-        dados_recebidos = b''
-        while len(dados_recebidos) < tamanho:
-            chunk = conn.recv(tamanho - len(dados_recebidos))
-            if not chunk:
-                raise ValueError("Conexao fechada antes de receber todos os dados")
-            dados_recebidos += chunk
+async def responder_fluxo_v2(writer: asyncio.StreamWriter, id_pedido: int, fluxo: FluxoUpload):
+    """
+    Termina um upload em streaming e responde com o mesmo id.
+    """
+    try:
+        resposta = await fluxo.concluir()
+    except Exception as e:
+        print(f"Erro ao processar pedido {id_pedido}: {e}")
+        resposta = {"status": "ERRO", "erro": str(e)}
+    finally:
+        admissao.libertar_pedido()
+
+    try:
+        await enviar_frame(writer, FRAME_RESPOSTA, id_pedido, json.dumps(resposta).encode('utf-8'))
+    except Exception as e:
+        print(f"Erro ao enviar resposta do pedido {id_pedido}: {e}")
 
-        # Converte JSON recebido para dicionário
-        mensagem = json.loads(dados_recebidos.decode('utf-8'))
 
-        # Extrai campos principais da mensagem
-        id_requisicao = mensagem.get("id_requisicao")
-        mapper_version = mensagem.get("mapper_version", "1.0")
-        webhook_url = mensagem.get("webhook_url")
-        dados = mensagem.get("dados", [])
+def processar_trabalho(codificacao: int, payload: bytes) -> dict:
+    """
+    Processa um trabalho assíncrono (corre num worker da fila de trabalhos).
+    Usa os mesmos executores limitados que os pedidos síncronos.
+    O resultado final é comunicado pelo webhook.
+    """
+    mensagem, xml_string, valido, msg_validacao = executor_xml.submit(construir_xml, codificacao, payload).result()
+    return executor_db.submit(persistir_e_notificar, mensagem, xml_string, valido, msg_validacao).result()
 
-        print(f"Processando requisicao: {id_requisicao}")
-        print(f"   Registros: {len(dados)}")
 
-        # Cria o XML a partir dos dados recebidos
-        xml_string = criar_xml(dados, mapper_version, id_requisicao)
-        print("XML criado")
+def notificar_falha_trabalho(codificacao: int, payload: bytes, resposta: dict):
+    """
+    Envia o webhook "ERRO" de um trabalho assíncrono que terminou com uma exceção,
+    para o cliente não ficar à espera de um resultado que nunca chega.
+    """
+    mensagem = descodificar_mensagem(codificacao, payload)
+    enviar_webhook(mensagem.get("webhook_url"), mensagem.get("id_requisicao"), resposta["status"], 0)
 
-        # Valida o XML antes de persistir
-        valido, msg_validacao = validar_xml(xml_string)
-        if not valido:
-            print(f"{msg_validacao}")
-            resposta = {"status": "ERRO_VALIDACAO", "erro": msg_validacao}
-            enviar_webhook(webhook_url, id_requisicao, "ERRO_VALIDACAO", 0)
 
+async def aceitar_trabalho(codificacao: int, payload: bytes) -> dict:
+    """
+    Guarda o pedido na fila persistente e devolve "ACCEPTED" com o id do trabalho.
+    """
+    loop = asyncio.get_running_loop()
+    id_trabalho = await loop.run_in_executor(None, fila_trabalhos.adicionar, codificacao, payload)
+    if id_trabalho is None:
+        return resposta_ocupado()
+
+    print(f"Trabalho {id_trabalho} aceite ({len(payload)} bytes)")
+    return {"status": "ACCEPTED", "id_trabalho": id_trabalho}
+
+
+async def consultar_trabalho(id_trabalho: str) -> dict:
+    """
+    Devolve o estado de um trabalho assíncrono.
+    """
+    loop = asyncio.get_running_loop()
+    estado = await loop.run_in_executor(None, fila_trabalhos.estado, id_trabalho or "")
+    if estado is None:
+        return {"status": "DESCONHECIDO", "erro": f"Trabalho nao encontrado: {id_trabalho}"}
+    return {"status": "OK", **estado}
+
+
+async def responder_trabalho_v2(writer: asyncio.StreamWriter, id_pedido: int, tipo: int, flags: int, payload: bytes):
+    """
+    Responde a uma frame de pedido assíncrono ou de consulta de estado.
+    """
+    try:
+        if tipo == FRAME_ESTADO:
+            resposta = await consultar_trabalho(json.loads(payload.decode('utf-8')).get("id_trabalho"))
         else:
-            print("XML validado")
+            resposta = await aceitar_trabalho(flags & FLAGS_CODIFICACAO, payload)
+    except Exception as e:
+        print(f"Erro no pedido {id_pedido}: {e}")
+        resposta = {"status": "ERRO", "erro": str(e)}
+
+    try:
+        await enviar_frame(writer, FRAME_RESPOSTA, id_pedido, json.dumps(resposta).encode('utf-8'))
+    except Exception as e:
+        print(f"Erro ao enviar resposta do pedido {id_pedido}: {e}")
+
+
+async def responder_pedido_v2(writer: asyncio.StreamWriter, id_pedido: int, flags: int, payload: bytes):
+    """
+    Processa um pedido recebido numa ligação v2 e responde com o mesmo id.
+    """
+    try:
+        resposta = await processar_mensagem(flags & FLAGS_CODIFICACAO, payload)
+    except Exception as e:
+        print(f"Erro ao processar pedido {id_pedido}: {e}")
+        resposta = {"status": "ERRO", "erro": str(e)}
+    finally:
+        admissao.libertar_pedido()
+
+    try:
+        await enviar_frame(writer, FRAME_RESPOSTA, id_pedido, json.dumps(resposta).encode('utf-8'))
+    except Exception as e:
+        print(f"Erro ao enviar resposta do pedido {id_pedido}: {e}")
+
+
+def descartar_fluxo(fluxos: dict, id_pedido: int) -> bool:
+    """
+    Cancela um upload em streaming que não vai chegar ao fim e liberta a sua vaga.
+    """
+    fluxo = fluxos.pop(id_pedido, None)
+    if fluxo is None:
+        return False
+    fluxo.cancelar()
+    admissao.libertar_pedido()
+    return True
+
+
+async def vigiar_fluxos(fluxos: dict, addr: tuple, timeout: float):
+    """
+    Descarta os uploads da ligação sem frames há mais de `timeout` segundos
+    (cliente que deixou de enviar sem FIM nem CANCELAR); as pings mantêm a
+    ligação aberta, por isso sem isto a vaga ficaria ocupada indefinidamente.
+    """
+    while True:
+        await asyncio.sleep(max(1.0, timeout / 4))
+        for id_pedido, fluxo in list(fluxos.items()):
+            if fluxo.inativo_ha() > timeout and descartar_fluxo(fluxos, id_pedido):
+                print(f"Upload {id_pedido} de {addr} descartado: sem frames ha mais de {timeout:.0f}s")
+
+
+async def servir_ligacao_v2(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, addr: tuple):
+    """
+    Serve uma ligação persistente v2: várias frames de pedido com id,
+    cada uma processada numa tarefa e respondida assim que terminar.
+    Os uploads em streaming (INICIO, LOTE, FIM) são identificados pelo id;
+    um CANCELAR ou FLUXO_TIMEOUT segundos sem frames descartam o upload.
+    """
+    print(f"Ligacao persistente (protocolo v{VERSAO_PROTOCOLO}) com {addr}")
+    tarefas = set()
+    fluxos = {}
+    vigia = asyncio.create_task(vigiar_fluxos(fluxos, addr, FLUXO_TIMEOUT)) if FLUXO_TIMEOUT > 0 else None
+
+    try:
+        while True:
+            try:
+                cabecalho = await reader.readexactly(CABECALHO_V2.size)
+            except asyncio.IncompleteReadError as e:
+                # Uma ligação fechada entre frames termina a sessão normalmente
+                if not e.partial:
+                    break
+                raise
+
+            tamanho, flags, tipo, id_pedido = CABECALHO_V2.unpack(cabecalho)
+            verificar_tamanho(tamanho)
+
+            # Pedido acima do limite: descarta o payload e responde logo
+            if tipo in FRAMES_ADMISSAO and not admissao.admitir_pedido():
+                await descartar(reader, tamanho)
+                print(f"Pedido {id_pedido} de {addr} rejeitado: servico ocupado")
+                await enviar_frame(writer, FRAME_RESPOSTA, id_pedido, json.dumps(resposta_ocupado()).encode('utf-8'))
+                continue
+
+            # Lote de um upload desconhecido (rejeitado ou com erro): ignora
+            if tipo == FRAME_LOTE and id_pedido not in fluxos:
+                await descartar(reader, tamanho)
+                continue
+
+            try:
+                compressao = flags >> FLAGS_COMPRESSAO_SHIFT
+                if compressao == COMPRESSAO_NENHUMA:
+                    payload = await reader.readexactly(tamanho)
+                else:
+                    payload = await receber_descomprimido(reader, tamanho, compressao)
+            except Exception:
+                if tipo in FRAMES_ADMISSAO:
+                    admissao.libertar_pedido()
+                raise
+
+            if tipo == FRAME_PING:
+                await enviar_frame(writer, FRAME_PONG, id_pedido, b'')
+
+            elif tipo == FRAME_PEDIDO:
+                tarefa = asyncio.create_task(responder_pedido_v2(writer, id_pedido, flags, payload))
+                tarefas.add(tarefa)
+                tarefa.add_done_callback(tarefas.discard)
+
+            elif tipo in (FRAME_PEDIDO_ASSINCRONO, FRAME_ESTADO):
+                tarefa = asyncio.create_task(responder_trabalho_v2(writer, id_pedido, tipo, flags, payload))
+                tarefas.add(tarefa)
+                tarefa.add_done_callback(tarefas.discard)
+
+            elif tipo == FRAME_INICIO:
+                await iniciar_fluxo_v2(writer, fluxos, id_pedido, payload)
+
+            elif tipo == FRAME_LOTE:
+                # O upload pode ter sido descartado enquanto o lote era lido
+                fluxo = fluxos.get(id_pedido)
+                if fluxo is not None:
+                    await fluxo.adicionar(flags & FLAGS_CODIFICACAO, payload)
 
-            # Guarda o XML no banco de dados
-            sucesso, documento_id, status = persistir_xml(xml_string, mapper_version, id_requisicao)
+            elif tipo == FRAME_CANCELAR:
+                if descartar_fluxo(fluxos, id_pedido):
+                    print(f"Upload {id_pedido} de {addr} cancelado pelo cliente")
+
+            elif tipo == FRAME_FIM:
+                fluxo = fluxos.pop(id_pedido, None)
+                if fluxo is None:
+                    resposta = {"status": "ERRO", "erro": f"Upload desconhecido: {id_pedido}"}
+                    await enviar_frame(writer, FRAME_RESPOSTA, id_pedido, json.dumps(resposta).encode('utf-8'))
+                else:
+                    tarefa = asyncio.create_task(responder_fluxo_v2(writer, id_pedido, fluxo))
+                    tarefas.add(tarefa)
+                    tarefa.add_done_callback(tarefas.discard)
 
-            if sucesso:
-                print(f"XML persistido no banco. ID: {documento_id}")
-                resposta = {"status": "OK", "documento_id": documento_id}
-                enviar_webhook(webhook_url, id_requisicao, "OK", documento_id)
             else:
-                print(f"{status}")
-                resposta = {"status": "ERRO_PERSISTENCIA", "erro": status}
-                enviar_webhook(webhook_url, id_requisicao, "ERRO_PERSISTENCIA", 0)
+                print(f"Frame desconhecida (tipo {tipo}) de {addr}")
+
+    except Exception as e:
+        print(f"Ligacao persistente com {addr} terminada: {e}")
+
+    if vigia is not None:
+        vigia.cancel()
+
+    # Uploads em streaming que não chegaram ao fim
+    for id_pedido in list(fluxos):
+        descartar_fluxo(fluxos, id_pedido)
+
+    # Espera pelos pedidos em curso antes de fechar a ligação
+    if tarefas:
+        await asyncio.gather(*tarefas, return_exceptions=True)
+
 
-        # Envia a resposta ao cliente (tamanho + payload)
-        resposta_json = json.dumps(resposta)
-        resposta_bytes = resposta_json.encode('utf-8')
-        conn.sendall(len(resposta_bytes).to_bytes(4, byteorder='big'))
-        conn.sendall(resposta_bytes)
-        conn.close()
+async def processar_requisicao_socket(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    """
+    Processa um pedido recebido por socket:
+    recebe dados, cria XML, valida, persiste no banco e responde ao cliente.
+    Uma mensagem HELLO passa a ligação para o protocolo persistente v2;
+    com "modo": "assincrono" o pedido é guardado e respondido com "ACCEPTED".
+    """
+    addr = writer.get_extra_info("peername")
+    ligacao_admitida = admissao.admitir_ligacao()
+
+    try:
+        print(f"\nConexao recebida de {addr}")
+
+        # Recebe a mensagem completa (4 bytes com o tamanho + JSON)
+        dados_recebidos = await ler_mensagem_simples(reader)
+
+        # Demasiadas ligações abertas: responde sem processar
+        if not ligacao_admitida:
+            print(f"Ligacao de {addr} rejeitada: servico ocupado")
+            await enviar_resposta_simples(writer, resposta_ocupado())
+            return
+
+        # Converte JSON recebido para dicionário
+        mensagem = json.loads(dados_recebidos.decode('utf-8'))
+
+        # Negociação do protocolo persistente
+        if mensagem.get("tipo") == "HELLO":
+            versao = min(int(mensagem.get("versao_protocolo", 1)), VERSAO_PROTOCOLO)
+            codificacoes = [
+                nome for nome in mensagem.get("codificacoes", ["json"])
+                if nome in NOMES_CODIFICACOES
+            ]
+            compressoes = [
+                nome for nome in mensagem.get("compressoes", [])
+                if nome in CODECS_COMPRESSAO
+            ]
+            await enviar_resposta_simples(writer, {
+                "status": "OK",
+                "versao_protocolo": versao,
+                "codificacoes": codificacoes,
+                "compressoes": compressoes,
+                "modos": MODOS_PEDIDO
+            })
+            if versao >= 2:
+                await servir_ligacao_v2(reader, writer, addr)
+            return
+
+        # Consulta do estado de um trabalho assíncrono
+        if mensagem.get("tipo") == "ESTADO":
+            await enviar_resposta_simples(writer, await consultar_trabalho(mensagem.get("id_trabalho")))
+            return
+
+        # Pedido único em modo assíncrono: guarda na fila e responde logo
+        if mensagem.get("modo") == "assincrono":
+            await enviar_resposta_simples(writer, await aceitar_trabalho(NOMES_CODIFICACOES["json"], dados_recebidos))
+            return
+
+        # Pedido único no formato original: processa e responde
+        if not admissao.admitir_pedido():
+            await enviar_resposta_simples(writer, resposta_ocupado())
+            return
+
+        try:
+            resposta = await processar_mensagem(NOMES_CODIFICACOES["json"], dados_recebidos)
+        finally:
+            admissao.libertar_pedido()
+        await enviar_resposta_simples(writer, resposta)
 
     except Exception as e:
         print(f"Erro ao processar requisicao: {e}")
@@ -102,36 +648,83 @@ def processar_requisicao_socket(conn: socket.socket, addr: tuple):
 
         # Tenta devolver uma resposta de erro ao cliente
         try:
-            resposta_erro = {"status": "ERRO", "erro": str(e)}
-            resposta_json = json.dumps(resposta_erro)
-            resposta_bytes = resposta_json.encode('utf-8')
-            conn.sendall(len(resposta_bytes).to_bytes(4, byteorder='big'))
-            conn.sendall(resposta_bytes)
-            conn.close()
+            await enviar_resposta_simples(writer, {"status": "ERRO", "erro": str(e)})
         except:
-            try:
-                conn.close()
-            except:
-                pass
+            pass
+
+    finally:
+        if ligacao_admitida:
+            admissao.libertar_ligacao()
+        try:
+            writer.close()
+            await writer.wait_closed()
+        except:
+            pass
 
 
-def servidor_socket():
+def estatisticas() -> dict:
     """
-    Servidor TCP que recebe pedidos do Processador.
-    Cada ligação é tratada numa thread separada.
+    Contadores do servidor de sockets, do pool de processos XML, da fila de
+    trabalhos, dos webhooks e do pool de ligações HTTP, escritos periodicamente no log.
     """
-    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    return {
+        "admissao": admissao.stats(),
+        "pool_xml": pool_xml.stats(),
+        "trabalhos": fila_trabalhos.stats(),
+        "webhooks": despachante_webhooks.stats(),
+        "http": cliente_http.stats()
+    }
 
-    # Escuta na porta configurada
-    sock.bind(('0.0.0.0', SOCKET_PORT))
-    sock.listen(5)
 
-    print(f"Servidor Socket iniciado na porta {SOCKET_PORT}")
-
-    # Aceita ligações e processa em paralelo
+async def registar_estatisticas(intervalo: float):
+    """
+    Escreve as estatísticas no log a cada `intervalo` segundos.
+    """
+    loop = asyncio.get_running_loop()
     while True:
-        conn, addr = sock.accept()
-        thread = threading.Thread(target=processar_requisicao_socket, args=(conn, addr))
-        thread.daemon = True
-        thread.start()
+        await asyncio.sleep(intervalo)
+        try:
+            valores = await loop.run_in_executor(None, estatisticas)
+            print(f"Estatisticas: {json.dumps(valores)}")
+        except Exception as e:
+            print(f"Erro ao recolher estatisticas: {e}")
+
+
+async def servidor_socket_async():
+    """
+    Servidor TCP assíncrono que recebe pedidos do Processador.
+    """
+    servidor = await asyncio.start_server(
+        processar_requisicao_socket, '0.0.0.0', SOCKET_PORT,
+        backlog=SOCKET_BACKLOG, reuse_address=True
+    )
+
+    print(
+        f"Servidor Socket iniciado na porta {SOCKET_PORT} "
+        f"(max {admissao.max_ligacoes} ligacoes, {admissao.max_pedidos} pedidos em curso)"
+    )
+
+    # A referência à tarefa (guardada até ao fim do servidor) evita que seja recolhida
+    tarefa_estatisticas = None
+    if ESTATISTICAS_INTERVALO > 0:
+        tarefa_estatisticas = asyncio.create_task(registar_estatisticas(ESTATISTICAS_INTERVALO))
+
+    try:
+        async with servidor:
+            await servidor.serve_forever()
+    finally:
+        if tarefa_estatisticas is not None:
+            tarefa_estatisticas.cancel()
+
+
+def servidor_socket():
+    """
+    Servidor TCP que recebe pedidos do Processador.
+    As ligações são servidas por um event loop asyncio; a criação de XML
+    e as escritas na base de dados correm em executores limitados.
+    Os pedidos assíncronos são processados pelos workers da fila de trabalhos.
+    """
+    # O pool de processos XML já foi criado por main(), antes de qualquer thread
+    despachante_webhooks.iniciar()
+    fila_trabalhos.iniciar(processar_trabalho, notificar_falha_trabalho)
+    asyncio.run(servidor_socket_async())
@@ -1,114 +1,432 @@
+import io
+import itertools
 import uuid
 import os
+import threading
 from datetime import datetime
-from typing import Dict, List
+from typing import BinaryIO, Dict, Iterable, List, Optional, Tuple, Union
 from lxml import etree
 from lxml.etree import Element, SubElement, XMLSchema
+from xml_template import INDENTACAO, TEMPLATES_PAIS, escrever_relatorio, renderizar_pais
+from config import XML_SERIALIZADOR
 
+# Caminho do ficheiro XSD
+SCHEMA_PATH = os.path.join(os.path.dirname(__file__), 'xml_schema.xsd')
 
-def criar_xml(dados: List[Dict], mapper_version: str, id_requisicao: str) -> str:
+# Cabeçalho XML colocado antes do elemento raiz
+CABECALHO_XML = '<?xml version="1.0" encoding="UTF-8"?>\n'
+
+# Registos validados de cada vez pelo ConstrutorXMLTemplate
+REGISTOS_POR_VALIDACAO = 1000
+
+
+class ValidadorXSD:
     """
-    Cria um documento XML a partir dos dados processados.
+    Schema XSD compilado uma só vez e reutilizado em todas as validações.
+    Volta a ser compilado quando o ficheiro muda (data de modificação ou tamanho).
+    Cada thread usa a sua própria instância compilada, porque um XMLSchema
+    não deve validar documentos em paralelo.
+    """
+
+    def __init__(self, caminho: str = SCHEMA_PATH):
+        self.caminho = caminho
+        self._local = threading.local()
+        self.compilacoes = 0
+
+    def _assinatura(self) -> Optional[tuple]:
+        try:
+            estado = os.stat(self.caminho)
+        except FileNotFoundError:
+            return None
+        return estado.st_mtime_ns, estado.st_size
+
+    def obter_schema(self) -> Optional[XMLSchema]:
+        """
+        Devolve o schema compilado (ou None se não existir XSD).
+        """
+        assinatura = self._assinatura()
+        if assinatura is None:
+            return None
+
+        if getattr(self._local, "assinatura", None) != assinatura:
+            self._local.schema = XMLSchema(etree.parse(self.caminho))
+            self._local.assinatura = assinatura
+            self.compilacoes += 1
+        return self._local.schema
+
+    def validar(self, documento):
+        """
+        Valida uma árvore (ou elemento) já em memória contra o XSD.
+        """
+        try:
+            schema = self.obter_schema()
+            if schema is None:
+                # Se não existir XSD, a árvore já é XML bem-formado
+                return True, "XML bem-formado (schema XSD nao encontrado)"
+
+            if schema.validate(documento):
+                return True, "XML válido conforme schema"
+
+            erro = schema.error_log.last_error
+            local = f"linha {erro.line}" if erro.line else erro.path
+            return False, f"Erro de validacao contra schema: {erro.message} ({local})"
+
+        except Exception as e:
+            return False, f"Erro ao validar XML: {str(e)}"
+
+
+# Validador partilhado (schema compilado uma vez por thread)
+validador_xsd = ValidadorXSD()
+
+
+def preencher_pais(pais: etree._Element, dado: Dict):
+    """
+    Preenche um elemento <Pais> com os dados de um registo.
+    """
+    pais.set("IDInterno", dado.get("IDInterno", ""))
+    pais.set("Nome", dado.get("Nome", ""))
+
+    # Secção com dados de população
+    detalhes_pais = SubElement(pais, "DetalhesPais")
+
+    populacao_milhoes = SubElement(detalhes_pais, "PopulacaoMilhoes")
+    populacao_milhoes.text = str(dado.get("PopulacaoMilhoes", "0"))
+
+    populacao_total = SubElement(detalhes_pais, "PopulacaoTotal")
+    populacao_total.text = str(dado.get("PopulacaoTotal", "0"))
+
+    # Secção com dados geográficos e enriquecidos
+    dados_geograficos = SubElement(pais, "DadosGeograficos")
+
+    continente = SubElement(dados_geograficos, "Continente")
+    continente.text = dado.get("Continente", dado.get("Regiao", "Desconhecido"))
+
+    subregiao = SubElement(dados_geograficos, "Subregiao")
+    subregiao_val = dado.get("Subregiao", "N/A")
+    subregiao.text = str(subregiao_val) if subregiao_val and subregiao_val != "N/A" else "N/A"
+
+    capital = SubElement(dados_geograficos, "Capital")
+    capital_val = dado.get("Capital", "N/A")
+    capital.text = str(capital_val) if capital_val and capital_val != "N/A" else "N/A"
+
+    moeda = SubElement(dados_geograficos, "Moeda")
+    moeda_val = dado.get("Moeda", "N/A")
+    moeda.text = str(moeda_val) if moeda_val and moeda_val != "N/A" else "N/A"
+
+    densidade = SubElement(dados_geograficos, "DensidadePopulacao")
+    densidade_val = dado.get("DensidadePopulacao", 0)
+    densidade.text = str(densidade_val) if densidade_val and densidade_val != 0 else "0"
+
+    # Secção com indicadores calculados/guardados
+    historico = SubElement(pais, "HistoricoAPI")
+
+    media_30d = SubElement(historico, "Media30d")
+    media_30d.text = str(dado.get("Media30d", "0"))
+
+    maximo_6m = SubElement(historico, "Maximo6m")
+    maximo_6m.text = str(dado.get("Maximo6m", "0"))
+
+
+class ConstrutorXML:
+    """
+    Constrói o documento XML de forma incremental: os registos podem ser
+    adicionados em vários lotes, à medida que vão chegando.
     """
-    # Elemento raiz e atributos principais
-    root = Element("RelatorioConformidade")
-    root.set("DataGeracao", datetime.now().strftime("%Y-%m-%d"))
-    root.set("Versao", mapper_version)
 
-    # Metadados da execução
-    config = SubElement(root, "Configuracao")
-    config.set("ValidadoPor", f"XML_Service_{uuid.uuid4().hex[:8]}")
-    config.set("Requisitante", f"Processador_{id_requisicao[:8]}")
+    def __init__(self, mapper_version: str, id_requisicao: str):
+        # Elemento raiz e atributos principais
+        self.root = Element("RelatorioConformidade")
+        self.root.set("DataGeracao", datetime.now().strftime("%Y-%m-%d"))
+        self.root.set("Versao", mapper_version)
+
+        # Metadados da execução
+        config = SubElement(self.root, "Configuracao")
+        config.set("ValidadoPor", f"XML_Service_{uuid.uuid4().hex[:8]}")
+        config.set("Requisitante", f"Processador_{id_requisicao[:8]}")
+
+        # Nó que agrega todos os países
+        self.paises = SubElement(self.root, "Paises")
+        self.total = 0
+
+    def adicionar(self, dados: List[Dict]):
+        """
+        Acrescenta um bloco <Pais> por cada registo do lote.
+        """
+        for dado in dados:
+            preencher_pais(SubElement(self.paises, "Pais"), dado)
+            self.total += 1
+
+    def validar(self):
+        """
+        Valida a árvore em memória contra o XSD, sem a serializar.
+        """
+        return validador_xsd.validar(self.root)
 
-    # Nó que agrega todos os países
-    paises = SubElement(root, "Paises")
+    def concluir(self, pretty_print: bool = True) -> str:
+        """
+        Devolve o documento completo como string (só é preciso para persistir).
+        Sem pretty_print o XML fica compacto, sem espaços entre os elementos.
+        """
+        # Converte o XML para string (formatada ou compacta)
+        xml_string = etree.tostring(
+            self.root,
+            encoding='unicode',
+            pretty_print=pretty_print,
+            xml_declaration=False
+        )
+
+        # Adiciona o cabeçalho XML
+        xml_string = CABECALHO_XML + xml_string
+        return xml_string
+
+
+class ConstrutorXMLTemplate:
+    """
+    Alternativa ao ConstrutorXML usada com XML_SERIALIZADOR="template":
+    cada <Pais> é escrito logo como texto pelo template de xml_template,
+    sem criar elementos lxml. A validação é feita em blocos de
+    REGISTOS_POR_VALIDACAO registos à medida que são acrescentados (cada bloco
+    num documento pequeno com a mesma raiz), por isso o documento completo
+    nunca volta a ser lido pelo parser.
+    O formato (indentado ou compacto) é escolhido na criação.
+    """
 
-    # Cria um bloco <Pais> por cada registo
-    for dado in dados:
-        pais = SubElement(paises, "Pais")
-        pais.set("IDInterno", dado.get("IDInterno", ""))
-        pais.set("Nome", dado.get("Nome", ""))
+    def __init__(self, mapper_version: str, id_requisicao: str, pretty_print: bool = True,
+                 primeiro_registo: int = 1):
+        self.pretty_print = pretty_print
+        self.primeiro_registo = primeiro_registo
+        self._template = TEMPLATES_PAIS[pretty_print]
+        self._vazio, self._abertura, self._fecho = esqueleto_documento(mapper_version, id_requisicao, pretty_print)
+        self._validacao = (True, "")
 
-        # Secção com dados de população
-        detalhes_pais = SubElement(pais, "DetalhesPais")
+        # Texto de cada <Pais>, já com a indentação que o precede
+        self.paises: List[str] = []
+        self.total = 0
 
-        populacao_milhoes = SubElement(detalhes_pais, "PopulacaoMilhoes")
-        populacao_milhoes.text = str(dado.get("PopulacaoMilhoes", "0"))
+    def _validar_bloco(self, bloco: List[str]):
+        # A codificação lança a mesma exceção que o lxml no ConstrutorXML.adicionar
+        documento = "".join([self._abertura, *bloco, self._fecho]).encode("utf-8")
+        if not self._validacao[0]:
+            return
 
-        populacao_total = SubElement(detalhes_pais, "PopulacaoTotal")
-        populacao_total.text = str(dado.get("PopulacaoTotal", "0"))
+        valido, msg_validacao = validar_documento(documento)
+        if not valido:
+            primeiro = self.primeiro_registo + self.total
+            msg_validacao = f"{msg_validacao} [registos {primeiro}-{primeiro + len(bloco) - 1}]"
+        self._validacao = (valido, msg_validacao)
 
-        # Secção com dados geográficos e enriquecidos
-        dados_geograficos = SubElement(pais, "DadosGeograficos")
+    def adicionar(self, dados: Iterable[Dict]):
+        """
+        Acrescenta o texto de um <Pais> por cada registo do lote e valida-os.
+        """
+        registos = iter(dados)
+        while True:
+            bloco = [
+                renderizar_pais(dado, self._template)
+                for dado in itertools.islice(registos, REGISTOS_POR_VALIDACAO)
+            ]
+            if not bloco:
+                break
+            self._validar_bloco(bloco)
+            self.paises.extend(bloco)
+            self.total += len(bloco)
 
-        continente = SubElement(dados_geograficos, "Continente")
-        continente.text = dado.get("Continente", dado.get("Regiao", "Desconhecido"))
+    def validar(self):
+        """
+        Devolve o resultado da validação dos blocos (o primeiro erro, se houver).
+        """
+        if self.total == 0:
+            # Sem registos só há o esqueleto para validar
+            return validar_documento(self._vazio.encode("utf-8"))
+        return self._validacao
 
-        subregiao = SubElement(dados_geograficos, "Subregiao")
-        subregiao_val = dado.get("Subregiao", "N/A")
-        subregiao.text = str(subregiao_val) if subregiao_val and subregiao_val != "N/A" else "N/A"
+    def concluir(self, pretty_print: Optional[bool] = None) -> str:
+        """
+        Devolve o documento completo como string (igual ao de ConstrutorXML.concluir()).
+        """
+        if pretty_print is not None and pretty_print != self.pretty_print:
+            raise ValueError("O formato do XML e escolhido ao criar o ConstrutorXMLTemplate")
+        if self.total == 0:
+            return self._vazio
+        return "".join([self._abertura, *self.paises, self._fecho])
 
-        capital = SubElement(dados_geograficos, "Capital")
-        capital_val = dado.get("Capital", "N/A")
-        capital.text = str(capital_val) if capital_val and capital_val != "N/A" else "N/A"
 
-        moeda = SubElement(dados_geograficos, "Moeda")
-        moeda_val = dado.get("Moeda", "N/A")
-        moeda.text = str(moeda_val) if moeda_val and moeda_val != "N/A" else "N/A"
+def criar_construtor(mapper_version: str, id_requisicao: str, pretty_print: bool = True,
+                     serializador: str = XML_SERIALIZADOR):
+    """
+    Devolve o construtor do serializador configurado:
+    ConstrutorXMLTemplate ("template") ou ConstrutorXML ("lxml").
+    """
+    if serializador == "template":
+        return ConstrutorXMLTemplate(mapper_version, id_requisicao, pretty_print)
+    return ConstrutorXML(mapper_version, id_requisicao)
 
-        densidade = SubElement(dados_geograficos, "DensidadePopulacao")
-        densidade_val = dado.get("DensidadePopulacao", 0)
-        densidade.text = str(densidade_val) if densidade_val and densidade_val != 0 else "0"
 
-        # Secção com indicadores calculados/guardados
-        historico = SubElement(pais, "HistoricoAPI")
+def construir_fragmento(dados: List[Dict], pretty_print: bool = True, serializador: str = XML_SERIALIZADOR,
+                        primeiro_registo: int = 1):
+    """
+    Constrói e valida os <Pais> de uma parte (shard) dos registos.
+    Corre num processo do pool_xml. Devolve (valido, mensagem, fragmento),
+    em que o fragmento é o texto dos <Pais> (indentado ou compacto), pronto a juntar.
+    `primeiro_registo` é a posição do shard no pedido, usada nas mensagens de erro.
+    """
+    if serializador == "template":
+        construtor = ConstrutorXMLTemplate("1.0", "", pretty_print, primeiro_registo)
+        construtor.adicionar(dados)
+        valido, msg_validacao = construtor.validar()
+        if not valido:
+            return False, msg_validacao, ""
+        return True, msg_validacao, "".join(construtor.paises)
 
-        media_30d = SubElement(historico, "Media30d")
-        media_30d.text = str(dado.get("Media30d", "0"))
+    construtor = ConstrutorXML("1.0", "")
+    construtor.adicionar(dados)
 
-        maximo_6m = SubElement(historico, "Maximo6m")
-        maximo_6m.text = str(dado.get("Maximo6m", "0"))
+    valido, msg_validacao = construtor.validar()
+    if not valido:
+        # O caminho do erro é relativo ao shard: indica os registos em causa
+        fim = primeiro_registo + len(dados) - 1
+        return False, f"{msg_validacao} [registos {primeiro_registo}-{fim}]", ""
 
-    # Converte o XML para string formatada
-    xml_string = etree.tostring(
-        root,
-        encoding='unicode',
-        pretty_print=True,
-        xml_declaration=False
+    separador = ""
+    if pretty_print:
+        etree.indent(construtor.paises, space=INDENTACAO, level=1)
+        separador = "\n" + INDENTACAO * 2
+    fragmento = "".join(
+        separador + etree.tostring(pais, encoding="unicode", with_tail=False)
+        for pais in construtor.paises
     )
+    return True, msg_validacao, fragmento
 
-    # Adiciona o cabeçalho XML
-    xml_string = '<?xml version="1.0" encoding="UTF-8"?>\n' + xml_string
-    return xml_string
 
+def esqueleto_documento(mapper_version: str, id_requisicao: str, pretty_print: bool = True) -> Tuple[str, str, str]:
+    """
+    Devolve o documento sem registos e o texto antes e depois dos <Pais>.
+    """
+    # A raiz e a <Configuracao> são serializadas pelo lxml (escapes incluídos)
+    vazio = ConstrutorXML(mapper_version, id_requisicao).concluir(pretty_print)
+    inicio, fim = vazio.split("<Paises/>")
+    fecho = "\n" + INDENTACAO if pretty_print else ""
+    return vazio, inicio + "<Paises>", fecho + "</Paises>" + fim
 
-def validar_xml(xml_string: str):
+
+def juntar_fragmentos(fragmentos: List[str], mapper_version: str, id_requisicao: str,
+                      pretty_print: bool = True) -> str:
     """
-    Valida o XML: verifica sintaxe e valida contra o XSD (se existir).
+    Junta os fragmentos de construir_fragmento no documento completo.
+    O resultado é igual ao de ConstrutorXML.concluir() com os mesmos registos.
     """
-    try:
-        # Valida se o XML está bem-formado
-        xml_doc = etree.fromstring(xml_string.encode('utf-8'))
+    vazio, abertura, fecho = esqueleto_documento(mapper_version, id_requisicao, pretty_print)
+    if not fragmentos:
+        return vazio
+    return "".join([abertura, *fragmentos, fecho])
+
 
-        # Caminho do ficheiro XSD
-        schema_path = os.path.join(os.path.dirname(__file__), 'xml_schema.xsd')
+def formatar_xml(xml_string: str) -> str:
+    """
+    Devolve um XML (ex.: um documento guardado em formato compacto)
+    formatado com indentação, para ser lido por pessoas.
+    """
+    parser = etree.XMLParser(remove_blank_text=True)
+    root = etree.fromstring(xml_string.encode("utf-8"), parser)
+    return CABECALHO_XML + etree.tostring(root, encoding="unicode", pretty_print=True)
 
-        if os.path.exists(schema_path):
-            # Carrega o schema XSD
-            schema_doc = etree.parse(schema_path)
-            schema = XMLSchema(schema_doc)
 
-            # Valida o XML contra o schema
-            if schema.validate(xml_doc):
-                return True, "XML válido conforme schema"
+def escrever_xml(registos: Iterable[Dict], destino: Union[str, BinaryIO], mapper_version: str,
+                 id_requisicao: str, pretty_print: bool = True,
+                 serializador: str = XML_SERIALIZADOR) -> int:
+    """
+    Escreve o documento XML em streaming para um ficheiro ou para qualquer
+    objeto binário com write(), um <Pais> de cada vez: a árvore completa
+    nunca existe em memória, só o registo atual.
+    O serializador "lxml" usa etree.xmlfile; o "template" usa o template
+    pré-compilado de xml_template. Os dois dão o mesmo resultado.
+    Com pretty_print=True o resultado é igual, byte a byte, ao de ConstrutorXML.
+    Devolve o número de registos escritos.
+    """
+    if isinstance(destino, (str, os.PathLike)):
+        with open(destino, "wb") as ficheiro:
+            return escrever_xml(registos, ficheiro, mapper_version, id_requisicao, pretty_print, serializador)
+
+    relatorio = {"DataGeracao": datetime.now().strftime("%Y-%m-%d"), "Versao": mapper_version}
+    configuracao = {
+        "ValidadoPor": f"XML_Service_{uuid.uuid4().hex[:8]}",
+        "Requisitante": f"Processador_{id_requisicao[:8]}"
+    }
+
+    if serializador == "template":
+        destino.write(CABECALHO_XML.encode("utf-8"))
+        return escrever_relatorio(registos, destino, relatorio, configuracao, pretty_print)
+
+    # Espaços entre elementos (só com formatação)
+    def separador(nivel: int) -> str:
+        return "\n" + INDENTACAO * nivel if pretty_print else ""
+
+    # É preciso saber se há registos: sem nenhum, o lxml escreve <Paises/>
+    registos = iter(registos)
+    primeiro = next(registos, None)
+
+    config = Element("Configuracao", configuracao)
+
+    total = 0
+    destino.write(CABECALHO_XML.encode("utf-8"))
+    with etree.xmlfile(destino, encoding="UTF-8") as xf:
+        with xf.element("RelatorioConformidade", relatorio):
+            xf.write(separador(1))
+            xf.write(config)
+            xf.write(separador(1))
+
+            if primeiro is None:
+                xf.write(Element("Paises"))
             else:
-                erro = schema.error_log.last_error
-                return False, f"Erro de validacao contra schema: {erro.message} (linha {erro.line})"
-        else:
-            # Se não existir XSD, valida apenas a sintaxe do XML
-            return True, "XML bem-formado (schema XSD nao encontrado)"
+                with xf.element("Paises"):
+                    for dado in itertools.chain([primeiro], registos):
+                        pais = Element("Pais")
+                        preencher_pais(pais, dado)
+                        if pretty_print:
+                            etree.indent(pais, space=INDENTACAO, level=2)
+                        xf.write(separador(2))
+                        xf.write(pais)
+                        total += 1
+                    xf.write(separador(1))
+
+            xf.write(separador(0))
+
+    if pretty_print:
+        destino.write(b"\n")
+    return total
+
+
+def criar_xml(dados: List[Dict], mapper_version: str, id_requisicao: str, pretty_print: bool = True,
+              serializador: str = XML_SERIALIZADOR) -> str:
+    """
+    Cria um documento XML a partir dos dados processados.
+    Usa o escritor em streaming, por isso a árvore completa não chega a existir.
+    """
+    buffer = io.BytesIO()
+    escrever_xml(dados, buffer, mapper_version, id_requisicao, pretty_print, serializador)
+    return buffer.getvalue().decode("utf-8")
+
+
+def validar_xml(xml_string: str):
+    """
+    Valida um XML em texto: verifica sintaxe e valida contra o XSD (se existir).
+    """
+    try:
+        return validar_documento(xml_string.encode('utf-8'))
+    except Exception as e:
+        return False, f"Erro ao validar XML: {str(e)}"
+
 
+def validar_documento(documento: bytes):
+    """
+    Valida um XML já codificado em UTF-8 (sintaxe e XSD).
+    """
+    try:
+        # Valida se o XML está bem-formado
+        xml_doc = etree.fromstring(documento)
     except etree.XMLSyntaxError as e:
         return False, f"Erro de sintaxe XML: {str(e)}"
     except Exception as e:
         return False, f"Erro ao validar XML: {str(e)}"
+
+    return validador_xsd.validar(xml_doc)
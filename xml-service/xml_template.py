@@ -0,0 +1,175 @@
+"""
+Serializador rápido do relatório: cada <Pais> é escrito a partir de um
+template pré-compilado, sem criar elementos lxml.
+O resultado é igual, byte a byte, ao do escritor lxml (xml_builder.escrever_xml),
+incluindo o escape dos caracteres especiais e os erros para valores inválidos.
+"""
+import re
+from typing import BinaryIO, Dict, Iterable
+
+# Indentação usada na formatação (igual à do pretty_print do lxml)
+INDENTACAO = "  "
+
+# Número de registos juntos antes de cada escrita no destino
+REGISTOS_POR_ESCRITA = 1000
+
+# Caracteres que o lxml não aceita em XML (controlo, NUL, U+FFFE e U+FFFF)
+_INVALIDOS = "\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff"
+_RE_INVALIDOS = re.compile(f"[{_INVALIDOS}]")
+
+# Caracteres que obrigam a escapar (ou a rejeitar) o valor
+_RE_ESPECIAIS_TEXTO = re.compile(f"[&<>\r{_INVALIDOS}]")
+_RE_ESPECIAIS_ATRIBUTO = re.compile(f"[&<>\"\r\n\t{_INVALIDOS}]")
+
+# Escapes que o lxml aplica ao texto e aos atributos
+_ESCAPES_TEXTO = str.maketrans({"&": "&amp;", "<": "&lt;", ">": "&gt;", "\r": "&#13;"})
+_ESCAPES_ATRIBUTO = str.maketrans({
+    "&": "&amp;", "<": "&lt;", ">": "&gt;", '"': "&quot;",
+    "\r": "&#13;", "\n": "&#10;", "\t": "&#9;"
+})
+
+
+def _como_string(valor) -> str:
+    # O lxml só aceita str ou bytes ASCII como texto e atributos
+    if isinstance(valor, str):
+        return valor
+    if isinstance(valor, bytes):
+        return valor.decode("ascii")
+    raise TypeError(f"Argument must be bytes or unicode, got '{type(valor).__name__}'")
+
+
+def _verificar(valor: str):
+    if _RE_INVALIDOS.search(valor):
+        raise ValueError(
+            "All strings must be XML compatible: Unicode or ASCII, no NULL bytes or control characters"
+        )
+
+
+def escapar_texto(valor) -> str:
+    """
+    Escapa o texto de um elemento como o lxml.
+    """
+    valor = _como_string(valor)
+    if _RE_ESPECIAIS_TEXTO.search(valor) is None:
+        return valor
+    _verificar(valor)
+    return valor.translate(_ESCAPES_TEXTO)
+
+
+def escapar_atributo(valor) -> str:
+    """
+    Escapa o valor de um atributo como o lxml.
+    """
+    valor = _como_string(valor)
+    if _RE_ESPECIAIS_ATRIBUTO.search(valor) is None:
+        return valor
+    _verificar(valor)
+    return valor.translate(_ESCAPES_ATRIBUTO)
+
+
+def _opcional(valor) -> str:
+    # Campos em que "N/A" (ou vazio) substitui a ausência de valor
+    return str(valor) if valor and valor != "N/A" else "N/A"
+
+
+def compilar_template(pretty_print: bool = True) -> str:
+    """
+    Devolve o template de um <Pais> (com a indentação que o precede).
+    Cada %s é preenchido por renderizar_pais já com o valor escapado.
+    """
+    linhas = [
+        (2, '<Pais IDInterno="%s" Nome="%s">'),
+        (3, "<DetalhesPais>"),
+        (4, "<PopulacaoMilhoes>%s</PopulacaoMilhoes>"),
+        (4, "<PopulacaoTotal>%s</PopulacaoTotal>"),
+        (3, "</DetalhesPais>"),
+        (3, "<DadosGeograficos>"),
+        (4, "%s"),  # <Continente> (pode não ter texto)
+        (4, "<Subregiao>%s</Subregiao>"),
+        (4, "<Capital>%s</Capital>"),
+        (4, "<Moeda>%s</Moeda>"),
+        (4, "<DensidadePopulacao>%s</DensidadePopulacao>"),
+        (3, "</DadosGeograficos>"),
+        (3, "<HistoricoAPI>"),
+        (4, "<Media30d>%s</Media30d>"),
+        (4, "<Maximo6m>%s</Maximo6m>"),
+        (3, "</HistoricoAPI>"),
+        (2, "</Pais>"),
+    ]
+    if pretty_print:
+        return "".join("\n" + INDENTACAO * nivel + linha for nivel, linha in linhas)
+    return "".join(linha for _, linha in linhas)
+
+
+# Templates compilados uma vez (com e sem formatação)
+TEMPLATES_PAIS = {True: compilar_template(True), False: compilar_template(False)}
+
+
+def renderizar_pais(dado: Dict, template: str) -> str:
+    """
+    Escreve um <Pais> com os mesmos valores que xml_builder.preencher_pais.
+    """
+    continente = dado.get("Continente", dado.get("Regiao", "Desconhecido"))
+    if continente is None:
+        continente = "<Continente/>"
+    else:
+        continente = f"<Continente>{escapar_texto(continente)}</Continente>"
+
+    densidade = dado.get("DensidadePopulacao", 0)
+
+    return template % (
+        escapar_atributo(dado.get("IDInterno", "")),
+        escapar_atributo(dado.get("Nome", "")),
+        escapar_texto(str(dado.get("PopulacaoMilhoes", "0"))),
+        escapar_texto(str(dado.get("PopulacaoTotal", "0"))),
+        continente,
+        escapar_texto(_opcional(dado.get("Subregiao", "N/A"))),
+        escapar_texto(_opcional(dado.get("Capital", "N/A"))),
+        escapar_texto(_opcional(dado.get("Moeda", "N/A"))),
+        escapar_texto(str(densidade) if densidade and densidade != 0 else "0"),
+        escapar_texto(str(dado.get("Media30d", "0"))),
+        escapar_texto(str(dado.get("Maximo6m", "0"))),
+    )
+
+
+def _atributos(atributos: Dict) -> str:
+    return "".join(f' {nome}="{escapar_atributo(valor)}"' for nome, valor in atributos.items())
+
+
+def escrever_relatorio(registos: Iterable[Dict], destino: BinaryIO, relatorio: Dict,
+                       configuracao: Dict, pretty_print: bool = True) -> int:
+    """
+    Escreve o documento completo (sem o cabeçalho <?xml?>) para um objeto
+    binário com write(). Os atributos da raiz e da <Configuracao> são dados
+    por quem chama. Devolve o número de registos escritos.
+    """
+    quebra = "\n" if pretty_print else ""
+    indentacao = INDENTACAO if pretty_print else ""
+    template = TEMPLATES_PAIS[pretty_print]
+
+    inicio = (
+        f"<RelatorioConformidade{_atributos(relatorio)}>"
+        f"{quebra}{indentacao}<Configuracao{_atributos(configuracao)}/>"
+        f"{quebra}{indentacao}"
+    )
+
+    total = 0
+    partes = []
+    for dado in registos:
+        if total == 0:
+            partes.append(inicio + "<Paises>")
+        partes.append(renderizar_pais(dado, template))
+        total += 1
+
+        if len(partes) >= REGISTOS_POR_ESCRITA:
+            destino.write("".join(partes).encode("utf-8"))
+            partes = []
+
+    if total == 0:
+        partes.append(inicio + "<Paises/>")
+    else:
+        partes.append(f"{quebra}{indentacao}</Paises>")
+    partes.append(f"{quebra}</RelatorioConformidade>{quebra}")
+
+    destino.write("".join(partes).encode("utf-8"))
+    return total